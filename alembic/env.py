@@ -42,7 +42,10 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            # Backfill migrations commit in batches through autocommit blocks
+            transaction_per_migration=True,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,30 @@
+"""Widen order ids to 64 bits for snowflake ids
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        # SQLite integers are 64-bit already, and it has no ALTER COLUMN;
+        # the id must stay a plain INTEGER to keep autoincrementing
+        return
+    op.alter_column('order_items', 'order_id', type_=sa.BigInteger(), existing_type=sa.Integer(), existing_nullable=False)
+    op.alter_column('orders', 'id', type_=sa.BigInteger(), existing_type=sa.Integer(), existing_nullable=False)
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('ALTER SEQUENCE orders_id_seq AS bigint')
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        return
+    op.alter_column('orders', 'id', type_=sa.Integer(), existing_type=sa.BigInteger(), existing_nullable=False)
+    op.alter_column('order_items', 'order_id', type_=sa.Integer(), existing_type=sa.BigInteger(), existing_nullable=False)
@@ -0,0 +1,75 @@
+"""Store money as integer minor units
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 00:00:00.000000
+
+Backfills in batches, each in its own short transaction, so the tables are
+never locked for the length of a full rewrite. On PostgreSQL the NOT NULL
+constraint is proven through a NOT VALID check constraint first, which lets
+SET NOT NULL skip its table scan under the exclusive lock.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+# (table, old float column, new minor-units column)
+MONEY_COLUMNS = [
+    ('products', 'price', 'price_minor'),
+    ('orders', 'total_amount', 'total_amount_minor'),
+    ('order_items', 'price', 'price_minor'),
+]
+
+def _backfill(table: str, source: str, target: str, to_minor: bool) -> None:
+    if to_minor:
+        value = f"CAST(ROUND({source} * 100) AS BIGINT)"
+    else:
+        value = f"{source} / 100.0"
+    statement = sa.text(
+        f"UPDATE {table} SET {target} = {value} "
+        f"WHERE id IN (SELECT id FROM {table} WHERE {target} IS NULL AND {source} IS NOT NULL LIMIT :batch)"
+    )
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        while bind.execute(statement, {"batch": BATCH_SIZE}).rowcount:
+            pass
+
+def _set_not_null(table: str, column: str, type_) -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        constraint = f"ck_{table}_{column}_not_null"
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {constraint} CHECK ({column} IS NOT NULL) NOT VALID")
+        with op.get_context().autocommit_block():
+            op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {constraint}")
+        op.alter_column(table, column, existing_type=type_, nullable=False)
+        op.drop_constraint(constraint, table, type_='check')
+    else:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(column, existing_type=type_, nullable=False)
+
+def _drop_column(table: str, column: str) -> None:
+    with op.batch_alter_table(table) as batch_op:
+        batch_op.drop_column(column)
+
+def upgrade() -> None:
+    for table, old, new in MONEY_COLUMNS:
+        op.add_column(table, sa.Column(new, sa.BigInteger(), nullable=True))
+    for table, old, new in MONEY_COLUMNS:
+        _backfill(table, old, new, to_minor=True)
+    for table, old, new in MONEY_COLUMNS:
+        _set_not_null(table, new, sa.BigInteger())
+        _drop_column(table, old)
+
+def downgrade() -> None:
+    for table, old, new in MONEY_COLUMNS:
+        op.add_column(table, sa.Column(old, sa.Float(), nullable=True))
+    for table, old, new in MONEY_COLUMNS:
+        _backfill(table, new, old, to_minor=False)
+    for table, old, new in MONEY_COLUMNS:
+        _set_not_null(table, old, sa.Float())
+        _drop_column(table, new)
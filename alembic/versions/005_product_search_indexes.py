@@ -0,0 +1,67 @@
+"""Product search and sort indexes
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 00:00:00.000000
+
+(price_minor, id) and (name, id) back the keyset-paginated sorts. Name
+substring search gets a pg_trgm GIN index on PostgreSQL, built
+CONCURRENTLY so a large catalogue stays writable, and an FTS5 trigram
+index with sync triggers on SQLite.
+"""
+from alembic import op
+
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+SORT_INDEXES = [
+    ('ix_products_price_minor_id', ['price_minor', 'id']),
+    ('ix_products_name_id', ['name', 'id']),
+]
+
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    "name, content='products', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name); END",
+    # Index the rows that already exist
+    "INSERT INTO products_fts(products_fts) VALUES ('rebuild')",
+]
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        with op.get_context().autocommit_block():
+            for name, columns in SORT_INDEXES:
+                op.create_index(name, 'products', columns, postgresql_concurrently=True)
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_name_trgm "
+                "ON products USING gin (name gin_trgm_ops)"
+            )
+    else:
+        for name, columns in SORT_INDEXES:
+            op.create_index(name, 'products', columns)
+        if op.get_bind().dialect.name == 'sqlite':
+            for statement in SQLITE_FTS_DDL:
+                op.execute(statement)
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_products_name_trgm")
+            for name, _ in SORT_INDEXES:
+                op.drop_index(name, table_name='products', postgresql_concurrently=True)
+    else:
+        if op.get_bind().dialect.name == 'sqlite':
+            for trigger in ('products_fts_ai', 'products_fts_ad', 'products_fts_au'):
+                op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            op.execute("DROP TABLE IF EXISTS products_fts")
+        for name, _ in SORT_INDEXES:
+            op.drop_index(name, table_name='products')
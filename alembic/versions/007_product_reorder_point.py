@@ -0,0 +1,20 @@
+"""Per-product reorder point for low-stock alerts
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('products', sa.Column('reorder_point', sa.Integer(), nullable=True))
+
+def downgrade() -> None:
+    op.drop_column('products', 'reorder_point')
@@ -0,0 +1,41 @@
+"""Denormalised product -> orders index for order lookup by product
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('product_orders',
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('order_id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('price_minor', sa.BigInteger(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+        sa.PrimaryKeyConstraint('product_id', 'order_id')
+    )
+    op.create_index(
+        'ix_product_orders_product_created', 'product_orders', ['product_id', 'created_at', 'order_id'], unique=False
+    )
+    # Backfill from the orders on this database; sharded orders live on
+    # their shards and are not covered
+    op.execute(
+        "INSERT INTO product_orders (product_id, order_id, quantity, price_minor, created_at) "
+        "SELECT order_items.product_id, order_items.order_id, SUM(order_items.quantity), "
+        "MAX(order_items.price_minor), COALESCE(orders.created_at, CURRENT_TIMESTAMP) "
+        "FROM order_items JOIN orders ON orders.id = order_items.order_id "
+        "GROUP BY order_items.product_id, order_items.order_id, orders.created_at"
+    )
+
+def downgrade() -> None:
+    op.drop_index('ix_product_orders_product_created', table_name='product_orders')
+    op.drop_table('product_orders')
@@ -0,0 +1,33 @@
+"""Order status and status change history for cancellations
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('orders', sa.Column('status', sa.String(length=20), server_default='placed', nullable=False))
+    op.create_table('order_status_changes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('order_id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+        sa.Column('from_status', sa.String(length=20), nullable=False),
+        sa.Column('to_status', sa.String(length=20), nullable=False),
+        sa.Column('reason', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['order_id'], ['orders.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_order_status_changes_order_id'), 'order_status_changes', ['order_id'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_order_status_changes_order_id'), table_name='order_status_changes')
+    op.drop_table('order_status_changes')
+    op.drop_column('orders', 'status')
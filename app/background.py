@@ -0,0 +1,246 @@
+"""Background workers that run alongside the API process."""
+from typing import Optional
+import logging
+import threading
+import time
+from app import catalogue, crud, events
+from app.core.cache import TieredCache
+from app.database import SessionLocal, get_redis
+
+logger = logging.getLogger(__name__)
+
+class PeriodicWorker:
+    """Runs ``run_once`` every ``interval`` seconds on a daemon thread"""
+
+    name = "periodic-worker"
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        raise NotImplementedError
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("%s iteration failed", self.name)
+
+
+class ReservationExpirer(PeriodicWorker):
+    """Returns the stock of lapsed reservations in bounded batches"""
+
+    name = "reservation-expirer"
+
+    def __init__(self, interval: float, batch_size: int = 500, session_factory=SessionLocal):
+        super().__init__(interval)
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+
+    def run_once(self) -> int:
+        expired = 0
+        db = self.session_factory()
+        try:
+            # Keep going while full batches come back, one short transaction each
+            while not self._stop.is_set():
+                count = crud.reservation_crud.expire_stale(db, batch_size=self.batch_size)
+                expired += count
+                if count < self.batch_size:
+                    break
+        finally:
+            db.close()
+        if expired:
+            logger.info("Expired %d stale reservations", expired)
+        return expired
+
+
+class CatalogueRefresher(PeriodicWorker):
+    """Keeps this process's catalogue snapshot in step with the database.
+
+    Changed product ids arrive from writers in this process directly and
+    from the other workers over Redis pub/sub; each iteration re-reads just
+    those rows. Pub/sub drops messages while disconnected, so every
+    (re)subscription, and every ``rebuild_interval`` seconds regardless,
+    triggers a full reload. Without Redis only the periodic reload sees
+    other workers' writes.
+    """
+
+    name = "catalogue-refresher"
+
+    def __init__(
+        self,
+        snapshot: catalogue.CatalogueSnapshot,
+        interval: float,
+        rebuild_interval: float = 600.0,
+        session_factory=SessionLocal,
+        redis_factory=get_redis,
+    ):
+        super().__init__(interval)
+        self.snapshot = snapshot
+        self.rebuild_interval = rebuild_interval
+        self.session_factory = session_factory
+        self.redis_factory = redis_factory
+        self._pubsub = None
+        self._next_rebuild = 0.0
+
+    def stop(self, timeout: float = 5.0):
+        super().stop(timeout)
+        self._close_feed()
+
+    def run_once(self) -> int:
+        self._drain_feed()
+        if time.monotonic() >= self._next_rebuild:
+            self.snapshot.mark_changed(None)
+            self._next_rebuild = time.monotonic() + self.rebuild_interval
+        db = self.session_factory()
+        try:
+            return self.snapshot.refresh(db)
+        finally:
+            db.close()
+
+    def _drain_feed(self):
+        redis_client = self.redis_factory()
+        if redis_client is None:
+            return
+        try:
+            if self._pubsub is None:
+                pubsub = redis_client.pubsub()
+                pubsub.subscribe(catalogue.CHANGES_CHANNEL)
+                self._pubsub = pubsub
+                # Whatever was published before the subscription is lost
+                self.snapshot.mark_changed(None)
+            while True:
+                message = self._pubsub.get_message(timeout=0)
+                if message is None:
+                    break
+                if message["type"] != "message":
+                    continue
+                data = message["data"]
+                try:
+                    self.snapshot.mark_changed(catalogue.decode_change(
+                        data.decode() if isinstance(data, bytes) else data
+                    ))
+                except ValueError:
+                    self.snapshot.mark_changed(None)
+        except Exception as e:
+            logger.warning("Catalogue change feed unavailable, will resubscribe: %s", e)
+            self._close_feed()
+
+    def _close_feed(self):
+        if self._pubsub is not None:
+            try:
+                self._pubsub.close()
+            except Exception:
+                pass
+            self._pubsub = None
+
+
+class CacheEvictionListener(PeriodicWorker):
+    """Applies other workers' invalidations to this process's L1 of a ``TieredCache``.
+
+    Evicted ids arrive over Redis pub/sub on ``cache.channel``. Messages
+    published while this worker was not subscribed are lost, so every
+    (re)subscription empties the L1. Each iteration also replays the
+    cache's failed deletes, so they reach Redis and the other workers
+    soon after Redis is back, not just at this worker's next read.
+    """
+
+    name = "cache-eviction-listener"
+
+    def __init__(self, cache: TieredCache, interval: float, redis_factory=get_redis):
+        super().__init__(interval)
+        self.cache = cache
+        self.redis_factory = redis_factory
+        self._pubsub = None
+
+    def stop(self, timeout: float = 5.0):
+        super().stop(timeout)
+        self._close_feed()
+
+    def run_once(self) -> int:
+        self.cache.replay()
+        redis_client = self.redis_factory()
+        if redis_client is None:
+            return 0
+        evicted = 0
+        try:
+            if self._pubsub is None:
+                pubsub = redis_client.pubsub()
+                pubsub.subscribe(self.cache.channel)
+                self._pubsub = pubsub
+                self.cache.clear_local()
+            while True:
+                message = self._pubsub.get_message(timeout=0)
+                if message is None:
+                    break
+                if message["type"] != "message":
+                    continue
+                data = message["data"]
+                ids = (data.decode() if isinstance(data, bytes) else data).split(",")
+                self.cache.evict_local(ids)
+                evicted += len(ids)
+        except Exception as e:
+            logger.warning("%s eviction feed unavailable, will resubscribe: %s", self.cache.name, e)
+            self._close_feed()
+        return evicted
+
+    def _close_feed(self):
+        if self._pubsub is not None:
+            try:
+                self._pubsub.close()
+            except Exception:
+                pass
+            self._pubsub = None
+
+
+class OutboxRelay(PeriodicWorker):
+    """Publishes committed outbox events to Redis Streams (see app.events)"""
+
+    name = "outbox-relay"
+
+    def __init__(
+        self,
+        interval: float,
+        batch_size: int = 500,
+        maxlen: Optional[int] = None,
+        session_factory=SessionLocal,
+        redis_factory=get_redis,
+    ):
+        super().__init__(interval)
+        self.batch_size = batch_size
+        self.maxlen = maxlen
+        self.session_factory = session_factory
+        self.redis_factory = redis_factory
+
+    def run_once(self) -> int:
+        redis_client = self.redis_factory()
+        if redis_client is None:
+            # Events wait in the outbox until Redis is configured
+            return 0
+        published = 0
+        db = self.session_factory()
+        try:
+            while not self._stop.is_set():
+                count = events.publish_pending(db, redis_client, self.batch_size, self.maxlen)
+                published += count
+                if count < self.batch_size:
+                    break
+        finally:
+            db.close()
+        return published
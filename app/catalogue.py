@@ -0,0 +1,394 @@
+"""In-process, columnar snapshot of the product catalogue.
+
+Product reads vastly outnumber writes, so a worker can keep the whole
+catalogue in memory and serve plain listings and single-product reads
+without a database or Redis round trip. Products are stored column by
+column in ``array`` buffers sorted by id, with names packed into one
+UTF-8 blob, which costs about 54 bytes per product plus the name instead
+of the ~1 KB of an ORM instance (see ``benchmarks/catalogue.py``).
+
+Writers report the ids they touched (``notify_changed`` in this process,
+the ``CHANGES_CHANNEL`` pub/sub channel across workers) and
+``app.background.CatalogueRefresher`` re-reads just those rows. A full
+rebuild runs on start-up, when the feed may have lost messages, and
+periodically as a safety net.
+"""
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Set, Tuple
+import logging
+import threading
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app import models, serializers
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHANGES_CHANNEL = "catalogue:changes"
+ALL_PRODUCTS = "*"
+
+COLUMNS = (
+    models.Product.id,
+    models.Product.name,
+    models.Product.price_minor,
+    models.Product.stock,
+    models.Product.reserved,
+    models.Product.reorder_point,
+    models.Product.created_at,
+    models.Product.updated_at,
+)
+
+_NULL = -(2 ** 63)
+_NO_REORDER_POINT = -1
+_MICROSECOND = timedelta(microseconds=1)
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_LOAD_BATCH = 10_000
+_RELOAD_CHUNK = 500
+
+_snapshot_products = metrics.registry.gauge(
+    "catalogue_snapshot_products", "Products held by the in-process catalogue snapshot"
+)
+_snapshot_bytes = metrics.registry.gauge(
+    "catalogue_snapshot_bytes", "Buffer memory of the in-process catalogue snapshot"
+)
+_load_time = metrics.crud_db_duration.labels("catalogue.load")
+_refresh_time = metrics.crud_db_duration.labels("catalogue.refresh")
+
+
+def _reorder_point(row) -> int:
+    return _NO_REORDER_POINT if row.reorder_point is None else row.reorder_point
+
+
+class _Columns:
+    """One array per column, row ``i`` of every array is the same product"""
+
+    __slots__ = (
+        "ids", "price_minor", "stock", "reserved", "reorder_point", "created_at", "updated_at",
+        "name_start", "name_length", "names", "garbage", "tzinfo",
+    )
+
+    def __init__(self):
+        self.ids = array("q")
+        self.price_minor = array("q")
+        self.stock = array("i")
+        self.reserved = array("i")
+        self.reorder_point = array("i")  # _NO_REORDER_POINT for NULL
+        # Microseconds since the epoch, _NULL for NULL
+        self.created_at = array("q")
+        self.updated_at = array("q")
+        self.name_start = array("Q")
+        self.name_length = array("H")
+        self.names = bytearray()
+        self.garbage = 0  # blob bytes no longer referenced by any row
+        # Timestamps come back in the zone the driver returned them in, so
+        # snapshot responses match database ones byte for byte
+        self.tzinfo = None
+
+    def _micros(self, value: Optional[datetime]) -> int:
+        if value is None:
+            return _NULL
+        if value.tzinfo is None:
+            return (value - _EPOCH) // _MICROSECOND
+        self.tzinfo = value.tzinfo
+        return (value - _EPOCH_UTC) // _MICROSECOND
+
+    def datetime(self, micros: int) -> Optional[datetime]:
+        if micros == _NULL:
+            return None
+        if self.tzinfo is None:
+            return _EPOCH + timedelta(microseconds=micros)
+        return (_EPOCH_UTC + timedelta(microseconds=micros)).astimezone(self.tzinfo)
+
+    def _pack_name(self, name: str) -> Tuple[int, int]:
+        encoded = name.encode()
+        start = len(self.names)
+        self.names += encoded
+        return start, len(encoded)
+
+    def name(self, index: int) -> str:
+        start = self.name_start[index]
+        return self.names[start:start + self.name_length[index]].decode()
+
+    def append(self, row) -> None:
+        start, length = self._pack_name(row.name)
+        self.ids.append(row.id)
+        self.price_minor.append(row.price_minor)
+        self.stock.append(row.stock)
+        self.reserved.append(row.reserved or 0)
+        self.reorder_point.append(_reorder_point(row))
+        self.created_at.append(self._micros(row.created_at))
+        self.updated_at.append(self._micros(row.updated_at))
+        self.name_start.append(start)
+        self.name_length.append(length)
+
+    def insert(self, index: int, row) -> None:
+        start, length = self._pack_name(row.name)
+        self.ids.insert(index, row.id)
+        self.price_minor.insert(index, row.price_minor)
+        self.stock.insert(index, row.stock)
+        self.reserved.insert(index, row.reserved or 0)
+        self.reorder_point.insert(index, _reorder_point(row))
+        self.created_at.insert(index, self._micros(row.created_at))
+        self.updated_at.insert(index, self._micros(row.updated_at))
+        self.name_start.insert(index, start)
+        self.name_length.insert(index, length)
+
+    def update(self, index: int, row) -> None:
+        if row.name != self.name(index):
+            self.garbage += self.name_length[index]
+            self.name_start[index], self.name_length[index] = self._pack_name(row.name)
+        self.price_minor[index] = row.price_minor
+        self.stock[index] = row.stock
+        self.reserved[index] = row.reserved or 0
+        self.reorder_point[index] = _reorder_point(row)
+        self.created_at[index] = self._micros(row.created_at)
+        self.updated_at[index] = self._micros(row.updated_at)
+
+    def delete(self, index: int) -> None:
+        self.garbage += self.name_length[index]
+        for column in (self.ids, self.price_minor, self.stock, self.reserved, self.reorder_point,
+                       self.created_at, self.updated_at, self.name_start, self.name_length):
+            del column[index]
+
+    def compact_names(self) -> None:
+        """Rewrite the name blob without the bytes of renamed or deleted rows"""
+        names = bytearray()
+        for index in range(len(self.ids)):
+            start = self.name_start[index]
+            self.name_start[index] = len(names)
+            names += self.names[start:start + self.name_length[index]]
+        self.names = names
+        self.garbage = 0
+
+    def nbytes(self) -> int:
+        arrays = (self.ids, self.price_minor, self.stock, self.reserved, self.reorder_point,
+                  self.created_at, self.updated_at, self.name_start, self.name_length)
+        return sum(a.buffer_info()[1] * a.itemsize for a in arrays) + len(self.names)
+
+
+class _RowView:
+    """Attribute view of one snapshot row, so the serializer extractors work on it.
+
+    Columns are only decoded when the extractor reads them, so a sparse
+    fieldset never pays for the name or the timestamps.
+    """
+
+    __slots__ = ("_columns", "_index")
+
+    def __init__(self, columns: _Columns, index: int = 0):
+        self._columns = columns
+        self._index = index
+
+    @property
+    def id(self) -> int:
+        return self._columns.ids[self._index]
+
+    @property
+    def name(self) -> str:
+        return self._columns.name(self._index)
+
+    @property
+    def price_minor(self) -> int:
+        return self._columns.price_minor[self._index]
+
+    @property
+    def stock(self) -> int:
+        return self._columns.stock[self._index]
+
+    @property
+    def reserved(self) -> int:
+        return self._columns.reserved[self._index]
+
+    @property
+    def reorder_point(self) -> Optional[int]:
+        value = self._columns.reorder_point[self._index]
+        return None if value == _NO_REORDER_POINT else value
+
+    @property
+    def created_at(self) -> Optional[datetime]:
+        return self._columns.datetime(self._columns.created_at[self._index])
+
+    @property
+    def updated_at(self) -> Optional[datetime]:
+        return self._columns.datetime(self._columns.updated_at[self._index])
+
+
+class CatalogueSnapshot:
+    """All products of the catalogue, in id order, kept in process memory.
+
+    Reads and incremental updates share one lock; a full rebuild is built
+    off to the side and swapped in. Catalogues larger than ``max_products``
+    are not loaded at all, and reads keep going to the database.
+    """
+
+    def __init__(self, max_products: int = 2_000_000):
+        self.max_products = max_products
+        self._columns: Optional[_Columns] = None
+        self._lock = threading.Lock()
+        self._changed: Set[int] = set()
+        self._reload_all = False
+        self._changes_lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._columns is not None
+
+    def __len__(self) -> int:
+        columns = self._columns
+        return len(columns.ids) if columns is not None else 0
+
+    def memory_bytes(self) -> int:
+        columns = self._columns
+        return columns.nbytes() if columns is not None else 0
+
+    # Reads
+
+    def page(
+        self, skip: int, limit: int, fields: Tuple[str, ...] = serializers.PRODUCT_FIELDS
+    ) -> Optional[List[dict]]:
+        """``ProductCRUD.get_multi_json`` rows before encoding, None if not loaded"""
+        extract = serializers.product_extractor(fields)
+        with self._lock:
+            columns = self._columns
+            if columns is None:
+                return None
+            view = _RowView(columns)
+            rows = []
+            for index in range(max(skip, 0), min(max(skip, 0) + max(limit, 0), len(columns.ids))):
+                view._index = index
+                rows.append(extract(view))
+        return rows
+
+    def get(self, product_id: int, fields: Tuple[str, ...] = serializers.PRODUCT_FIELDS) -> Optional[dict]:
+        extract = serializers.product_extractor(fields)
+        with self._lock:
+            columns = self._columns
+            if columns is None:
+                return None
+            index = bisect_left(columns.ids, product_id)
+            if index == len(columns.ids) or columns.ids[index] != product_id:
+                return None
+            return extract(_RowView(columns, index))
+
+    # Updates
+
+    def load(self, rows: Iterable) -> bool:
+        """Replace the snapshot with ``rows`` (sorted by id)"""
+        columns = _Columns()
+        for row in rows:
+            if len(columns.ids) >= self.max_products:
+                logger.warning(
+                    "Catalogue has more than %d products; serving product reads from the database",
+                    self.max_products,
+                )
+                self._columns = None
+                self._publish_size()
+                return False
+            columns.append(row)
+        with self._lock:
+            self._columns = columns
+        self._publish_size()
+        return True
+
+    def apply(self, rows: Iterable, deleted_ids: Iterable[int] = ()) -> None:
+        """Upsert ``rows`` and drop ``deleted_ids``"""
+        with self._lock:
+            columns = self._columns
+            if columns is None:
+                return
+            for row in rows:
+                index = bisect_left(columns.ids, row.id)
+                if index < len(columns.ids) and columns.ids[index] == row.id:
+                    columns.update(index, row)
+                else:
+                    # New ids are almost always the largest, so this appends
+                    columns.insert(index, row)
+            for product_id in deleted_ids:
+                index = bisect_left(columns.ids, product_id)
+                if index < len(columns.ids) and columns.ids[index] == product_id:
+                    columns.delete(index)
+            if columns.garbage > len(columns.names) // 2:
+                columns.compact_names()
+        self._publish_size()
+
+    def mark_changed(self, product_ids: Optional[Iterable[int]] = None) -> None:
+        """Queue products for re-reading; ``None`` queues a full rebuild"""
+        with self._changes_lock:
+            if product_ids is None:
+                self._reload_all = True
+            else:
+                self._changed.update(product_ids)
+
+    def take_changes(self) -> Tuple[bool, Set[int]]:
+        with self._changes_lock:
+            reload_all, changed = self._reload_all, self._changed
+            self._reload_all, self._changed = False, set()
+        return reload_all, changed
+
+    def load_from(self, db: Session) -> bool:
+        with _load_time.time():
+            result = db.execute(
+                select(*COLUMNS).order_by(models.Product.id).execution_options(yield_per=_LOAD_BATCH)
+            )
+            try:
+                return self.load(result)
+            finally:
+                result.close()
+
+    def refresh(self, db: Session) -> int:
+        """Apply queued changes from the database; returns the rows re-read"""
+        reload_all, changed = self.take_changes()
+        if reload_all or not self.ready:
+            self.load_from(db)
+            return len(self)
+        if not changed:
+            return 0
+        with _refresh_time.time():
+            ids = sorted(changed)
+            for offset in range(0, len(ids), _RELOAD_CHUNK):
+                chunk = ids[offset:offset + _RELOAD_CHUNK]
+                rows = db.execute(select(*COLUMNS).where(models.Product.id.in_(chunk))).all()
+                found = {row.id for row in rows}
+                self.apply(rows, [product_id for product_id in chunk if product_id not in found])
+        return len(ids)
+
+    def _publish_size(self) -> None:
+        _snapshot_products.set(len(self))
+        _snapshot_bytes.set(self.memory_bytes())
+
+
+_snapshot: Optional[CatalogueSnapshot] = None
+_snapshot_lock = threading.Lock()
+
+def get_snapshot() -> Optional[CatalogueSnapshot]:
+    """The process's snapshot, or None when the feature is disabled"""
+    global _snapshot
+    if _snapshot is None and settings.catalogue_snapshot_enabled:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = CatalogueSnapshot(settings.catalogue_snapshot_max_products)
+    return _snapshot
+
+def get_catalogue() -> Optional[CatalogueSnapshot]:
+    """The snapshot if it can serve reads right now"""
+    snapshot = get_snapshot()
+    return snapshot if snapshot is not None and snapshot.ready else None
+
+def notify_changed(product_ids: Optional[Iterable[int]] = None) -> None:
+    """Tell this process's snapshot that products changed; ``None`` means unknown"""
+    if _snapshot is not None:
+        _snapshot.mark_changed(product_ids)
+
+def encode_change(product_ids: Optional[Iterable[int]]) -> str:
+    if product_ids is None:
+        return ALL_PRODUCTS
+    return ",".join(str(product_id) for product_id in product_ids)
+
+def decode_change(message: str) -> Optional[List[int]]:
+    if message == ALL_PRODUCTS:
+        return None
+    return [int(product_id) for product_id in message.split(",")]
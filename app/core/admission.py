@@ -0,0 +1,201 @@
+"""Admission control for the checkout path.
+
+Two independent guards:
+
+* ``CheckoutLane`` runs checkouts on their own bounded set of worker
+  threads. At most ``concurrency`` run at once, a bounded number wait
+  briefly for a slot, and everything beyond that is shed immediately.
+  FastAPI's default threadpool, which serves the read endpoints, is never
+  used by checkouts, so a flash sale cannot starve product reads.
+* ``RateLimiter`` is a token bucket per client. The bucket lives in Redis
+  (one Lua call per check, so all workers share it) and falls back to an
+  in-process bucket while Redis is unavailable.
+"""
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+import logging
+import threading
+import time
+import anyio
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+admission_rejections = metrics.registry.counter(
+    "admission_rejections",
+    "Requests turned away by admission control",
+    ("lane", "reason"),
+)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Overloaded(AdmissionRejected):
+    """The lane is full; the client should back off and retry"""
+
+
+class RateLimited(AdmissionRejected):
+    """The client spent its token bucket"""
+
+
+class CheckoutLane:
+    """Bounded worker-thread lane with a short, bounded wait for a slot"""
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, queue_timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._waiting = 0
+        self._lock = threading.Lock()
+        # anyio primitives must be created inside a running event loop
+        self._slots = None
+        self._threads = None
+        self._shed_full = admission_rejections.labels(name, "queue_full")
+        self._shed_timeout = admission_rejections.labels(name, "queue_timeout")
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def _primitives(self):
+        if self._slots is None:
+            with self._lock:
+                if self._slots is None:
+                    # Checkouts hold at most ``concurrency`` threads (the slots
+                    # see to that); the rest serve the checkout path's own
+                    # dependencies, so a full lane never delays a 429
+                    self._threads = anyio.CapacityLimiter(2 * self.concurrency)
+                    self._slots = anyio.Semaphore(self.concurrency)
+        return self._slots, self._threads
+
+    async def offload(self, func: Callable, *args):
+        """Run ``func(*args)`` on the lane's threads without taking a slot.
+
+        For the blocking work around a checkout, such as rate limiting or
+        reading back a combined order, that must stay off the default
+        threadpool too
+        """
+        _, threads = self._primitives()
+        return await anyio.to_thread.run_sync(func, *args, limiter=threads)
+
+    async def run(self, func: Callable, *args):
+        """Run ``func(*args)`` on the lane's threads or raise ``Overloaded``"""
+        slots, threads = self._primitives()
+        with self._lock:
+            if slots.value == 0 and self._waiting >= self.queue_size:
+                self._shed_full.inc()
+                raise Overloaded(f"{self.name} is at capacity", self.queue_timeout)
+            self._waiting += 1
+        try:
+            with anyio.fail_after(self.queue_timeout):
+                await slots.acquire()
+        except TimeoutError:
+            self._shed_timeout.inc()
+            raise Overloaded(f"{self.name} is at capacity", self.queue_timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        try:
+            # Admission already bounds concurrency; this limiter only keeps the
+            # calls off the default threadpool's
+            return await anyio.to_thread.run_sync(func, *args, limiter=threads)
+        finally:
+            slots.release()
+
+
+# KEYS[1] bucket; ARGV rate (tokens/s), burst, now (s), cost.
+# Returns {allowed, seconds until enough tokens} (floats as strings: Lua
+# numbers are truncated to integers on the way out).
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class LocalTokenBucket:
+    """In-process token buckets, used while Redis is unreachable.
+
+    Per worker rather than shared, so the effective limit is multiplied by
+    the worker count until Redis is back.
+    """
+
+    _MAX_TRACKED_CLIENTS = 10000
+
+    def __init__(self):
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + max(0.0, now - ts) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self._MAX_TRACKED_CLIENTS:
+                # Least recently seen first; a forgotten client starts full again
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+
+class RateLimiter:
+    """Token bucket per key, shared through Redis when available"""
+
+    def __init__(self, name: str, redis_factory: Callable[[], Optional[object]], prefix: str = "ratelimit"):
+        self.name = name
+        self.redis_factory = redis_factory
+        self.prefix = prefix
+        self.local = LocalTokenBucket()
+        self._scripts: Dict[int, object] = {}
+        self._rejected = admission_rejections.labels(name, "rate_limited")
+
+    def _script(self, redis_client):
+        # register_script caches the SHA and falls back to EVAL on NOSCRIPT
+        script = self._scripts.get(id(redis_client))
+        if script is None:
+            script = self._scripts[id(redis_client)] = redis_client.register_script(_TOKEN_BUCKET_LUA)
+        return script
+
+    def check(self, key: str, rate: float, burst: float, cost: float = 1.0) -> None:
+        """Take ``cost`` tokens from ``key``'s bucket or raise ``RateLimited``"""
+        allowed, retry_after = self._take(key, rate, burst, cost)
+        if not allowed:
+            self._rejected.inc()
+            raise RateLimited("Rate limit exceeded", retry_after)
+
+    def _take(self, key: str, rate: float, burst: float, cost: float) -> Tuple[bool, float]:
+        redis_client = self.redis_factory()
+        if redis_client is not None:
+            try:
+                allowed, retry_after = self._script(redis_client)(
+                    keys=[f"{self.prefix}:{self.name}:{key}"], args=[rate, burst, time.time(), cost]
+                )
+                return bool(int(allowed)), float(retry_after)
+            except Exception as e:
+                logger.warning("Rate limiter falling back to the in-process bucket: %s", e)
+        return self.local.take(key, rate, burst, cost)
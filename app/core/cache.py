@@ -0,0 +1,509 @@
+"""Batched Redis cache for entities addressed by id.
+
+Every operation is one round trip however many keys it touches: MGET for
+reads, one pipeline of SETs (or one script, when the write is guarded by a
+version key) for writes, and UNLINK for deletes, which frees the memory
+off Redis's main thread. Round trips are counted per operation and per
+request (``app.core.metrics.count_round_trip``), so a page of N entities
+visibly costs the same as one.
+
+Values are encoded with msgpack when the optional ``msgpack`` package is
+installed and with JSON otherwise. Readers tell the two apart by the first
+byte, so workers with and without msgpack can share a cache.
+
+``TieredCache`` puts an in-process LRU (``LRUCache``) in front of a
+``BatchCache`` and adds tags, so one call can drop every entry that
+depends on something, and the same hit/miss/latency metrics for every
+entity it caches.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import functools
+import logging
+import struct
+import threading
+import time
+import orjson
+from redis.client import NEVER_DECODE
+from app.core import metrics
+from app.core.metrics import count_round_trip
+from app.core.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+# Datetimes: microseconds since the epoch (UTC for aware values) and the
+# UTC offset in seconds, _NAIVE for naive values. 15 bytes against 27 for
+# the ISO string, and the offset survives the round trip
+_DATETIME_EXT = 1
+_DATETIME = struct.Struct(">qi")
+_NAIVE = -(2 ** 31)
+_EPOCH = datetime(1970, 1, 1)
+
+# Values are read as bytes even from clients created with decode_responses
+_RAW = {NEVER_DECODE: True}
+
+# KEYS[1] version key, KEYS[2..] entries; ARGV[1] expected version, ARGV[2]
+# ttl (s), ARGV[3..] values. Writes nothing unless the version still
+# matches, so a value read before a concurrent change cannot be stored
+# after that change's invalidation ran.
+_SET_IF_VERSION_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+local ttl = tonumber(ARGV[2])
+for i = 2, #KEYS do
+    redis.call('SET', KEYS[i], ARGV[i + 1], 'EX', ttl)
+end
+return 1
+"""
+
+# KEYS: tag sets; ARGV[1] entry key prefix. Deletes every entry named in
+# the sets and the sets themselves, in one round trip however many there
+# are, and returns the ids it found so callers can drop them locally too
+_INVALIDATE_TAGS_LUA = """
+local found = {}
+for _, tag_key in ipairs(KEYS) do
+    for _, member in ipairs(redis.call('SMEMBERS', tag_key)) do
+        redis.call('UNLINK', ARGV[1] .. member)
+        found[#found + 1] = member
+    end
+    redis.call('UNLINK', tag_key)
+end
+if #found > 0 and ARGV[2] ~= '' then
+    redis.call('PUBLISH', ARGV[2], table.concat(found, ','))
+end
+return found
+"""
+
+
+def _msgpack_default(value):
+    if isinstance(value, datetime):
+        offset = value.utcoffset()
+        if offset is None:
+            micros, offset_seconds = (value - _EPOCH) // timedelta(microseconds=1), _NAIVE
+        else:
+            utc = value.replace(tzinfo=None) - offset
+            micros, offset_seconds = (utc - _EPOCH) // timedelta(microseconds=1), int(offset.total_seconds())
+        return msgpack.ExtType(_DATETIME_EXT, _DATETIME.pack(micros, offset_seconds))
+    raise TypeError(f"cannot encode {type(value).__name__}")
+
+def _msgpack_ext(code: int, data: bytes):
+    if code == _DATETIME_EXT:
+        micros, offset_seconds = _DATETIME.unpack(data)
+        value = _EPOCH + timedelta(microseconds=micros)
+        if offset_seconds == _NAIVE:
+            return value
+        tz = timezone(timedelta(seconds=offset_seconds))
+        return (value + timedelta(seconds=offset_seconds)).replace(tzinfo=tz)
+    return msgpack.ExtType(code, data)
+
+def encode(value: Any) -> bytes:
+    if msgpack is not None:
+        return msgpack.packb(value, default=_msgpack_default)
+    return dumps(value)
+
+def decode(data: bytes) -> Any:
+    """Decode either encoding; None if it needs msgpack and msgpack is missing"""
+    # JSON objects and arrays start with these; msgpack maps and arrays never do
+    if data[:1] in (b"{", b"["):
+        return orjson.loads(data)
+    if msgpack is None:
+        return None
+    return msgpack.unpackb(data, ext_hook=_msgpack_ext)
+
+def raw(value: bytes) -> bytes:
+    """Codec for values that are already encoded, e.g. finished response bodies"""
+    return value
+
+
+class BatchCache:
+    """Entities under ``<name>:<id>``, read and written many at a time.
+
+    ``redis_factory`` returning None (no Redis configured) turns every
+    operation into a miss or a no-op. Redis errors propagate: callers
+    decide whether a failed write or delete matters.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        redis_factory: Callable[[], Optional[object]],
+        ttl: int,
+        encoder: Callable[[Any], bytes] = encode,
+        decoder: Callable[[bytes], Any] = decode,
+    ):
+        self.name = name
+        self.redis_factory = redis_factory
+        self.ttl = ttl
+        self.encoder = encoder
+        self.decoder = decoder
+        self._scripts: Dict[int, object] = {}
+
+    def key(self, entity_id: Hashable) -> str:
+        return f"{self.name}:{entity_id}"
+
+    def get(self, entity_id: Hashable) -> Optional[Any]:
+        redis_client = self.redis_factory()
+        if redis_client is None:
+            return None
+        data = redis_client.execute_command("GET", self.key(entity_id), **_RAW)
+        count_round_trip(f"{self.name}.get")
+        return None if data is None else self.decoder(data)
+
+    def get_many(self, entity_ids: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """Cached entities by id; missing ones are left out"""
+        entity_ids = list(entity_ids)
+        redis_client = self.redis_factory()
+        if redis_client is None or not entity_ids:
+            return {}
+        values = redis_client.execute_command("MGET", *(self.key(i) for i in entity_ids), **_RAW)
+        count_round_trip(f"{self.name}.get_many")
+        found = {}
+        for entity_id, data in zip(entity_ids, values):
+            if data is not None:
+                value = self.decoder(data)
+                if value is not None:
+                    found[entity_id] = value
+        return found
+
+    def set_many(self, values: Dict[Hashable, Any], if_version: Optional[Tuple[str, str]] = None) -> bool:
+        """Store ``values`` for ``ttl`` seconds.
+
+        With ``if_version=(key, version)`` nothing is written unless ``key``
+        still holds ``version``, checked atomically with the write. Returns
+        whether the values were stored.
+        """
+        redis_client = self.redis_factory()
+        if redis_client is None or not values:
+            return False
+        keys = [self.key(i) for i in values]
+        encoded = [self.encoder(value) for value in values.values()]
+        if if_version is not None:
+            version_key, version = if_version
+            stored = self._script(redis_client)(
+                keys=[version_key, *keys], args=[version, self.ttl, *encoded]
+            )
+            count_round_trip(f"{self.name}.set_many")
+            return bool(stored)
+        pipe = redis_client.pipeline(transaction=False)
+        for key, data in zip(keys, encoded):
+            pipe.set(key, data, ex=self.ttl)
+        pipe.execute()
+        count_round_trip(f"{self.name}.set_many")
+        return True
+
+    def set(self, entity_id: Hashable, value: Any) -> None:
+        redis_client = self.redis_factory()
+        if redis_client is not None:
+            redis_client.set(self.key(entity_id), self.encoder(value), ex=self.ttl)
+            count_round_trip(f"{self.name}.set")
+
+    def delete_many(self, entity_ids: Iterable[Hashable], pipe=None) -> None:
+        """UNLINK the entries; queued on ``pipe`` instead when one is given"""
+        keys = [self.key(i) for i in entity_ids]
+        if not keys:
+            return
+        if pipe is not None:
+            pipe.unlink(*keys)
+            return
+        redis_client = self.redis_factory()
+        if redis_client is not None:
+            redis_client.unlink(*keys)
+            count_round_trip(f"{self.name}.delete")
+
+    def clear(self, batch_size: int = 1000) -> int:
+        """UNLINK every entry, one SCAN page at a time; for when the changed ids are unknown"""
+        redis_client = self.redis_factory()
+        if redis_client is None:
+            return 0
+        deleted, cursor = 0, 0
+        while True:
+            cursor, keys = redis_client.scan(cursor=cursor, match=f"{self.name}:*", count=batch_size)
+            count_round_trip(f"{self.name}.clear")
+            if keys:
+                deleted += redis_client.unlink(*keys)
+                count_round_trip(f"{self.name}.clear")
+            if cursor == 0:
+                return deleted
+
+    def _script(self, redis_client, source: str = _SET_IF_VERSION_LUA):
+        script = self._scripts.get((id(redis_client), source))
+        if script is None:
+            script = self._scripts[(id(redis_client), source)] = redis_client.register_script(source)
+        return script
+
+
+
+class LRUCache:
+    """Bounded in-process cache: least recently used entries go first, and
+    every entry expires ``ttl`` seconds after it was stored.
+
+    Thread-safe. Values are shared between callers, so they must not be
+    mutated after they are stored.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= self.clock():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Live entries, as a snapshot"""
+        now = self.clock()
+        with self._lock:
+            return [(key, value) for key, (expires, value) in self._entries.items() if expires > now]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TieredCache:
+    """An entity cache with two tiers: this process's ``LRUCache`` (L1)
+    and Redis (L2, a ``BatchCache``).
+
+    Reads try L1, then L2, and copy L2 hits into L1. Only values accepted
+    by ``local_if`` are kept in L1. It is meant for values that can no
+    longer change, while anything mutable lives in Redis alone. Set
+    ``local_entries=0`` to disable L1.
+
+    Entries may carry tags; ``invalidate_tags`` drops every entry with
+    any of the tags from Redis in one round trip. Invalidations also drop
+    the entries from this worker's L1, and are published on ``channel``
+    for the other workers' (``app.background.CacheEvictionListener``).
+
+    Redis errors are logged and treated as misses: the cache never fails
+    a read. An overwrite or invalidation that fails leaves the old entry
+    in Redis, so until its delete has been replayed the id is read from
+    the database, and the replay is tried again before every use.
+    Each tier's hits and misses are counted in ``cache_requests`` (caches
+    ``<name>.l1`` and ``<name>.l2``), and the time spent in Redis in
+    ``crud_cache_duration_seconds``.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        redis_factory: Callable[[], Optional[object]],
+        ttl: int,
+        local_entries: int = 1024,
+        local_ttl: float = 60.0,
+        local_if: Optional[Callable[[Any], bool]] = None,
+        encoder: Callable[[Any], bytes] = encode,
+        decoder: Callable[[bytes], Any] = decode,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.l2 = BatchCache(name, redis_factory, ttl, encoder, decoder)
+        self.l1 = LRUCache(local_entries, local_ttl, clock) if local_entries > 0 else None
+        self.local_if = local_if
+        self.channel = f"{name}:evicted"
+        # Ids whose overwrite or invalidation never reached Redis
+        self._unsynced: Set[str] = set()
+        self._unsynced_lock = threading.Lock()
+        self._l1_hits = metrics.cache_requests.labels(f"{name}.l1", "hit")
+        self._l1_misses = metrics.cache_requests.labels(f"{name}.l1", "miss")
+        self._l2_hits = metrics.cache_requests.labels(f"{name}.l2", "hit")
+        self._l2_misses = metrics.cache_requests.labels(f"{name}.l2", "miss")
+        self._get_time = metrics.crud_cache_duration.labels(f"{name}.get")
+        self._set_time = metrics.crud_cache_duration.labels(f"{name}.set")
+        self._invalidate_time = metrics.crud_cache_duration.labels(f"{name}.invalidate")
+
+    def tag_key(self, tag: str) -> str:
+        return f"{self.name}:tag:{tag}"
+
+    def get(self, entity_id: Hashable) -> Optional[Any]:
+        if self.l1 is not None:
+            entry = self.l1.get(str(entity_id))
+            if entry is not None:
+                self._l1_hits.inc()
+                return entry[0]
+            self._l1_misses.inc()
+        if not self.replay() and str(entity_id) in self._unsynced:
+            # Redis may still hold what the failed write meant to replace
+            self._l2_misses.inc()
+            return None
+        try:
+            with self._get_time.time():
+                value = self.l2.get(entity_id)
+        except Exception as e:
+            logger.warning("Cache read error for %s: %s", self.l2.key(entity_id), e)
+            value = None
+        if value is None:
+            self._l2_misses.inc()
+            return None
+        self._l2_hits.inc()
+        self._keep_local(entity_id, value)
+        return value
+
+    def set(self, entity_id: Hashable, value: Any, tags: Iterable[str] = (), only_new: bool = False) -> None:
+        """Store in Redis, and in L1 if ``local_if`` accepts it; one round trip with the tags.
+
+        With ``only_new`` an entry already in Redis is kept: read-through
+        fills use it, so a value read before a concurrent write cannot
+        replace the one that write stored.
+        """
+        tags = list(tags)
+        self._keep_local(entity_id, value, tags)
+        redis_client = self.l2.redis_factory()
+        if redis_client is None:
+            return
+        if only_new and not self.replay() and str(entity_id) in self._unsynced:
+            return
+        try:
+            with self._set_time.time():
+                pipe = redis_client.pipeline(transaction=False)
+                pipe.set(self.l2.key(entity_id), self.l2.encoder(value), ex=self.l2.ttl, nx=only_new)
+                for tag in tags:
+                    # A tag outlives every entry added under it
+                    pipe.sadd(self.tag_key(tag), str(entity_id))
+                    pipe.expire(self.tag_key(tag), self.l2.ttl)
+                pipe.execute()
+                count_round_trip(f"{self.name}.set")
+        except Exception as e:
+            logger.warning("Cache storage error for %s: %s", self.l2.key(entity_id), e)
+            if not only_new:
+                self._mark_unsynced([entity_id])
+            return
+        if not only_new:
+            with self._unsynced_lock:
+                self._unsynced.discard(str(entity_id))
+
+    def invalidate(self, entity_ids: Iterable[Hashable]) -> None:
+        entity_ids = list(entity_ids)
+        self.evict_local(entity_ids)
+        if not self._delete(entity_ids):
+            self._mark_unsynced(entity_ids)
+
+    def evict_local(self, entity_ids: Iterable[Hashable]) -> None:
+        """Drop entries from this worker's L1 only"""
+        if self.l1 is not None:
+            for entity_id in entity_ids:
+                self.l1.pop(str(entity_id))
+
+    def replay(self) -> bool:
+        """Retry the deletes that failed earlier; True once none are left"""
+        if not self._unsynced:
+            return True
+        with self._unsynced_lock:
+            pending = list(self._unsynced)
+        if not self._delete(pending):
+            return False
+        with self._unsynced_lock:
+            self._unsynced.difference_update(pending)
+        return not self._unsynced
+
+    def _delete(self, entity_ids: List[Hashable]) -> bool:
+        """UNLINK the entries and tell the other workers; False if Redis was not reached"""
+        redis_client = self.l2.redis_factory()
+        if redis_client is None or not entity_ids:
+            return True
+        try:
+            with self._invalidate_time.time():
+                pipe = redis_client.pipeline(transaction=False)
+                self.l2.delete_many(entity_ids, pipe=pipe)
+                if self.l1 is not None:
+                    pipe.publish(self.channel, ",".join(str(entity_id) for entity_id in entity_ids))
+                pipe.execute()
+                count_round_trip(f"{self.name}.delete")
+        except Exception as e:
+            logger.warning("Cache invalidation error for %s: %s", self.name, e)
+            return False
+        return True
+
+    def _mark_unsynced(self, entity_ids: Iterable[Hashable]) -> None:
+        with self._unsynced_lock:
+            self._unsynced.update(str(entity_id) for entity_id in entity_ids)
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        """Drop every entry stored with any of ``tags``; the number of entries found"""
+        tags = list(tags)
+        found = set()
+        if self.l1 is not None:
+            # L1 entries are (value, tags); it is bounded, so a scan is cheap
+            found.update(key for key, (_, entry_tags) in self.l1.items() if not entry_tags.isdisjoint(tags))
+        redis_client = self.l2.redis_factory()
+        if redis_client is not None and tags:
+            try:
+                with self._invalidate_time.time():
+                    members = self.l2._script(redis_client, _INVALIDATE_TAGS_LUA)(
+                        keys=[self.tag_key(tag) for tag in tags],
+                        args=[f"{self.name}:", self.channel if self.l1 is not None else ""],
+                    )
+                    count_round_trip(f"{self.name}.invalidate_tags")
+                found.update(m.decode() if isinstance(m, bytes) else m for m in members)
+            except Exception as e:
+                logger.warning("Cache invalidation error for %s tags: %s", self.name, e)
+        if self.l1 is not None:
+            for entity_id in found:
+                self.l1.pop(entity_id)
+        return len(found)
+
+    def clear_local(self) -> None:
+        """Empty this process's tier, e.g. when evictions may have been missed"""
+        if self.l1 is not None:
+            self.l1.clear()
+
+    def cached(
+        self,
+        key: Callable[..., Hashable],
+        tags: Optional[Callable[[Any], Iterable[str]]] = None,
+        fill_if: Optional[Callable[..., bool]] = None,
+    ):
+        """Decorator caching a read under ``key(*args, **kwargs)``.
+
+        ``tags(value)`` names the tags to store the result with. None
+        results (not found) are not cached, nor are misses for which
+        ``fill_if(*args, **kwargs)`` is false (e.g. read from a replica).
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                entity_id = key(*args, **kwargs)
+                value = self.get(entity_id)
+                if value is None:
+                    value = func(*args, **kwargs)
+                    if value is not None and (fill_if is None or fill_if(*args, **kwargs)):
+                        self.set(entity_id, value, tags(value) if tags else (), only_new=True)
+                return value
+            return wrapper
+        return decorator
+
+    def _keep_local(self, entity_id: Hashable, value: Any, tags: Iterable[str] = ()) -> None:
+        if self.l1 is None or (self.local_if is not None and not self.local_if(value)):
+            return
+        # Keyed by the id as text, like the members of the Redis tag sets
+        self.l1.set(str(entity_id), (value, frozenset(tags)))
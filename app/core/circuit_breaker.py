@@ -0,0 +1,176 @@
+"""Circuit breaker for the Redis cache client.
+
+Redis is an optimisation here, never the source of truth, so when it is
+slow or down requests should fall straight through to the database
+instead of each waiting out a socket timeout. ``GuardedRedis`` wraps the
+client: after ``failure_threshold`` consecutive connection errors or
+timeouts the circuit opens and every call fails immediately with
+``CircuitOpenError`` (a redis ``ConnectionError``, so existing
+``except`` blocks handle it). After ``reset_timeout`` seconds a single
+probe call is let through; success closes the circuit, failure opens it
+for another period.
+"""
+from typing import Callable, Optional
+import logging
+import threading
+import time
+from redis.commands.core import Script
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+circuit_state = metrics.registry.gauge(
+    "circuit_breaker_state", "0 closed, 1 open, 2 half-open", ("name",)
+)
+circuit_transitions = metrics.registry.counter(
+    "circuit_breaker_transitions", "State changes by new state", ("name", "state")
+)
+circuit_short_circuits = metrics.registry.counter(
+    "circuit_breaker_short_circuits", "Calls failed fast while the circuit was open", ("name",)
+)
+
+
+class CircuitOpenError(RedisConnectionError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 5.0,
+        failure_exceptions: tuple = (RedisConnectionError, RedisTimeoutError, OSError),
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_exceptions = failure_exceptions
+        self.clock = clock
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._state_gauge = circuit_state.labels(name)
+        self._short_circuits = circuit_short_circuits.labels(name)
+        self._state_gauge.set(0)
+
+    def _transition(self, state: str):
+        # Called with the lock held
+        if state == self.state:
+            return
+        self.state = state
+        self._state_gauge.set(_STATE_VALUES[state])
+        circuit_transitions.labels(self.name, state).inc()
+        if state == OPEN:
+            logger.warning("Circuit %s opened; bypassing for %.1fs", self.name, self.reset_timeout)
+        elif state == CLOSED:
+            logger.info("Circuit %s closed", self.name)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                # Exactly one caller probes; the rest keep failing fast
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+                self._transition(OPEN)
+
+    def call(self, func: Callable, *args, **kwargs):
+        if not self.allow():
+            self._short_circuits.inc()
+            raise CircuitOpenError(f"circuit {self.name} is open")
+        try:
+            result = func(*args, **kwargs)
+        except self.failure_exceptions:
+            self.record_failure()
+            raise
+        except Exception:
+            # Redis answered (e.g. a ResponseError): it is reachable
+            self.record_success()
+            raise
+        self.record_success()
+        return result
+
+
+class _GuardedPipeline:
+    """Commands are only buffered locally; ``execute`` is the round trip"""
+
+    def __init__(self, pipeline, breaker: CircuitBreaker):
+        self._pipeline = pipeline
+        self._breaker = breaker
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+    def execute(self, *args, **kwargs):
+        return self._breaker.call(self._pipeline.execute, *args, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._pipeline.reset()
+
+
+class GuardedRedis:
+    """Redis client whose commands go through a ``CircuitBreaker``"""
+
+    # Local helpers that never touch the network
+    _UNGUARDED = frozenset({"get_encoder", "get_connection_kwargs", "pubsub", "close"})
+
+    def __init__(self, client, breaker: Optional[CircuitBreaker] = None):
+        self._client = client
+        self.breaker = breaker or CircuitBreaker("redis")
+
+    @property
+    def client(self):
+        return self._client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name in self._UNGUARDED:
+            return attr
+
+        def guarded(*args, **kwargs):
+            return self.breaker.call(attr, *args, **kwargs)
+        return guarded
+
+    def pipeline(self, *args, **kwargs) -> _GuardedPipeline:
+        return _GuardedPipeline(self._client.pipeline(*args, **kwargs), self.breaker)
+
+    def register_script(self, script: str) -> Script:
+        # Bound to this wrapper, so EVALSHA goes through the breaker too
+        return Script(self, script)
+
+    def scan_iter(self, match=None, count=None, **kwargs):
+        # Guard each SCAN round trip, not the creation of the generator
+        cursor = 0
+        while True:
+            cursor, keys = self.scan(cursor=cursor, match=match, count=count, **kwargs)
+            yield from keys
+            if cursor == 0:
+                return
@@ -1,13 +1,108 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 import os
 
+def _split_list(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    return [item.strip() for item in value.split(",") if item.strip()]
+
 class Settings(BaseSettings):
     env: str = os.getenv("ENV", "dev")  # dev | test | prod
     database_url: str
     redis_url: Optional[str] = None
     debug: bool = False
 
+    # Redis is only a cache: bound every call, and bypass it entirely for a
+    # while after this many consecutive failures (app.core.circuit_breaker)
+    redis_socket_timeout: float = 0.25
+    redis_connect_timeout: float = 0.25
+    redis_breaker_failures: int = 5
+    redis_breaker_reset_seconds: float = 5.0
+
+    # Cache lifetimes per entity, in seconds. Orders are also kept in each
+    # worker's memory (app.core.cache.TieredCache) once they can no longer change
+    product_cache_ttl: int = 3600
+    product_list_cache_ttl: int = 300
+    order_cache_ttl: int = 86400
+    order_cache_local_entries: int = 10_000
+    order_cache_local_ttl: float = 300.0
+    cache_eviction_interval: float = 0.5  # how often other workers' evictions are applied to the L1
+
+    # Read replicas (comma-separated URLs); reads fall back to the primary
+    replica_urls: Optional[str] = None
+    replica_sticky_seconds: float = 5.0  # read-your-writes window after a write
+    replica_retry_seconds: float = 30.0  # how long a failed replica is skipped
+
+    # Optional sharded order store (comma-separated URLs, list position is the shard id)
+    order_shard_urls: Optional[str] = None
+    # Unique per process across every host writing to the shards; gunicorn.conf.py
+    # sets it per worker from SNOWFLAKE_WORKER_OFFSET. Sharding refuses to start without it
+    snowflake_worker_id: Optional[int] = None
+
+    # Stock reservations: how often lapsed holds are reclaimed, and how many per transaction
+    reservation_expiry_interval: float = 5.0
+    reservation_expiry_batch_size: int = 500
+
+    # Hot-SKU write combiner: batch concurrent single-product orders per product
+    stock_combiner_enabled: bool = False
+    stock_combiner_window_ms: float = 2.0
+    stock_combiner_max_batch: int = 200
+
+    # SQL profiler: slow-query log for every statement, per-request profile for a sample
+    sql_profiler_enabled: bool = False
+    sql_profiler_sample_rate: float = 0.01
+    slow_query_ms: float = 200.0
+
+    # Connections opened by the lifespan handler before the first request
+    db_pool_warmup: int = 2
+
+    # Total connections this deployment may hold open on the primary, split
+    # evenly between the worker processes; 0 keeps SQLAlchemy's pool defaults
+    db_max_connections: int = 0
+    db_pool_timeout: float = 10.0
+    web_concurrency: int = 1  # worker processes, exported by gunicorn.conf.py
+
+    # Admission control for POST /orders/ (app.core.admission). Checkouts
+    # run on their own threads, never on the read endpoints' threadpool
+    checkout_concurrency: int = 16  # checkouts running at once per worker
+    checkout_queue_size: int = 64  # beyond this many waiting, shed with 503 at once
+    checkout_queue_timeout: float = 2.0  # waiting longer than this is shed too
+    order_rate_limit: float = 0.0  # orders per second per client (token refill); 0 disables
+    order_rate_burst: int = 20
+    # Comma-separated X-API-Key values that get a bucket of their own; any
+    # other caller, whatever key it sends, shares its address's bucket
+    order_rate_api_keys: Optional[str] = None
+
+    # Responses smaller than this are sent uncompressed
+    compression_min_size: int = 1024
+
+    # In-process catalogue snapshot serving plain product reads (app.catalogue)
+    catalogue_snapshot_enabled: bool = False
+    catalogue_snapshot_refresh_interval: float = 0.5  # how often queued changes are re-read
+    catalogue_snapshot_rebuild_interval: float = 600.0  # full reload, in case a change was missed
+    catalogue_snapshot_max_products: int = 2_000_000  # larger catalogues stay in the database
+
+    # Order events: outbox rows relayed to a Redis Stream (app.events)
+    order_events_enabled: bool = False
+    stock_alerts_enabled: bool = False  # low-stock alerts, relayed the same way
+    outbox_relay_interval: float = 0.2
+    outbox_relay_batch_size: int = 500
+    order_stream_maxlen: int = 1_000_000  # entries kept for replay, approximately
+
+    @property
+    def replica_url_list(self) -> List[str]:
+        return _split_list(self.replica_urls)
+
+    @property
+    def order_shard_url_list(self) -> List[str]:
+        return _split_list(self.order_shard_urls)
+
+    @property
+    def order_rate_api_key_list(self) -> List[str]:
+        return _split_list(self.order_rate_api_keys)
+
     class Config:
         env_file = (
             ".env.dev" if os.getenv("ENV") == "dev"
@@ -15,4 +110,15 @@ class Settings(BaseSettings):
             else ".env.prod"
         )
 
-settings = Settings()
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
+
+class _LazySettings:
+    """Module-level ``settings`` that reads the environment on first attribute access"""
+
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+settings = _LazySettings()
+
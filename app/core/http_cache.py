@@ -0,0 +1,36 @@
+"""Conditional GET helpers: weak ETags and If-None-Match handling."""
+from hashlib import blake2b
+from typing import Optional
+from fastapi import Response
+
+# Clients may keep the body but must revalidate it on every use
+CACHE_CONTROL = "no-cache"
+
+def weak_etag(value: str) -> str:
+    # Weak, since compression changes the bytes but not the representation
+    return f'W/"{value}"'
+
+def body_etag(body: bytes) -> str:
+    return weak_etag(blake2b(body, digest_size=12).hexdigest())
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison as RFC 9110 requires for If-None-Match"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+def json_response(body: bytes, etag: str, headers: Optional[dict] = None) -> Response:
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL, **(headers or {})},
+    )
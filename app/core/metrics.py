@@ -0,0 +1,334 @@
+"""In-process metrics with Prometheus text exposition.
+
+A deliberately small subset of the Prometheus client model (counters,
+gauges and histograms with labels) so the hot path costs a dict lookup, a
+bisect and a locked add. Label children can be resolved once up front with
+``.labels(...)`` to skip even the lookup.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import threading
+import time
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        # Children keyed by the raw label values too, so hot callers passing
+        # e.g. an int status code skip the str() normalisation
+        self._lookup: Dict[tuple, "_Metric"] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> "_Metric":
+        child = self._lookup.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            key = tuple(str(v) for v in values)
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+                self._lookup[values] = child
+        return child
+
+    def _new_child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def collect(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        children = [((), self)] if not self.labelnames else sorted(self._children.items())
+        for values, child in children:
+            for suffix, extra, value in child._samples():
+                labels = _format_labels(self.labelnames, values, extra)
+                lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def _samples(self):
+        return [("_total", "", self.value)]
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation)
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def _samples(self):
+        return [("", "", self.value)]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> "_Timer":
+        """Context manager observing the duration of its block"""
+        return _Timer(self)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def _samples(self):
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            samples.append(("_bucket", f'le="{_format_value(bound)}"', cumulative))
+        samples.append(("_sum", "", self.sum))
+        samples.append(("_count", "", cumulative))
+        return samples
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # Re-registering returns the existing metric so module reloads are harmless
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ("method", "route", "status"),
+)
+crud_db_duration = registry.histogram(
+    "crud_db_duration_seconds",
+    "Time spent in the database per CRUD operation",
+    ("operation",),
+)
+crud_cache_duration = registry.histogram(
+    "crud_cache_duration_seconds",
+    "Time spent talking to the cache per CRUD operation",
+    ("operation",),
+)
+crud_serialization_duration = registry.histogram(
+    "crud_serialization_duration_seconds",
+    "Time spent encoding or decoding cached payloads per CRUD operation",
+    ("operation",),
+)
+cache_requests = registry.counter(
+    "cache_requests",
+    "Cache lookups by result",
+    ("cache", "result"),
+)
+cache_round_trips = registry.counter(
+    "cache_round_trips",
+    "Redis round trips by cache operation",
+    ("operation",),
+)
+cache_round_trips_per_request = registry.histogram(
+    "cache_round_trips_per_request",
+    "Redis round trips made while serving one request",
+    ("route",),
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 32),
+)
+lock_wait_duration = registry.histogram(
+    "db_lock_wait_seconds",
+    "Time spent acquiring row locks",
+    ("table",),
+)
+
+
+class RoundTrips:
+    """Redis round trips made by the current request"""
+    __slots__ = ("count",)
+
+    def __init__(self):
+        self.count = 0
+
+
+_request_round_trips: ContextVar[Optional[RoundTrips]] = ContextVar("cache_round_trips", default=None)
+
+def count_round_trip(operation: str) -> None:
+    cache_round_trips.labels(operation).inc()
+    current = _request_round_trips.get()
+    if current is not None:
+        current.count += 1
+
+@contextmanager
+def track_round_trips() -> Iterator[RoundTrips]:
+    """Count the round trips made inside the block (the middleware does this per request)"""
+    current = RoundTrips()
+    token = _request_round_trips.set(current)
+    try:
+        yield current
+    finally:
+        _request_round_trips.reset(token)
+
+
+def timed(histogram: Histogram):
+    """Decorator recording each call's duration into ``histogram``"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """Pure ASGI timing middleware, cheaper than BaseHTTPMiddleware"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+        # Mutated in place, so calls made on worker threads are counted too
+        round_trips = RoundTrips()
+        token = _request_round_trips.set(round_trips)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The route template keeps label cardinality bounded, unlike the raw path
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            http_request_duration.labels(
+                scope["method"], route_path, status_code
+            ).observe(time.perf_counter() - start)
+            cache_round_trips_per_request.labels(route_path).observe(round_trips.count)
+            _request_round_trips.reset(token)
@@ -0,0 +1,24 @@
+"""Money stored as integer minor units (cents).
+
+Prices and totals live in the database as integers and all order arithmetic
+is plain ``int`` multiply-and-add, so totals never drift. The API keeps its
+decimal ``float`` fields; values are converted only at the edges.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional, Union
+
+MINOR_UNITS = 100  # minor units per major unit (cents per dollar)
+_MINOR_EXPONENT = Decimal(1)
+
+def to_minor(amount: Union[float, int, str, Decimal]) -> int:
+    """Convert a decimal amount to minor units, rounding half up"""
+    if isinstance(amount, int):
+        return amount * MINOR_UNITS
+    # str() first so 0.1 means 0.1 and not its binary float approximation
+    return int((Decimal(str(amount)) * MINOR_UNITS).quantize(_MINOR_EXPONENT, ROUND_HALF_UP))
+
+def from_minor(minor: Optional[int]) -> Optional[float]:
+    """Convert minor units back to the decimal amount the API exposes"""
+    if minor is None:
+        return None
+    return minor / MINOR_UNITS
@@ -0,0 +1,144 @@
+"""Opt-in SQL profiler and slow-query log built on engine cursor events.
+
+When enabled, every statement is timed and statements slower than
+``slow_query_ms`` are logged with their bind parameters. A sampled subset
+of requests additionally collects a per-request profile (query count, total
+DB time and time per normalized statement fingerprint) which is returned in
+response headers.
+"""
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import json
+import logging
+import random
+import re
+import time
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_current_profile: ContextVar[Optional["QueryProfile"]] = ContextVar("query_profile", default=None)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    """Normalize a statement so executions that differ only in values group together"""
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _PLACEHOLDER_LIST.sub("(...)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+class QueryProfile:
+    __slots__ = ("count", "total_time", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        # fingerprint -> [executions, seconds]
+        self.statements: Dict[str, List] = {}
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.total_time += duration
+        entry = self.statements.get(statement)
+        if entry is None:
+            self.statements[statement] = [1, duration]
+        else:
+            entry[0] += 1
+            entry[1] += duration
+
+    def top(self, n: int = 5) -> List[Tuple[str, int, float]]:
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return [(statement, count, seconds) for statement, (count, seconds) in ranked[:n]]
+
+    def headers(self, breakdown: bool = False) -> List[Tuple[bytes, bytes]]:
+        total_ms = self.total_time * 1000
+        headers = [
+            (b"x-db-query-count", str(self.count).encode()),
+            (b"x-db-time-ms", f"{total_ms:.2f}".encode()),
+            (b"server-timing", f'db;dur={total_ms:.2f};desc="{self.count} queries"'.encode()),
+        ]
+        if breakdown:
+            payload = [
+                {"statement": statement, "count": count, "ms": round(seconds * 1000, 3)}
+                for statement, count, seconds in self.top()
+            ]
+            headers.append((b"x-db-query-profile", json.dumps(payload).encode()))
+        return headers
+
+
+class SQLProfiler:
+    def __init__(self, slow_query_ms: float = 200.0, sample_rate: float = 0.01):
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.sample_rate = sample_rate
+
+    def attach(self, engine):
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Per-execution context, so a failed statement leaves nothing behind
+        context._profiler_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context._profiler_start
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.record(fingerprint(statement), duration)
+        if duration >= self.slow_query_seconds:
+            logger.warning(
+                "Slow query (%.1f ms): %s parameters=%r",
+                duration * 1000, _WHITESPACE.sub(" ", statement), parameters
+            )
+
+    def should_sample(self) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+
+class QueryProfilerMiddleware:
+    """Profiles sampled requests and reports the result in response headers.
+
+    In ``debug`` mode, requests sent with ``X-Debug-Query-Profile: 1`` are
+    always profiled and also get the top statements as JSON. Otherwise the
+    header is ignored, so clients cannot skip sampling.
+    """
+
+    def __init__(self, app, profiler: SQLProfiler, debug: bool = False):
+        self.app = app
+        self.profiler = profiler
+        self.debug = debug
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        forced = self.debug and (b"x-debug-query-profile", b"1") in scope.get("headers", [])
+        if not forced and not self.profiler.should_sample():
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile()
+        token = _current_profile.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + profile.headers(
+                    breakdown=forced
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+
+
+def current_profile() -> Optional[QueryProfile]:
+    return _current_profile.get()
@@ -1,61 +1,315 @@
 # app/crud.py
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, desc, select, func
-from typing import List, Optional, Tuple
-from app import models, schemas
-from app.database import redis_client
-import json
-import time  # ✅ Import time module properly
-from datetime import datetime  # ✅ Import datetime separately
+from sqlalchemy import and_, case, column, desc, select, func, table, text, tuple_, update
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from app import catalogue, events, models, schemas, serializers
+from app.core import metrics
+from app.core.cache import BatchCache, TieredCache, raw
+from app.core.config import settings
+from app.core.metrics import count_round_trip, timed
+from app.core.money import to_minor
+from app.core.serialization import dumps
+from app.database import SessionLocal, get_redis, is_replica, lock_rows
+from app.stock_combiner import StockWriteCombiner
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import lru_cache
+import logging
+import orjson
+import threading
+import time
+from datetime import datetime, timedelta, timezone  # ✅ Import datetime separately
+
+logger = logging.getLogger(__name__)
+
+# Label children resolved once so the hot path skips the lookup
+_get_multi_db_time = metrics.crud_db_duration.labels("product.get_multi")
+_get_multi_cache_time = metrics.crud_cache_duration.labels("product.get_multi")
+_get_multi_serialization_time = metrics.crud_serialization_duration.labels("product.get_multi")
+_invalidate_cache_time = metrics.crud_cache_duration.labels("product.invalidate")
+_products_cache_hits = metrics.cache_requests.labels("products_list", "hit")
+_products_cache_misses = metrics.cache_requests.labels("products_list", "miss")
+_get_many_db_time = metrics.crud_db_duration.labels("product.get_many")
+_get_many_cache_time = metrics.crud_cache_duration.labels("product.get_many")
+_product_cache_hits = metrics.cache_requests.labels("product", "hit")
+_product_cache_misses = metrics.cache_requests.labels("product", "miss")
+_product_lock_wait_time = metrics.lock_wait_duration.labels("products")
+_catalogue_version_time = metrics.crud_cache_duration.labels("product.catalogue_version")
+
+_CATALOGUE_VERSION_KEY = "products_version"
+
+# The caches below take their lifetimes from settings, so like the order
+# store they are built on first use rather than at import
+
+# Finished list bodies, keyed by catalogue version: a change makes the
+# next read miss without deleting anything, and old pages just expire
+@lru_cache(maxsize=None)
+def product_pages() -> BatchCache:
+    return BatchCache("products_list_v4", get_redis, ttl=settings.product_list_cache_ttl, encoder=raw, decoder=raw)
+
+# Product dicts by id, deleted by id on change; pages of any search are
+# assembled from them with one MGET
+@lru_cache(maxsize=None)
+def product_entities() -> BatchCache:
+    return BatchCache("product_v1", get_redis, ttl=settings.product_cache_ttl)
+
+# Statuses an order never leaves
+FINAL_ORDER_STATUSES = frozenset({"cancelled"})
+
+# Order bodies by id. A placed order can still be cancelled, so it stays
+# in Redis alone, where the cancellation replaces it; a final one can be
+# kept in every worker's memory as well, and the rare invalidation of one
+# (app.sharding) reaches them through app.background.CacheEvictionListener
+@lru_cache(maxsize=None)
+def order_cache() -> TieredCache:
+    return TieredCache(
+        "order_v1",
+        get_redis,
+        ttl=settings.order_cache_ttl,
+        local_entries=settings.order_cache_local_entries,
+        local_ttl=settings.order_cache_local_ttl,
+        local_if=lambda order: order["status"] in FINAL_ORDER_STATUSES,
+    )
+
+_PRODUCT_SORTS = {
+    "id": models.Product.id,
+    "price": models.Product.price_minor,
+    "name": models.Product.name,
+}
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+_products_fts = table(models.PRODUCTS_FTS_TABLE, column("rowid"))
+
+def _fts_phrase(value: str) -> str:
+    # A quoted FTS5 phrase over trigrams is a case-insensitive substring match
+    return '"' + value.replace('"', '""') + '"'
+
+def _encode_cursor(value, last_id: int) -> str:
+    return urlsafe_b64encode(dumps([value, last_id])).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[object, int]:
+    try:
+        value, last_id = orjson.loads(urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return value, int(last_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def _version_seed() -> int:
+    return time.time_ns() // 1_000_000
+
+def record_product_orders(db: Session, order_id: int, order_items_data: Iterable[dict]) -> None:
+    """Add the order's ``product_orders`` rows, one per product, to ``db``'s transaction"""
+    lines: Dict[int, Tuple[int, int]] = {}
+    for item in order_items_data:
+        quantity, _ = lines.get(item["product_id"], (0, 0))
+        lines[item["product_id"]] = (quantity + item["quantity"], item["price_minor"])
+    db.add_all([
+        models.ProductOrder(product_id=product_id, order_id=order_id, quantity=quantity, price_minor=price_minor)
+        for product_id, (quantity, price_minor) in lines.items()
+    ])
 
 class ProductCRUD:
+    def __init__(self):
+        # Set while an invalidation could not reach Redis: the shared cache
+        # may hold pages this worker changed, so it is not read until the
+        # invalidation has been delivered
+        self._shared_cache_stale = False
+    
+    @timed(metrics.crud_db_duration.labels("product.get"))
     def get(self, db: Session, product_id: int) -> Optional[models.Product]:
         return db.query(models.Product).filter(models.Product.id == product_id).first()
     
     def get_multi(self, db: Session, skip: int = 0, limit: int = 100) -> List[models.Product]:
-        # Try to get from cache first
-        start = time.time()  # ✅ Now this works
-        print("start time to fetch data", start)
-        if redis_client:
-            cache_key = f"products_list_{skip}_{limit}"
-            cached = redis_client.get(cache_key)
+        """ORM instances for one page; the API serves ``get_multi_json`` instead"""
+        return db.query(models.Product).order_by(models.Product.id).offset(skip).limit(limit).all()
+    
+    def get_multi_json(
+        self,
+        db: Session,
+        skip: int = 0,
+        limit: int = 100,
+        fields: Tuple[str, ...] = serializers.PRODUCT_FIELDS,
+        version: Optional[str] = None
+    ) -> bytes:
+        """One page of products as the encoded response body.
+        
+        The cache holds the finished body, so a hit is returned as is with no
+        decoding or re-encoding. A miss reads a column projection (no ORM
+        instances, no identity map) of just the columns ``fields`` need and
+        encodes it with orjson. ``version`` is the ``catalogue_version()``
+        the caller already read, if any; pages are cached under it.
+        """
+        if version is None:
+            version = self.catalogue_version()
+        page_id = f"{version}_{skip}_{limit}"
+        if fields != serializers.PRODUCT_FIELDS:
+            # Sparse fieldsets are canonically ordered, so each has one key
+            page_id += "_" + ".".join(fields)
+        
+        # Without a version there is no Redis, or it may hold stale pages
+        if version is not None:
+            try:
+                with _get_multi_cache_time.time():
+                    cached = product_pages().get(page_id)
+            except Exception as e:
+                logger.warning("Cache read error for page %s: %s", page_id, e)
+                cached = None
             if cached:
-                try:
-                    products_data = json.loads(cached)
-                    end_time = time.time()
-                    print("Total duration if we read from redis cache", (end_time - start)*1000)
-                    return [models.Product(**data) for data in products_data]
-                except Exception as e:
-                    print(f"Cache deserialization error: {e}")
-                    pass
+                _products_cache_hits.inc()
+                return cached
+            _products_cache_misses.inc()
         
         # Order by ID ascending for consistent ordering
-        products = db.query(models.Product).order_by(models.Product.id).offset(skip).limit(limit).all()
-        end_time1 = time.time()
-        print("Total duration if we read from DB", (end_time1 - start)*1000)
-        
-        # Cache the results
-        if redis_client and products:
-            cache_key = f"products_list_{skip}_{limit}"
-            products_data = [
-                {
-                    "id": p.id,
-                    "name": p.name,
-                    "price": p.price,
-                    "stock": p.stock,
-                    "created_at": p.created_at.isoformat() if p.created_at else None,
-                    "updated_at": p.updated_at.isoformat() if p.updated_at else None
-                }
-                for p in products
-            ]
+        with _get_multi_db_time.time():
+            rows = db.execute(
+                select(*serializers.product_columns(fields))
+                .order_by(models.Product.id).offset(skip).limit(limit)
+            ).all()
+        
+        with _get_multi_serialization_time.time():
+            payload = dumps(serializers.product_list(rows, fields))
+        
+        # Cache the results; a replica's page may predate the version
+        if version is not None and rows and not is_replica(db):
+            try:
+                with _get_multi_cache_time.time():
+                    product_pages().set(page_id, payload)
+            except Exception as e:
+                logger.warning("Cache storage error for page %s: %s", page_id, e)
+        
+        return payload
+    
+    def get_many_dicts(self, db: Session, product_ids: List[int], version: Optional[str] = None) -> Dict[int, dict]:
+        """Full product dicts by id, from the entity cache where possible.
+        
+        One MGET for all of them, one query for the misses and one write to
+        cache those, however many ids are asked for. The write only happens
+        if the catalogue is still at ``version``, so rows read before a
+        concurrent change never outlive its invalidation. Unknown ids are
+        left out.
+        """
+        if version is None:
+            version = self.catalogue_version()
+        found: Dict[int, dict] = {}
+        if version is not None and product_ids:
             try:
-                redis_client.setex(cache_key, 300, json.dumps(products_data))  # 5 min cache
-                print(f"✅ Cached {len(products)} products with key: {cache_key}")
+                with _get_many_cache_time.time():
+                    found = product_entities().get_many(product_ids)
             except Exception as e:
-                print(f"Cache storage error: {e}")
+                logger.warning("Cache read error for products: %s", e)
+            _product_cache_hits.inc(len(found))
+            _product_cache_misses.inc(len(product_ids) - len(found))
+        
+        missing = [product_id for product_id in product_ids if product_id not in found]
+        if missing:
+            with _get_many_db_time.time():
+                rows = db.execute(
+                    select(*serializers.product_columns()).where(models.Product.id.in_(missing))
+                ).all()
+            loaded = {row.id: serializers.product_dict(row) for row in rows}
+            found.update(loaded)
+            if version is not None and loaded and not is_replica(db):
+                try:
+                    with _get_many_cache_time.time():
+                        product_entities().set_many(loaded, if_version=(_CATALOGUE_VERSION_KEY, version))
+                except Exception as e:
+                    logger.warning("Cache storage error for products: %s", e)
+        return found
+    
+    def get_json(self, db: Session, product_id: int, version: Optional[str] = None) -> Optional[bytes]:
+        """One product as the encoded response body, None if it does not exist"""
+        product = self.get_many_dicts(db, [product_id], version).get(product_id)
+        return None if product is None else dumps(product)
+    
+    @timed(metrics.crud_db_duration.labels("product.search"))
+    def search_json(
+        self,
+        db: Session,
+        search: schemas.ProductSearch,
+        skip: int = 0,
+        limit: int = 100,
+        fields: Tuple[str, ...] = serializers.PRODUCT_FIELDS,
+        version: Optional[str] = None
+    ) -> Tuple[bytes, Optional[str]]:
+        """Filtered, sorted page of products and the cursor of the next page.
+        
+        Every sort is backed by a (column, id) index and paginated by keyset,
+        so deep pages cost the same as the first. Search pages themselves are
+        not cached, their key space being unbounded: the query returns only
+        ids and the products come from the entity cache (``get_many_dicts``).
+        """
+        sort_column = _PRODUCT_SORTS[search.sort.lstrip("-")]
+        tiebreak = models.Product.id
+        descending = search.sort.startswith("-")
+        filters, fts_phrases = self._search_filters(db, search)
+        
+        query = select(models.Product.id)
+        if fts_phrases:
+            query = query.join(_products_fts, _products_fts.c.rowid == models.Product.id).where(
+                text(f"{models.PRODUCTS_FTS_TABLE} MATCH :phrase").bindparams(phrase=" AND ".join(fts_phrases))
+            )
+            if search.sort.lstrip("-") == "id":
+                # FTS5 yields matches in rowid order; sorting on its rowid
+                # lets SQLite stop after one page instead of sorting them all
+                sort_column = tiebreak = _products_fts.c.rowid
+        query = query.add_columns(sort_column.label("_sort_key"), tiebreak.label("_sort_id")).where(*filters)
+        
+        # Sorting by id needs no tiebreak; repeating the column in ORDER BY
+        # would also keep SQLite from streaming the FTS5 rowid order
+        order_columns = (sort_column,) if search.sort.lstrip("-") == "id" else (sort_column, tiebreak)
+        if search.cursor:
+            last_value, last_id = _decode_cursor(search.cursor)
+            last = (last_value, last_id)[:len(order_columns)]
+            keyset = tuple_(*order_columns) if len(order_columns) > 1 else sort_column
+            bound = last if len(order_columns) > 1 else last[0]
+            query = query.where(keyset < bound if descending else keyset > bound)
+        elif skip:
+            query = query.offset(skip)
+        query = query.order_by(*(c.desc() if descending else c for c in order_columns))
         
-        return products
+        rows = db.execute(query.limit(limit + 1)).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1]._sort_key, rows[-1]._sort_id)
+        
+        products = self.get_many_dicts(db, [row.id for row in rows], version)
+        # Deleted since the id query: skipped
+        page = [products[row.id] for row in rows if row.id in products]
+        if fields != serializers.PRODUCT_FIELDS:
+            page = [{name: product[name] for name in fields} for product in page]
+        return dumps(page), next_cursor
     
+    def _search_filters(self, db: Session, search: schemas.ProductSearch) -> Tuple[list, List[str]]:
+        """WHERE clauses, plus FTS5 phrases to match on SQLite"""
+        filters = []
+        fts_phrases = []
+        # The FTS5 trigram index needs at least one full trigram; shorter
+        # terms fall back to LIKE. On PostgreSQL the pg_trgm GIN index serves
+        # the ILIKE directly.
+        use_fts = db.get_bind().dialect.name == "sqlite"
+        if search.q:
+            if use_fts and len(search.q) >= 3:
+                fts_phrases.append(_fts_phrase(search.q))
+            else:
+                filters.append(models.Product.name.ilike(f"%{_escape_like(search.q)}%", escape="\\"))
+        if search.name_prefix:
+            filters.append(models.Product.name.ilike(f"{_escape_like(search.name_prefix)}%", escape="\\"))
+            if use_fts and len(search.name_prefix) >= 3:
+                # Indexed superset first; the LIKE above keeps only prefixes
+                fts_phrases.append(_fts_phrase(search.name_prefix))
+        if search.min_price is not None:
+            filters.append(models.Product.price_minor >= to_minor(search.min_price))
+        if search.max_price is not None:
+            filters.append(models.Product.price_minor <= to_minor(search.max_price))
+        if search.in_stock is not None:
+            available = models.Product.stock > models.Product.reserved
+            filters.append(available if search.in_stock else ~available)
+        return filters, fts_phrases
+    
+    @timed(metrics.crud_db_duration.labels("product.create"))
     def create(self, db: Session, product: schemas.ProductCreate) -> models.Product:
         db_product = models.Product(**product.model_dump())
         db.add(db_product)
@@ -63,10 +317,11 @@ class ProductCRUD:
         db.refresh(db_product)
         
         # Invalidate cache
-        self._invalidate_products_cache()
+        self._invalidate_products_cache([db_product.id])
         
         return db_product
     
+    @timed(metrics.crud_db_duration.labels("product.update"))
     def update(self, db: Session, product_id: int, product: schemas.ProductUpdate) -> Optional[models.Product]:
         db_product = self.get(db, product_id)
         if not db_product:
@@ -74,8 +329,11 @@ class ProductCRUD:
         
         # Only update fields that were actually provided (exclude_unset=True)
         update_data = product.model_dump(exclude_unset=True)
+        was_low = events.is_low_stock(db_product)
         for field, value in update_data.items():
             setattr(db_product, field, value)
+        # Cutting the stock or raising the reorder point can cross it too
+        events.record_stock_change(db, db_product, was_low)
         
         # Update the updated_at timestamp
         db_product.updated_at = func.now()
@@ -84,10 +342,11 @@ class ProductCRUD:
         db.refresh(db_product)
         
         # Invalidate cache
-        self._invalidate_products_cache()
+        self._invalidate_products_cache([product_id])
         
         return db_product
     
+    @timed(metrics.crud_db_duration.labels("product.delete"))
     def delete(self, db: Session, product_id: int) -> bool:
         db_product = self.get(db, product_id)
         if not db_product:
@@ -97,37 +356,159 @@ class ProductCRUD:
         db.commit()
         
         # Invalidate cache
-        self._invalidate_products_cache()
+        self._invalidate_products_cache([product_id])
         
         return True
     
+    @timed(metrics.crud_db_duration.labels("product.orders"))
+    def get_orders_page(
+        self, db: Session, product_id: int, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[Row], Optional[str]]:
+        """Orders containing the product, newest first, and the next page's cursor.
+        
+        A keyset walk of ``ix_product_orders_product_created``: every page
+        costs one index range scan, however many orders there are in total.
+        """
+        query = select(
+            models.ProductOrder.order_id,
+            models.ProductOrder.quantity,
+            models.ProductOrder.price_minor,
+            models.ProductOrder.created_at,
+        ).where(models.ProductOrder.product_id == product_id)
+        if cursor:
+            last_created_at, last_id = _decode_cursor(cursor)
+            try:
+                last_created_at = datetime.fromisoformat(last_created_at)
+            except (TypeError, ValueError) as e:
+                raise ValueError("Invalid cursor") from e
+            query = query.where(
+                tuple_(models.ProductOrder.created_at, models.ProductOrder.order_id) < (last_created_at, last_id)
+            )
+        rows = db.execute(query.order_by(
+            desc(models.ProductOrder.created_at), desc(models.ProductOrder.order_id)
+        ).limit(limit + 1)).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1].created_at.isoformat(), rows[-1].order_id)
+        return rows, next_cursor
+    
     def get_for_update(self, db: Session, product_id: int) -> Optional[models.Product]:
         """Get product with row-level lock for update"""
-        return db.query(models.Product).filter(
-            models.Product.id == product_id
-        ).with_for_update().first()
+        with _product_lock_wait_time.time():
+            lock_rows(db, models.Product.__table__, [product_id])
+            return db.query(models.Product).filter(
+                models.Product.id == product_id
+            ).with_for_update().first()
     
-    def _invalidate_products_cache(self):
-        if redis_client:
-            try:
-                # Delete all product list cache keys
-                deleted_count = 0
-                for key in redis_client.scan_iter(match="products_list_*"):
-                    redis_client.delete(key)
-                    deleted_count += 1
-                print(f"🗑️ Invalidated {deleted_count} cache keys")
-            except Exception as e:
-                print(f"Cache invalidation error: {e}")
+    def catalogue_version(self) -> Optional[str]:
+        """Counter bumped on every catalogue change, shared by all workers.
+        
+        Used as the catalogue ETag. ``None`` without Redis, in which case
+        callers fall back to hashing the response body.
+        """
+        redis_client = get_redis()
+        if not redis_client or not self._shared_cache_usable():
+            return None
+        try:
+            with _catalogue_version_time.time():
+                version = redis_client.get(_CATALOGUE_VERSION_KEY)
+                count_round_trip("product.catalogue_version")
+                if version is None:
+                    # Start from the clock, so a lost counter never repeats
+                    # an ETag a client may still hold
+                    pipe = redis_client.pipeline(transaction=False)
+                    pipe.set(_CATALOGUE_VERSION_KEY, _version_seed(), nx=True)
+                    pipe.get(_CATALOGUE_VERSION_KEY)
+                    version = pipe.execute()[1]
+                    count_round_trip("product.catalogue_version")
+            return version
+        except Exception as e:
+            logger.warning("Catalogue version read error: %s", e)
+            return None
+    
+    def _invalidate_products_cache(self, product_ids: Optional[Iterable[int]] = None):
+        """Drop cached products, bump the catalogue version and report the change.
+        
+        ``product_ids`` are the products whose rows changed (``None`` when
+        unknown); catalogue snapshots re-read just those.
+        """
+        if product_ids is not None:
+            product_ids = sorted(set(product_ids))
+        catalogue.notify_changed(product_ids)
+        self._flush_shared_cache(product_ids)
+    
+    def _flush_shared_cache(self, product_ids: Optional[List[int]]) -> bool:
+        """Apply an invalidation to Redis; False (and the cache marked stale) if it failed"""
+        redis_client = get_redis()
+        if not redis_client:
+            return True
+        try:
+            with _invalidate_cache_time.time():
+                # One round trip whatever changed. List pages are keyed by
+                # version, so bumping it retires them all; product entries
+                # go first, so nobody pairs the new version with a stale one
+                pipe = redis_client.pipeline(transaction=False)
+                if product_ids is not None:
+                    product_entities().delete_many(product_ids, pipe=pipe)
+                pipe.set(_CATALOGUE_VERSION_KEY, _version_seed(), nx=True)
+                pipe.incr(_CATALOGUE_VERSION_KEY)
+                if settings.catalogue_snapshot_enabled and product_ids != []:
+                    # Snapshots in the other workers listen on this channel
+                    pipe.publish(catalogue.CHANGES_CHANNEL, catalogue.encode_change(product_ids))
+                pipe.execute()
+                count_round_trip("product.invalidate")
+                if product_ids is None:
+                    # The writes guarded by the old version cannot land any more
+                    product_entities().clear()
+        except Exception as e:
+            logger.warning("Cache invalidation error: %s", e)
+            self._shared_cache_stale = True
+            return False
+        self._shared_cache_stale = False
+        return True
+    
+    def _shared_cache_usable(self) -> bool:
+        """Whether the Redis product cache may be read, retrying a lost invalidation first"""
+        if self._shared_cache_stale:
+            # The ids are gone by now; other workers' snapshots reload fully
+            self._flush_shared_cache(None)
+        return not self._shared_cache_stale
 
 class OrderCRUD:
+    def __init__(self, combiner: Optional[StockWriteCombiner] = None):
+        # Coalesces concurrent single-product orders for hot SKUs
+        self.combiner = combiner
+    
+    @timed(metrics.crud_db_duration.labels("order.get"))
     def get(self, db: Session, order_id: int) -> Optional[models.Order]:
         return db.query(models.Order).filter(models.Order.id == order_id).first()
     
+    def reads_primary(self, db: Session) -> bool:
+        """Whether orders read through ``db`` are current, and may be cached"""
+        return not is_replica(db)
+    
+    def get_dict(self, db: Session, order_id: int) -> Optional[dict]:
+        """The order as ``GET /orders/{id}`` returns it, from the order cache where possible"""
+        cache = order_cache()
+        order = cache.get(order_id)
+        if order is None:
+            db_order = self.get(db, order_id)
+            if db_order is None:
+                return None
+            order = serializers.order_dict(db_order)
+            # A replica may trail the primary: only primary reads fill the cache
+            if self.reads_primary(db):
+                cache.set(order_id, order, only_new=True)
+        return order
+    
+    @timed(metrics.crud_db_duration.labels("order.get_by_idempotency_key"))
     def get_by_idempotency_key(self, db: Session, idempotency_key: str) -> Optional[models.Order]:
         return db.query(models.Order).filter(
             models.Order.idempotency_key == idempotency_key
         ).first()
     
+    @timed(metrics.crud_db_duration.labels("order.get_multi_paginated"))
     def get_multi_paginated(
         self, 
         db: Session, 
@@ -138,7 +519,48 @@ class OrderCRUD:
             desc(models.Order.created_at), 
             desc(models.Order.id)
         )
+        query = self._apply_cursor(query, cursor)
+        
+        orders = query.limit(limit + 1).all()
+        return self._paginate(orders, limit)
+    
+    @timed(metrics.crud_db_duration.labels("order.get_multi_paginated_rows"))
+    def get_multi_paginated_rows(
+        self,
+        db: Session,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        fields: Tuple[str, ...] = serializers.ORDER_FIELDS,
+        include_items: bool = True
+    ) -> Tuple[List[Tuple[Row, List[Row]]], Optional[str], bool]:
+        """``get_multi_paginated`` as column projections: (order, items) pairs.
+        
+        Two queries, like a selectin load, but rows come back as tuples
+        without ORM instances, identity-map bookkeeping or lazy loaders.
+        Only the columns ``fields`` need are selected, and without
+        ``include_items`` the item query is skipped (items come back empty).
+        """
+        query = select(*serializers.order_columns(fields)).order_by(
+            desc(models.Order.created_at),
+            desc(models.Order.id)
+        )
+        query = self._apply_cursor(query, cursor)
+        
+        orders, next_cursor, has_more = self._paginate(db.execute(query.limit(limit + 1)).all(), limit)
+        
+        items_by_order = {order.id: [] for order in orders}
+        if items_by_order and include_items:
+            items = db.execute(
+                select(*serializers.ORDER_ITEM_COLUMNS)
+                .where(models.OrderItem.order_id.in_(list(items_by_order)))
+                .order_by(models.OrderItem.id)
+            )
+            for item in items:
+                items_by_order[item.order_id].append(item)
         
+        return [(order, items_by_order[order.id]) for order in orders], next_cursor, has_more
+    
+    def _apply_cursor(self, query, cursor: Optional[str]):
         if cursor:
             try:
                 # Parse cursor: "timestamp_id"
@@ -155,9 +577,12 @@ class OrderCRUD:
             except (ValueError, TypeError):
                 # Invalid cursor, ignore
                 pass
-        
-        orders = query.limit(limit + 1).all()
-        
+        return query
+    
+    def _paginate(
+        self, orders: List[models.Order], limit: int
+    ) -> Tuple[List[models.Order], Optional[str], bool]:
+        """Trim a limit + 1 fetch down to one page and build the next cursor"""
         has_more = len(orders) > limit
         if has_more:
             orders = orders[:-1]
@@ -169,44 +594,96 @@ class OrderCRUD:
         
         return orders, next_cursor, has_more
     
+    def _reserve_stock(
+        self,
+        db: Session,
+        order_data: schemas.OrderCreate,
+        reservation: Optional[models.Reservation] = None
+    ) -> Tuple[int, List[dict]]:
+        """Lock, validate and decrement stock for every item in the order.
+        
+        With a ``reservation`` the units come out of its hold instead of the
+        freely available stock, and the reservation is marked confirmed.
+        Returns the order total in minor units and the order item rows to
+        insert, one per product. Nothing is committed; the caller owns the
+        transaction.
+        """
+        quantities = _quantities_by_product(
+            (item.product_id, item.quantity) for item in order_data.items
+        )
+        total_amount = 0
+        order_items_data = []
+        
+        # Lock in id order, like holds and cancellations, so that
+        # concurrent checkouts and restocks queue instead of deadlocking
+        for product_id, quantity in sorted(quantities.items()):
+            product = product_crud.get_for_update(db, product_id)
+            if not product:
+                raise ValueError(f"Product with id {product_id} not found")
+            
+            was_low = events.is_low_stock(product)
+            if reservation is not None:
+                # Held units were already taken out of the available stock,
+                # unless someone has since cut the stock below the hold
+                if product.stock < quantity:
+                    raise ValueError(f"Insufficient stock for product {product.name}. Available: {product.stock}, Requested: {quantity}")
+                product.reserved -= quantity
+            elif product.available < quantity:
+                raise ValueError(f"Insufficient stock for product {product.name}. Available: {product.available}, Requested: {quantity}")
+            
+            # Decrement stock
+            product.stock -= quantity
+            events.record_stock_change(db, product, was_low)
+            
+            # Integer minor units: exact, and cheaper than float arithmetic
+            total_amount += product.price_minor * quantity
+            
+            order_items_data.append({
+                "product_id": product_id,
+                "quantity": quantity,
+                "price_minor": product.price_minor
+            })
+        
+        if reservation is not None:
+            reservation.status = "confirmed"
+        
+        return total_amount, order_items_data
+    
+    async def combine(
+        self,
+        order_data: schemas.OrderCreate,
+        idempotency_key: str,
+        run: Callable[..., Awaitable],
+    ) -> Optional[int]:
+        """Place a one-product order through the stock write combiner.
+        
+        Called from the event loop, so that requests waiting for their batch
+        hold no thread; ``run`` runs the batch's write (the checkout lane).
+        Returns the order id, or None when the order is not combined and
+        should go through ``create_with_items``.
+        """
+        if self.combiner is None or len(order_data.items) != 1:
+            return None
+        item = order_data.items[0]
+        return await self.combiner.submit_async(item.product_id, item.quantity, idempotency_key, run)
+    
+    @timed(metrics.crud_db_duration.labels("order.create_with_items"))
     def create_with_items(
     self, 
     db: Session, 
     order_data: schemas.OrderCreate, 
-    idempotency_key: str
+    idempotency_key: str,
+    reservation: Optional[models.Reservation] = None
 ) -> models.Order:
         from sqlalchemy.exc import IntegrityError
         
         try:
-            # Calculate total and validate stock with row-level locking
-            total_amount = 0
-            order_items_data = []
-            
-            for item in order_data.items:
-                # Lock the product row for update
-                product = product_crud.get_for_update(db, item.product_id)
-                if not product:
-                    raise ValueError(f"Product with id {item.product_id} not found")
-                
-                if product.stock < item.quantity:
-                    raise ValueError(f"Insufficient stock for product {product.name}. Available: {product.stock}, Requested: {item.quantity}")
-                
-                # Decrement stock
-                product.stock -= item.quantity
-                
-                item_total = product.price * item.quantity
-                total_amount += item_total
-                
-                order_items_data.append({
-                    "product_id": item.product_id,
-                    "quantity": item.quantity,
-                    "price": product.price
-                })
+            total_amount, order_items_data = self._reserve_stock(db, order_data, reservation)
             
             # Create order
             db_order = models.Order(
                 idempotency_key=idempotency_key,
-                total_amount=total_amount
+                total_amount_minor=total_amount
             )
             db.add(db_order)
             db.flush()  # Get the order ID
@@ -219,11 +696,17 @@ class OrderCRUD:
                 )
                 db.add(db_item)
             
+            record_product_orders(db, db_order.id, order_items_data)
+            # Committed with the order, published by the outbox relay
+            events.record_order_created(db, db_order.id, total_amount, (
+                (item["product_id"], item["quantity"], item["price_minor"]) for item in order_items_data
+            ))
+            
             db.commit()
             db.refresh(db_order)
             
             # Invalidate product cache since stock changed
-            product_crud._invalidate_products_cache()
+            product_crud._invalidate_products_cache(item["product_id"] for item in order_items_data)
             
             return db_order
             
@@ -233,7 +716,7 @@ class OrderCRUD:
             
             # Check if it's a duplicate idempotency key error
             if "ix_orders_idempotency_key" in str(e) or "idempotency_key" in str(e):
-                print(f"🔄 Idempotent request detected via IntegrityError - fetching existing order")
+                logger.info("Idempotent request detected via IntegrityError - fetching existing order")
                 # Fetch the existing order
                 existing_order = self.get_by_idempotency_key(db, idempotency_key)
                 if existing_order:
@@ -245,6 +728,268 @@ class OrderCRUD:
                 # Some other integrity error, re-raise
                 raise e
 
+    @timed(metrics.crud_db_duration.labels("order.cancel"))
+    def cancel(self, db: Session, order_id: int, reason: Optional[str] = None) -> models.Order:
+        """Cancel a placed order and put its units back on sale.
+        
+        Idempotent: the status moves from placed to cancelled in one
+        conditional UPDATE, so of any number of concurrent or repeated
+        calls exactly one restocks and the rest return the cancelled order.
+        """
+        try:
+            if not self._change_status(db, order_id, "placed", "cancelled", reason):
+                db.rollback()
+                return self._existing(db, order_id)
+            restocked = self._ordered_quantities(db, order_id)
+            self._restock(db, restocked)
+            events.record_order_cancelled(db, order_id, restocked, reason)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        
+        product_crud._invalidate_products_cache(restocked)
+        return self._recache(db, order_id)
+    
+    def _recache(self, db: Session, order_id: int) -> models.Order:
+        """Reload a changed order and overwrite its cache entry with it"""
+        order = self.get(db, order_id)
+        order_cache().set(order_id, serializers.order_dict(order))
+        return order
+    
+    def _existing(self, db: Session, order_id: int) -> models.Order:
+        order = self.get(db, order_id)
+        if order is None:
+            raise ValueError(f"Order with id {order_id} not found")
+        return order
+    
+    def _change_status(
+        self, db: Session, order_id: int, from_status: str, to_status: str, reason: Optional[str] = None
+    ) -> bool:
+        """Move the order between statuses and log it; False if it was not in ``from_status``"""
+        changed = db.query(models.Order).filter(
+            models.Order.id == order_id, models.Order.status == from_status
+        ).update({models.Order.status: to_status}, synchronize_session=False)
+        if changed:
+            db.add(models.OrderStatusChange(
+                order_id=order_id, from_status=from_status, to_status=to_status, reason=reason
+            ))
+        return bool(changed)
+    
+    def _ordered_quantities(self, db: Session, order_id: int) -> Dict[int, int]:
+        return dict(db.query(
+            models.OrderItem.product_id, func.sum(models.OrderItem.quantity)
+        ).filter(models.OrderItem.order_id == order_id).group_by(models.OrderItem.product_id).all())
+    
+    def _restock(self, db: Session, quantities: Dict[int, int]) -> None:
+        """Add ``quantities`` back to stock: one UPDATE for every product.
+        
+        The rows are locked in id order first, the order holds use, so a
+        cancellation queues behind checkouts on the same SKUs instead of
+        deadlocking with them, and holds each lock for a single statement.
+        """
+        if not quantities:
+            return
+        product_ids = sorted(quantities)
+        with _product_lock_wait_time.time():
+            db.execute(
+                select(models.Product.id).where(models.Product.id.in_(product_ids))
+                .order_by(models.Product.id).with_for_update()
+            ).all()
+        db.execute(
+            update(models.Product).where(models.Product.id.in_(product_ids)).values(
+                stock=models.Product.stock + case(quantities, value=models.Product.id, else_=0)
+            ).execution_options(synchronize_session=False)
+        )
+
+class ReservationCRUD:
+    """Two-phase checkout: hold stock for a while, then confirm or release.
+    
+    A hold only locks its product rows for the short transaction that moves
+    units from available into ``Product.reserved``; payment can then run
+    without any lock held. Confirming turns the held units into an order,
+    releasing or expiring returns them to the available stock.
+    """
+    
+    def get(self, db: Session, reservation_id: int) -> Optional[models.Reservation]:
+        return db.query(models.Reservation).filter(models.Reservation.id == reservation_id).first()
+    
+    def get_for_update(self, db: Session, reservation_id: int) -> Optional[models.Reservation]:
+        lock_rows(db, models.Reservation.__table__, [reservation_id])
+        return db.query(models.Reservation).filter(
+            models.Reservation.id == reservation_id
+        ).with_for_update().first()
+    
+    def create(self, db: Session, reservation_data: schemas.ReservationCreate) -> models.Reservation:
+        quantities = _quantities_by_product(
+            (item.product_id, item.quantity) for item in reservation_data.items
+        )
+        try:
+            # Lock in id order so concurrent holds cannot deadlock
+            for product_id, quantity in sorted(quantities.items()):
+                product = product_crud.get_for_update(db, product_id)
+                if not product:
+                    raise ValueError(f"Product with id {product_id} not found")
+                if product.available < quantity:
+                    raise ValueError(f"Insufficient stock for product {product.name}. Available: {product.available}, Requested: {quantity}")
+                was_low = events.is_low_stock(product)
+                product.reserved += quantity
+                events.record_stock_change(db, product, was_low)
+            
+            db_reservation = models.Reservation(
+                status="active",
+                expires_at=_utcnow() + timedelta(seconds=reservation_data.ttl_seconds),
+                items=[
+                    models.ReservationItem(product_id=product_id, quantity=quantity)
+                    for product_id, quantity in quantities.items()
+                ],
+            )
+            db.add(db_reservation)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        
+        db.refresh(db_reservation)
+        product_crud._invalidate_products_cache(quantities)
+        return db_reservation
+    
+    def confirm(self, db: Session, reservation_id: int) -> models.Order:
+        idempotency_key = f"reservation-{reservation_id}"
+        reservation = self.get_for_update(db, reservation_id)
+        if not reservation:
+            db.rollback()
+            raise ValueError(f"Reservation with id {reservation_id} not found")
+        
+        if reservation.status == "confirmed":
+            db.rollback()
+            return get_order_crud().get_by_idempotency_key(db, idempotency_key)
+        if reservation.status != "active" or _is_expired(reservation):
+            db.rollback()
+            raise ValueError(f"Reservation {reservation_id} is no longer active")
+        
+        order_data = schemas.OrderCreate(items=[
+            schemas.OrderItemCreate(product_id=item.product_id, quantity=item.quantity)
+            for item in sorted(reservation.items, key=lambda i: i.product_id)
+        ])
+        return get_order_crud().create_with_items(
+            db, order_data, idempotency_key, reservation=reservation
+        )
+    
+    def release(self, db: Session, reservation_id: int) -> Optional[models.Reservation]:
+        reservation = self.get_for_update(db, reservation_id)
+        if not reservation:
+            db.rollback()
+            return None
+        
+        if reservation.status == "confirmed":
+            db.rollback()
+            raise ValueError(f"Reservation {reservation_id} is already confirmed")
+        if reservation.status == "active":
+            self._return_held_stock(db, [(i.product_id, i.quantity) for i in reservation.items])
+            reservation.status = "released"
+            db.commit()
+            product_crud._invalidate_products_cache(item.product_id for item in reservation.items)
+        else:
+            db.rollback()
+        
+        db.refresh(reservation)
+        return reservation
+    
+    def expire_stale(self, db: Session, batch_size: int = 500) -> int:
+        """Expire one batch of lapsed holds and return how many were expired"""
+        stale_ids = [row.id for row in db.query(models.Reservation.id).filter(
+            models.Reservation.status == "active",
+            models.Reservation.expires_at <= _utcnow()
+        ).order_by(models.Reservation.expires_at).limit(batch_size).with_for_update(skip_locked=True)]
+        if stale_ids and lock_rows(db, models.Reservation.__table__, stale_ids):
+            # Picked before the lock (SQLite skips nothing): a release or
+            # another expirer may have settled some of them meanwhile
+            stale_ids = [row.id for row in db.query(models.Reservation.id).filter(
+                models.Reservation.id.in_(stale_ids),
+                models.Reservation.status == "active",
+            )]
+        if not stale_ids:
+            db.rollback()
+            return 0
+        
+        held = db.query(
+            models.ReservationItem.product_id, func.sum(models.ReservationItem.quantity)
+        ).filter(
+            models.ReservationItem.reservation_id.in_(stale_ids)
+        ).group_by(models.ReservationItem.product_id).all()
+        
+        self._return_held_stock(db, held)
+        db.query(models.Reservation).filter(
+            models.Reservation.id.in_(stale_ids)
+        ).update({models.Reservation.status: "expired"}, synchronize_session=False)
+        db.commit()
+        
+        product_crud._invalidate_products_cache(product_id for product_id, _ in held)
+        return len(stale_ids)
+    
+    def _return_held_stock(self, db: Session, held) -> None:
+        # One UPDATE per product, in id order to match the hold lock order
+        for product_id, quantity in sorted(_quantities_by_product(held).items()):
+            db.query(models.Product).filter(models.Product.id == product_id).update(
+                {models.Product.reserved: models.Product.reserved - quantity},
+                synchronize_session=False
+            )
+
+def _quantities_by_product(pairs) -> dict:
+    quantities = {}
+    for product_id, quantity in pairs:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _is_expired(reservation: models.Reservation) -> bool:
+    expires_at = reservation.expires_at
+    if expires_at.tzinfo is None:
+        # SQLite hands back naive UTC timestamps
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at <= _utcnow()
+
 # Create CRUD instances
 product_crud = ProductCRUD()
-order_crud = OrderCRUD()
\ No newline at end of file
+reservation_crud = ReservationCRUD()
+
+# The order store depends on settings (shards, the combiner), so like the
+# engines in app.database it is chosen on first use rather than at import
+_order_crud_lock = threading.Lock()
+_order_crud: Optional[OrderCRUD] = None
+
+def get_order_crud() -> OrderCRUD:
+    global _order_crud
+    if _order_crud is None:
+        with _order_crud_lock:
+            if _order_crud is None:
+                _order_crud = _build_order_crud()
+    return _order_crud
+
+def _build_order_crud() -> OrderCRUD:
+    if settings.order_shard_url_list:
+        from app.sharding import ShardedOrderCRUD
+        if settings.snowflake_worker_id is None:
+            # Two processes minting ids with the same worker bits collide
+            raise RuntimeError("Sharded orders need SNOWFLAKE_WORKER_ID, unique per process")
+        return ShardedOrderCRUD(
+            settings.order_shard_url_list,
+            worker_id=settings.snowflake_worker_id,
+        )
+    return OrderCRUD(
+        combiner=StockWriteCombiner(
+            SessionLocal,
+            window_ms=settings.stock_combiner_window_ms,
+            max_batch=settings.stock_combiner_max_batch,
+            on_commit=product_crud._invalidate_products_cache,
+        ) if settings.stock_combiner_enabled else None
+    )
+
+def __getattr__(name):
+    # Lazy module attribute kept for callers that import it directly
+    if name == "order_crud":
+        return get_order_crud()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
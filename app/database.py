@@ -1,28 +1,272 @@
-from sqlalchemy import create_engine
+from sqlalchemy import bindparam, create_engine, event, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Callable, List, Optional, Tuple
+import itertools
+import logging
+import threading
+import time
 import redis
+from app.core.circuit_breaker import CircuitBreaker, GuardedRedis
 from app.core.config import settings
+from app.core.profiler import SQLProfiler
 
-# Select database based on environment
-if settings.env == "test":
-    engine = create_engine(
-        settings.database_url,
-        connect_args={"check_same_thread": False}  # SQLite-specific
-    )
-else:
-    engine = create_engine(settings.database_url)
+logger = logging.getLogger(__name__)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+# Engines and clients are built on first use rather than at import, so
+# importing the models (Alembic, tests, tooling) never touches settings or
+# opens connections, and each worker only pays for what it uses.
+_init_lock = threading.RLock()
+_engine = None
+_redis_client = None
+_redis_initialized = False
+_replica_router = None
+_sql_profiler = None
+_sql_profiler_initialized = False
+
+def get_sql_profiler() -> Optional[SQLProfiler]:
+    global _sql_profiler, _sql_profiler_initialized
+    if not _sql_profiler_initialized:
+        with _init_lock:
+            if not _sql_profiler_initialized:
+                if settings.sql_profiler_enabled:
+                    _sql_profiler = SQLProfiler(
+                        slow_query_ms=settings.slow_query_ms,
+                        sample_rate=settings.sql_profiler_sample_rate,
+                    )
+                _sql_profiler_initialized = True
+    return _sql_profiler
+
+def _create_engine(url: str, **kwargs):
+    if make_url(url).drivername.startswith("sqlite"):
+        # SQLite-specific
+        kwargs.setdefault("connect_args", {"check_same_thread": False})
+    engine = create_engine(url, **kwargs)
+    sql_profiler = get_sql_profiler()
+    if sql_profiler is not None:
+        sql_profiler.attach(engine)
+    return engine
+
+def pool_limits(max_connections: int, workers: int) -> Tuple[int, int]:
+    """Split a connection budget into (pool_size, max_overflow) for one worker"""
+    per_worker = max(2, max_connections // max(workers, 1))
+    # A quarter of each share is overflow, closed again once a burst is over
+    overflow = per_worker // 4
+    return per_worker - overflow, overflow
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _init_lock:
+            if _engine is None:
+                kwargs = {}
+                if settings.db_max_connections:
+                    pool_size, max_overflow = pool_limits(settings.db_max_connections, settings.web_concurrency)
+                    kwargs = {
+                        "pool_size": pool_size,
+                        "max_overflow": max_overflow,
+                        "pool_timeout": settings.db_pool_timeout,
+                    }
+                _engine = _create_engine(settings.database_url, **kwargs)
+    return _engine
+
+def dispose_engine() -> None:
+    """Close the pooled connections; the engine is rebuilt if used again"""
+    global _engine
+    with _init_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+
+def get_redis():
+    """Redis client, or None when no REDIS_URL is configured.
+
+    Calls time out after ``redis_socket_timeout`` and go through a circuit
+    breaker, so an unhealthy Redis costs a request at most one timeout
+    before everything bypasses it for ``redis_breaker_reset_seconds``.
+    """
+    global _redis_client, _redis_initialized
+    if not _redis_initialized:
+        with _init_lock:
+            if not _redis_initialized:
+                if settings.redis_url:
+                    try:
+                        _redis_client = GuardedRedis(
+                            redis.from_url(
+                                settings.redis_url,
+                                decode_responses=True,
+                                socket_timeout=settings.redis_socket_timeout,
+                                socket_connect_timeout=settings.redis_connect_timeout,
+                            ),
+                            CircuitBreaker(
+                                "redis",
+                                failure_threshold=settings.redis_breaker_failures,
+                                reset_timeout=settings.redis_breaker_reset_seconds,
+                            ),
+                        )
+                    except Exception:
+                        _redis_client = None
+                _redis_initialized = True
+    return _redis_client
 
-# Redis client
-redis_client = None
-if settings.redis_url:
+def warm_up_pool(connections: int) -> None:
+    """Open ``connections`` pooled connections up front so the first requests skip the handshake"""
+    engine = get_engine()
+    size = getattr(engine.pool, "size", None)
+    if size is not None:
+        # Never wait on our own pool
+        connections = min(connections, size())
+    opened = []
     try:
-        redis_client = redis.from_url(settings.redis_url, decode_responses=True)
-    except Exception:
-        redis_client = None
+        for _ in range(connections):
+            opened.append(engine.connect())
+    finally:
+        for connection in opened:
+            connection.close()
+
+class _PrimarySession(Session):
+    """Session that binds to the primary engine when it is first used"""
+
+    def get_bind(self, mapper=None, **kwargs):
+        if self.bind is None:
+            return get_engine()
+        return super().get_bind(mapper, **kwargs)
+
+SessionLocal = sessionmaker(class_=_PrimarySession, autocommit=False, autoflush=False)
+Base = declarative_base()
+
+def lock_rows(db: Session, table, ids) -> bool:
+    """Make the ``SELECT ... FOR UPDATE`` that follows lock on SQLite too.
+
+    SQLite drops FOR UPDATE, so two transactions could read the same row
+    and both write values computed from that read. A no-op UPDATE takes
+    the database's write lock first: the second transaction waits here
+    until the first commits, then reads what it wrote. Other databases
+    lock the rows in the SELECT itself, so nothing is sent to them.
+    Returns whether the lock was taken here, i.e. whether rows read
+    before the call may have changed since.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return False
+    db.execute(
+        text(f"UPDATE {table.name} SET id = id WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+        {"ids": list(ids)},
+    )
+    return True
+
+def __getattr__(name):
+    # Lazy module attributes kept for callers that import them directly
+    if name == "engine":
+        return get_engine()
+    if name == "redis_client":
+        return get_redis()
+    if name == "replica_router":
+        return get_replica_router()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.engine = _create_engine(url, pool_pre_ping=True)
+        self.session_factory = sessionmaker(
+            autocommit=False, autoflush=False, bind=self.engine, info={"replica": True}
+        )
+        self.unhealthy_until = 0.0
+
+
+def is_replica(session: Session) -> bool:
+    """True for sessions on a read replica, which may trail the primary.
+
+    What they read must not fill caches shared with primary readers, or be
+    labelled with the current catalogue version: a lagging row would be
+    served as current until the next change evicted it.
+    """
+    return session.info.get("replica", False)
+
+
+class ReplicaRouter:
+    """Hands out read-only sessions, spreading them over the read replicas.
+
+    Replicas are picked round-robin. A read whose client wrote less than
+    ``sticky_seconds`` ago (``last_write``, a Unix timestamp the client
+    echoes back; see ``app.dependencies``) goes to the primary so it sees
+    its own writes, whichever worker or host took the write. A replica
+    that fails to connect is skipped for ``retry_seconds`` before being
+    retried. With no healthy replica left, reads fall back to the primary.
+    """
+
+    def __init__(
+        self,
+        primary_factory: Callable[[], Session],
+        replica_urls: List[str],
+        sticky_seconds: float = 5.0,
+        retry_seconds: float = 30.0,
+    ):
+        self.primary_factory = primary_factory
+        self.replicas = [_Replica(url) for url in replica_urls]
+        self.sticky_seconds = sticky_seconds
+        self.retry_seconds = retry_seconds
+        self._counter = itertools.count()
+
+    def is_sticky(self, last_write: Optional[float]) -> bool:
+        # abs(): another host's clock may run a little ahead of ours
+        return last_write is not None and abs(time.time() - last_write) < self.sticky_seconds
+
+    def healthy_replicas(self) -> List[_Replica]:
+        now = time.monotonic()
+        return [r for r in self.replicas if r.unhealthy_until <= now]
+
+    def read_session(self, last_write: Optional[float] = None) -> Session:
+        if self.replicas and not self.is_sticky(last_write):
+            healthy = self.healthy_replicas()
+            start = next(self._counter)
+            for offset in range(len(healthy)):
+                replica = healthy[(start + offset) % len(healthy)]
+                session = replica.session_factory()
+                try:
+                    # Check out a connection now so a dead replica is detected
+                    # here rather than in the middle of the request
+                    session.connection()
+                    return session
+                except DBAPIError as e:
+                    session.close()
+                    replica.unhealthy_until = time.monotonic() + self.retry_seconds
+                    logger.warning("Read replica %s unavailable, skipping: %s", replica.url, e)
+        return self.primary_factory()
+
+
+def get_replica_router() -> ReplicaRouter:
+    global _replica_router
+    if _replica_router is None:
+        with _init_lock:
+            if _replica_router is None:
+                _replica_router = ReplicaRouter(
+                    SessionLocal,
+                    settings.replica_url_list,
+                    sticky_seconds=settings.replica_sticky_seconds,
+                    retry_seconds=settings.replica_retry_seconds,
+                )
+    return _replica_router
+
+@event.listens_for(SessionLocal, "after_flush")
+def _mark_session_wrote(session, flush_context):
+    session.info["wrote"] = True
+
+@event.listens_for(SessionLocal, "after_commit")
+def _record_client_write(session):
+    if session.info.pop("wrote", False):
+        # The request's state (app.dependencies.get_db): the response
+        # hands the time to the client, which sends it back on its reads
+        state = session.info.get("request_state")
+        if state is not None:
+            state.last_write = time.time()
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_session_write(session):
+    session.info.pop("wrote", None)
 
 # Dependency for FastAPI & tests
 def get_db():
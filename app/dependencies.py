@@ -1,13 +1,163 @@
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
+from fastapi import HTTPException, Request, status
+from typing import FrozenSet, Optional, Tuple
+from app.core.admission import AdmissionRejected, CheckoutLane, RateLimiter
+from app.core.config import settings
+from app.database import SessionLocal, get_redis, get_replica_router
+from functools import lru_cache
+import hashlib
+import math
+import threading
 import uuid
 
-def get_db():
+# Read-your-writes marker: when the client last committed a write, as a
+# Unix timestamp. Sent back on every response that wrote, as a cookie and
+# as a header for clients without a cookie jar, and read from either
+LAST_WRITE_COOKIE = "last_write"
+LAST_WRITE_HEADER = "X-Last-Write"
+
+def client_address(request: Request) -> Optional[str]:
+    """The caller's address, for limits a client must not be able to dodge.
+
+    Never a client-supplied header: uvicorn replaces the peer address with
+    the ``X-Forwarded-For`` one only when the peer is a trusted proxy
+    (``FORWARDED_ALLOW_IPS``, see gunicorn.conf.py)
+    """
+    return request.client.host if request.client else None
+
+def last_write(request: Request) -> Optional[float]:
+    raw = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE)
+    try:
+        return float(raw) if raw else None
+    except ValueError:
+        return None
+
+def get_db(request: Request):
     db = SessionLocal()
+    # A commit on this session stamps the request (app.database), and
+    # LastWriteMiddleware passes the stamp on to the client
+    db.info["request_state"] = request.state
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_checkout_db(request: Request):
+    """``get_db`` for checkouts, without a trip through the read endpoints'
+    threadpool.
+
+    The checkout closes the session itself, on the lane's thread that used
+    it. Waiting for another thread here to give the connection back could
+    deadlock: with the pool exhausted, every lane thread may be blocked on
+    a connection that only this close would free. Whatever is left to close
+    here holds no connection and does no I/O.
+    """
+    db = SessionLocal()
+    db.info["request_state"] = request.state
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db(request: Request):
+    """Session for read-only endpoints, routed to a replica when possible"""
+    db = get_replica_router().read_session(last_write(request))
     try:
         yield db
     finally:
         db.close()
 
+
+class LastWriteMiddleware:
+    """Hands clients the read-your-writes marker of a request that wrote.
+
+    The marker travels with the client rather than living in one worker's
+    memory, so a read that lands on any worker or host after the write
+    still goes to the primary. Pure ASGI, like ``MetricsMiddleware``.
+    """
+
+    def __init__(self, app, max_age: float):
+        self.app = app
+        self.max_age = max_age
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # The request's state; get_db stamps it on commit
+        state = scope.setdefault("state", {})
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and "last_write" in state:
+                stamp = f"{state['last_write']:.3f}"
+                headers = list(message.get("headers", []))
+                headers.append((LAST_WRITE_HEADER.lower().encode(), stamp.encode()))
+                headers.append((b"set-cookie", (
+                    f"{LAST_WRITE_COOKIE}={stamp}; Max-Age={max(1, math.ceil(self.max_age))}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                ).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
 def generate_idempotency_key():
-    return str(uuid.uuid4())
\ No newline at end of file
+    return str(uuid.uuid4())
+
+def admission_error(error: AdmissionRejected, status_code: int) -> HTTPException:
+    return HTTPException(
+        status_code=status_code,
+        detail=error.detail,
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))},
+    )
+
+_checkout_lane: Optional[CheckoutLane] = None
+_lane_lock = threading.Lock()
+
+def get_checkout_lane() -> CheckoutLane:
+    global _checkout_lane
+    if _checkout_lane is None:
+        with _lane_lock:
+            if _checkout_lane is None:
+                _checkout_lane = CheckoutLane(
+                    "checkout",
+                    concurrency=settings.checkout_concurrency,
+                    queue_size=settings.checkout_queue_size,
+                    queue_timeout=settings.checkout_queue_timeout,
+                )
+    return _checkout_lane
+
+order_rate_limiter = RateLimiter("orders", get_redis)
+
+def _api_key_digest(api_key: str) -> str:
+    # Hashed, so API keys never appear in the Redis keyspace
+    return hashlib.blake2b(api_key.encode(), digest_size=12).hexdigest()
+
+@lru_cache(maxsize=8)
+def _known_api_keys(api_keys: Tuple[str, ...]) -> FrozenSet[str]:
+    return frozenset(_api_key_digest(key) for key in api_keys)
+
+def rate_limit_key(request: Request) -> Optional[str]:
+    """The caller's bucket: its API key if that is a configured one, else its address.
+
+    An unknown key counts for nothing, so sending a fresh one with every
+    request still draws from the address's bucket.
+    """
+    api_key = request.headers.get("X-API-Key")
+    if api_key:
+        digest = _api_key_digest(api_key)
+        if digest in _known_api_keys(tuple(settings.order_rate_api_key_list)):
+            return "key:" + digest
+    return client_address(request)
+
+async def rate_limit_orders(request: Request):
+    """Per-client token bucket for checkouts, keyed by known API key or address"""
+    if settings.order_rate_limit <= 0:
+        return
+    key = rate_limit_key(request)
+    try:
+        # The Redis call blocks, so it runs on the lane's threads too
+        await get_checkout_lane().offload(
+            order_rate_limiter.check, key or "anonymous", settings.order_rate_limit, settings.order_rate_burst
+        )
+    except AdmissionRejected as e:
+        raise admission_error(e, status.HTTP_429_TOO_MANY_REQUESTS)
@@ -0,0 +1,295 @@
+"""Order events: a transactional outbox drained into Redis Streams.
+
+Checkout writes an ``OutboxEvent`` row in the same transaction as the
+order, so an event exists exactly when its order does, even if Redis is
+down at the time. ``app.background.OutboxRelay`` appends pending rows to
+their stream and deletes them. Delivery is at least once: a relay that
+dies between the XADD and its commit publishes those rows again, so every
+entry carries the outbox ``event_id`` for consumers to deduplicate on.
+
+Downstream services read the stream instead of polling ``GET /orders/``:
+``StreamConsumer`` for a consumer group (each entry goes to one member of
+the group, acknowledged a batch at a time) and ``replay`` to scan it from
+any offset.
+"""
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import logging
+import threading
+import orjson
+import redis
+from redis.exceptions import ResponseError
+from sqlalchemy.orm import Session
+from app import models
+from app.core import metrics
+from app.core.circuit_breaker import GuardedRedis
+from app.core.config import settings
+from app.core.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+ORDER_STREAM = "orders:events"
+ORDER_CREATED = "order.created"
+ORDER_CANCELLED = "order.cancelled"
+STOCK_ALERT_STREAM = "inventory:alerts"
+LOW_STOCK = "product.low_stock"
+# Seconds a consumer's socket waits beyond block_ms for the reply
+_STREAM_READ_MARGIN = 1.0
+
+_published = metrics.registry.counter(
+    "outbox_events_published", "Outbox events appended to their Redis Stream", ("stream",)
+)
+_relay_time = metrics.crud_db_duration.labels("outbox.publish")
+
+
+class StreamEvent(NamedTuple):
+    entry_id: str  # stream offset, "<ms>-<seq>"
+    event_id: int  # outbox id, identical for redeliveries
+    type: str
+    data: dict
+
+
+def order_created(
+    order_id: int, total_amount_minor: int, items: Iterable[Tuple[int, int, int]]
+) -> models.OutboxEvent:
+    """Outbox row for a new order; ``items`` are (product_id, quantity, price_minor)"""
+    payload = {
+        "order_id": order_id,
+        "total_amount_minor": total_amount_minor,
+        "items": [list(item) for item in items],
+        "ts": datetime.now(timezone.utc),
+    }
+    return models.OutboxEvent(stream=ORDER_STREAM, event_type=ORDER_CREATED, payload=dumps(payload).decode())
+
+def record_order_created(
+    db: Session, order_id: int, total_amount_minor: int, items: Iterable[Tuple[int, int, int]]
+) -> None:
+    """Add the event to ``db``'s transaction when order events are enabled"""
+    if settings.order_events_enabled:
+        db.add(order_created(order_id, total_amount_minor, items))
+
+def record_order_cancelled(
+    db: Session, order_id: int, restocked: Dict[int, int], reason: Optional[str] = None
+) -> None:
+    """Add the cancellation event; ``restocked`` maps product ids to the units put back"""
+    if settings.order_events_enabled:
+        payload = {
+            "order_id": order_id,
+            "items": [[product_id, quantity] for product_id, quantity in sorted(restocked.items())],
+            "reason": reason,
+            "ts": datetime.now(timezone.utc),
+        }
+        db.add(models.OutboxEvent(stream=ORDER_STREAM, event_type=ORDER_CANCELLED, payload=dumps(payload).decode()))
+
+def is_low_stock(product: models.Product) -> bool:
+    return product.reorder_point is not None and product.available <= product.reorder_point
+
+def record_stock_change(db: Session, product: models.Product, was_low: bool) -> bool:
+    """Add a low-stock alert if this change took ``product`` to its reorder point.
+
+    ``was_low`` is ``is_low_stock(product)`` from before the change. Called
+    with the product row locked, so the check is O(1) per item and exactly
+    one transaction sees a given crossing: an alert fires once when
+    available units drop to or below the reorder point, and not again until
+    a restock lifts them back above it.
+    """
+    if was_low or not is_low_stock(product):
+        return False
+    if settings.stock_alerts_enabled:
+        payload = {
+            "product_id": product.id,
+            "reorder_point": product.reorder_point,
+            "available": product.available,
+            "stock": product.stock,
+            "ts": datetime.now(timezone.utc),
+        }
+        db.add(models.OutboxEvent(stream=STOCK_ALERT_STREAM, event_type=LOW_STOCK, payload=dumps(payload).decode()))
+    return True
+
+def publish_pending(db: Session, redis_client, batch_size: int = 500, maxlen: Optional[int] = None) -> int:
+    """Move one batch of outbox rows to Redis; returns how many were published.
+
+    Rows are locked with SKIP LOCKED, so several relays can run at once.
+    The batch goes out in one pipeline and is deleted only after Redis
+    accepted all of it.
+    """
+    with _relay_time.time():
+        pending = db.query(models.OutboxEvent).order_by(models.OutboxEvent.id).limit(
+            batch_size
+        ).with_for_update(skip_locked=True).all()
+        if not pending:
+            db.rollback()
+            return 0
+        streams = [event.stream for event in pending]
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for event in pending:
+                pipe.xadd(
+                    event.stream,
+                    {"event_id": event.id, "type": event.event_type, "data": event.payload},
+                    maxlen=maxlen,
+                    approximate=True,
+                )
+            pipe.execute()
+            db.query(models.OutboxEvent).filter(
+                models.OutboxEvent.id.in_([event.id for event in pending])
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    for stream in streams:
+        _published.labels(stream).inc()
+    return len(pending)
+
+def _decode(entry_id, fields) -> StreamEvent:
+    return StreamEvent(
+        entry_id=entry_id,
+        event_id=int(fields["event_id"]),
+        type=fields["type"],
+        data=orjson.loads(fields["data"]),
+    )
+
+def replay(
+    redis_client, start: str = "-", end: str = "+", stream: str = ORDER_STREAM, batch_size: int = 500
+) -> Iterator[StreamEvent]:
+    """Every entry from offset ``start`` (inclusive) to ``end``, oldest first.
+
+    Independent of any consumer group; the stream keeps the last
+    ``order_stream_maxlen`` entries (approximately).
+    """
+    while True:
+        entries = redis_client.xrange(stream, min=start, max=end, count=batch_size)
+        for entry_id, fields in entries:
+            yield _decode(entry_id, fields)
+        if len(entries) < batch_size:
+            return
+        start = f"({entries[-1][0]}"
+
+
+class StreamConsumer:
+    """One member of a consumer group on an event stream.
+
+    ``read`` hands out batches, ``ack`` confirms a whole batch in one XACK.
+    Entries delivered to this consumer but never acknowledged (it crashed
+    mid-batch) are re-read first after a restart, and ``claim_stale`` takes
+    over entries left pending by group members that did not come back.
+    Handlers must tolerate redeliveries: deduplicate on ``event_id``.
+
+    ``read`` blocks in XREADGROUP for up to ``block_ms``, which the app's
+    cache client (``app.database.get_redis()``) would cut off at its socket
+    timeout and count against its circuit breaker. ``from_url`` builds a
+    client of the consumer's own; a client passed in must not be guarded
+    and must wait longer than ``block_ms``.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        group: str,
+        consumer: str,
+        stream: str = ORDER_STREAM,
+        batch_size: int = 100,
+        block_ms: int = 1000,
+        claim_idle_ms: int = 60_000,
+    ):
+        if isinstance(redis_client, GuardedRedis):
+            raise ValueError("StreamConsumer needs its own client, not the circuit-breaker guarded cache client")
+        socket_timeout = redis_client.get_connection_kwargs().get("socket_timeout")
+        if socket_timeout is not None and block_ms / 1000 >= socket_timeout:
+            raise ValueError(f"block_ms={block_ms} must be below the client's socket_timeout ({socket_timeout}s)")
+        self.redis = redis_client
+        self.group = group
+        self.consumer = consumer
+        self.stream = stream
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self._recovering = True
+
+    @classmethod
+    def from_url(cls, group: str, consumer: str, url: Optional[str] = None, **kwargs) -> "StreamConsumer":
+        """Consumer with its own client on ``url`` (default ``REDIS_URL``)"""
+        block_ms = kwargs.get("block_ms", 1000)
+        client = redis.from_url(
+            url or settings.redis_url,
+            decode_responses=True,
+            # Long enough for a read that blocks the full block_ms
+            socket_timeout=block_ms / 1000 + _STREAM_READ_MARGIN,
+            socket_connect_timeout=settings.redis_connect_timeout,
+        )
+        return cls(client, group, consumer, **kwargs)
+
+    def ensure_group(self, start: str = "0") -> None:
+        """Create the group if needed; a new group starts reading at ``start``"""
+        try:
+            self.redis.xgroup_create(self.stream, self.group, id=start, mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def seek(self, offset: str) -> None:
+        """Move the whole group to ``offset``: "0" replays everything retained, "$" skips to new entries"""
+        self.redis.xgroup_setid(self.stream, self.group, offset)
+
+    def read(self) -> List[StreamEvent]:
+        if self._recovering:
+            events = self._own_pending()
+            if events is not None:
+                return events
+            self._recovering = False
+        response = self.redis.xreadgroup(
+            self.group, self.consumer, {self.stream: ">"}, count=self.batch_size, block=self.block_ms or None
+        )
+        return self._events(response[0][1] if response else [])
+
+    def _own_pending(self) -> Optional[List[StreamEvent]]:
+        """What was delivered to this consumer before and never acked, None once drained"""
+        pending = self.redis.xpending_range(
+            self.stream, self.group, min="-", max="+", count=self.batch_size, consumername=self.consumer
+        )
+        if not pending:
+            return None
+        # Claiming them to ourselves again returns their contents
+        return self._events(self.redis.xclaim(
+            self.stream, self.group, self.consumer, 0, [entry["message_id"] for entry in pending]
+        ))
+
+    def _events(self, entries) -> List[StreamEvent]:
+        events, trimmed = [], []
+        for entry_id, fields in entries:
+            if fields:
+                events.append(_decode(entry_id, fields))
+            else:
+                # Trimmed from the stream while pending: nothing to redeliver
+                trimmed.append(entry_id)
+        if trimmed:
+            self.redis.xack(self.stream, self.group, *trimmed)
+        return events
+
+    def claim_stale(self) -> List[StreamEvent]:
+        """Take over entries other members left pending for ``claim_idle_ms``"""
+        response = self.redis.xautoclaim(
+            self.stream, self.group, self.consumer, self.claim_idle_ms, start_id="0-0", count=self.batch_size
+        )
+        return self._events(response[1])
+
+    def ack(self, events: List[StreamEvent]) -> int:
+        if not events:
+            return 0
+        return self.redis.xack(self.stream, self.group, *(event.entry_id for event in events))
+
+    def run(self, handler: Callable[[List[StreamEvent]], None], stop: threading.Event) -> None:
+        """Feed batches to ``handler`` until ``stop`` is set.
+
+        A batch is acknowledged only after ``handler`` returns; if it
+        raises, the batch stays pending and is read again on restart.
+        """
+        self.ensure_group()
+        while not stop.is_set():
+            events = self.read()
+            if not events:
+                events = self.claim_stale()
+            if events:
+                handler(events)
+                self.ack(events)
@@ -1,20 +1,106 @@
-from fastapi import FastAPI
-from app.routers import products, orders
-from app.database import engine
-from app import models
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from app.routers import products, orders, reservations
+from app import catalogue, crud
+from app.background import CacheEvictionListener, CatalogueRefresher, OutboxRelay, ReservationExpirer
+from app.core import metrics
+from app.core.compression import CompressionMiddleware
+from app.core.config import settings
+from app.core.profiler import QueryProfilerMiddleware
+from app.database import dispose_engine, get_redis, get_sql_profiler, warm_up_pool
+from app.dependencies import LastWriteMiddleware
+import logging
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+# The schema is owned by Alembic (`alembic upgrade head`); nothing here
+# reads settings or touches the database or Redis at import time.
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Chosen now so that a bad shard configuration stops the worker at boot
+    crud.get_order_crud()
+    warm_up_pool(settings.db_pool_warmup)
+    redis_client = get_redis()
+    if redis_client:
+        try:
+            redis_client.ping()
+        except Exception as e:
+            logger.warning("Redis unavailable at startup, caching disabled until it recovers: %s", e)
+    reservation_expirer = ReservationExpirer(
+        settings.reservation_expiry_interval,
+        batch_size=settings.reservation_expiry_batch_size,
+    )
+    reservation_expirer.start()
+    order_evictions = None
+    order_cache = crud.order_cache()
+    if redis_client and order_cache.l1 is not None:
+        order_evictions = CacheEvictionListener(order_cache, settings.cache_eviction_interval)
+        order_evictions.start()
+    catalogue_refresher = None
+    snapshot = catalogue.get_snapshot()
+    if snapshot is not None:
+        # Loads on the refresher thread; reads use the database until it is ready
+        catalogue_refresher = CatalogueRefresher(
+            snapshot,
+            settings.catalogue_snapshot_refresh_interval,
+            rebuild_interval=settings.catalogue_snapshot_rebuild_interval,
+        )
+        catalogue_refresher.start()
+    outbox_relay = None
+    if settings.order_events_enabled or settings.stock_alerts_enabled:
+        outbox_relay = OutboxRelay(
+            settings.outbox_relay_interval,
+            batch_size=settings.outbox_relay_batch_size,
+            maxlen=settings.order_stream_maxlen,
+        )
+        outbox_relay.start()
+    yield
+    # In-flight requests have drained by now (see app.server)
+    reservation_expirer.stop()
+    if order_evictions is not None:
+        order_evictions.stop()
+    if catalogue_refresher is not None:
+        catalogue_refresher.stop()
+    if outbox_relay is not None:
+        # Anything left is picked up by another worker's relay or the next start
+        outbox_relay.stop()
+    dispose_engine()
 
 app = FastAPI(
     title="Order & Inventory API",
     description="A concurrency-safe e-commerce Order & Inventory backend",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+# Starlette builds the middleware stack on the first call (lifespan
+# startup), so these factories read settings then rather than at import
+def _compression(app):
+    return CompressionMiddleware(app, minimum_size=settings.compression_min_size)
+
+def _last_write(app):
+    # Without replicas every read is on the primary already
+    if not settings.replica_url_list:
+        return app
+    return LastWriteMiddleware(app, max_age=settings.replica_sticky_seconds)
+
+def _query_profiler(app):
+    sql_profiler = get_sql_profiler()
+    if sql_profiler is None:
+        return app
+    return QueryProfilerMiddleware(app, profiler=sql_profiler, debug=settings.debug)
+
+# Innermost, so the request metrics include compression time
+app.add_middleware(_compression)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(_last_write)
+app.add_middleware(_query_profiler)
+
 # Include routers
 app.include_router(products.router)
 app.include_router(orders.router)
+app.include_router(reservations.router)
 
 @app.get("/")
 def read_root():
@@ -24,6 +110,10 @@ def read_root():
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
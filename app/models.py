@@ -1,41 +1,180 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey, Index
+from datetime import datetime, timezone
+from sqlalchemy import DDL, BigInteger, Column, Integer, String, DateTime, Text, ForeignKey, Index, event
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from app.core.money import MINOR_UNITS, from_minor, to_minor
 from app.database import Base
 
+# 64-bit ids so sharded stores can use snowflake ids; SQLite only
+# autoincrements a plain INTEGER primary key
+OrderId = BigInteger().with_variant(Integer, "sqlite")
+
+def money_property(minor_attr: str) -> hybrid_property:
+    """Decimal view over an integer minor-units column, for the API layer"""
+    def fget(self):
+        return from_minor(getattr(self, minor_attr))
+
+    def fset(self, value):
+        setattr(self, minor_attr, None if value is None else to_minor(value))
+
+    def expr(cls):
+        return getattr(cls, minor_attr) / float(MINOR_UNITS)
+
+    return hybrid_property(fget, fset, expr=expr)
+
 class Product(Base):
     __tablename__ = "products"
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
-    price = Column(Float, nullable=False)
+    price_minor = Column(BigInteger, nullable=False)
     stock = Column(Integer, nullable=False, default=0)
+    # Units held by active reservations; only stock - reserved can be sold
+    reserved = Column(Integer, nullable=False, default=0, server_default="0")
+    # A low-stock alert fires when available units drop to this; NULL disables it
+    reorder_point = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     order_items = relationship("OrderItem", back_populates="product")
+    
+    price = money_property("price_minor")
+    
+    @property
+    def available(self) -> int:
+        return self.stock - (self.reserved or 0)
 
 class Order(Base):
     __tablename__ = "orders"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(OrderId, primary_key=True, index=True)
     idempotency_key = Column(String(255), unique=True, nullable=False, index=True)
-    total_amount = Column(Float, nullable=False)
+    total_amount_minor = Column(BigInteger, nullable=False)
+    status = Column(String(20), nullable=False, default="placed", server_default="placed")  # placed | cancelled
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
+    
+    total_amount = money_property("total_amount_minor")
+
+class OrderStatusChange(Base):
+    """Audit trail of an order's status transitions, stored next to the order"""
+    __tablename__ = "order_status_changes"
+    
+    id = Column(Integer, primary_key=True)
+    order_id = Column(OrderId, ForeignKey("orders.id"), nullable=False, index=True)
+    from_status = Column(String(20), nullable=False)
+    to_status = Column(String(20), nullable=False)
+    reason = Column(String(255), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class OrderItem(Base):
     __tablename__ = "order_items"
     
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
+    order_id = Column(OrderId, ForeignKey("orders.id"), nullable=False)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     quantity = Column(Integer, nullable=False)
-    price = Column(Float, nullable=False)
+    price_minor = Column(BigInteger, nullable=False)
     
     order = relationship("Order", back_populates="items")
     product = relationship("Product", back_populates="order_items")
+    
+    price = money_property("price_minor")
+
+class ProductOrder(Base):
+    """Which orders contain a product: one row per (product, order).
+    
+    Denormalised from the order items and written in the same transaction
+    as the stock change, which is the central database even when orders
+    are sharded. "Orders containing product X" is then a range scan of
+    ``ix_product_orders_product_created`` however many orders exist.
+    """
+    __tablename__ = "product_orders"
+    
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    order_id = Column(OrderId, primary_key=True)  # no FK: the order may be on a shard
+    quantity = Column(Integer, nullable=False)  # summed over the order's lines for the product
+    price_minor = Column(BigInteger, nullable=False)
+    # Set client-side, so SQLite stores the same text format the keyset
+    # cursor binds (its CURRENT_TIMESTAMP has no fractional seconds)
+    created_at = Column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), server_default=func.now(), nullable=False
+    )
+
+class Reservation(Base):
+    __tablename__ = "reservations"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String(20), nullable=False, default="active")  # active | confirmed | released | expired
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    items = relationship("ReservationItem", back_populates="reservation", cascade="all, delete-orphan")
+
+class ReservationItem(Base):
+    __tablename__ = "reservation_items"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    reservation_id = Column(Integer, ForeignKey("reservations.id"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    
+    reservation = relationship("Reservation", back_populates="items")
+
+class OutboxEvent(Base):
+    """Event written in the same transaction as the change it describes.
+    
+    ``app.background.OutboxRelay`` moves rows to their Redis Stream and
+    deletes them, so the table only holds what has not been published yet.
+    """
+    __tablename__ = "outbox_events"
+    
+    id = Column(OrderId, primary_key=True)
+    stream = Column(String(64), nullable=False)
+    event_type = Column(String(64), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 # Create indexes for pagination
 Index('ix_orders_created_at_id', Order.created_at, Order.id)
+# Newest-first keyset pagination of a product's orders
+Index('ix_product_orders_product_created', ProductOrder.product_id, ProductOrder.created_at, ProductOrder.order_id)
+# Lets the expirer find stale holds without scanning settled ones
+Index('ix_reservations_status_expires_at', Reservation.status, Reservation.expires_at)
+# Keyset pagination for the product search sorts
+Index('ix_products_price_minor_id', Product.price_minor, Product.id)
+Index('ix_products_name_id', Product.name, Product.id)
+
+# Substring search on product names. PostgreSQL: a pg_trgm GIN index, which
+# serves ILIKE '%...%' directly. SQLite: an FTS5 trigram index kept in sync
+# by triggers (stock updates do not touch it, only name changes).
+PRODUCTS_FTS_TABLE = "products_fts"
+
+_POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (name gin_trgm_ops)",
+]
+
+SQLITE_SEARCH_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {PRODUCTS_FTS_TABLE} USING fts5("
+    f"name, content='products', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+    f"INSERT INTO {PRODUCTS_FTS_TABLE}(rowid, name) VALUES (new.id, new.name); END",
+    f"CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+    f"INSERT INTO {PRODUCTS_FTS_TABLE}({PRODUCTS_FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name); END",
+    f"CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name ON products BEGIN "
+    f"INSERT INTO {PRODUCTS_FTS_TABLE}({PRODUCTS_FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name); "
+    f"INSERT INTO {PRODUCTS_FTS_TABLE}(rowid, name) VALUES (new.id, new.name); END",
+]
+
+for _statement in _POSTGRES_SEARCH_DDL:
+    event.listen(Product.__table__, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+for _statement in SQLITE_SEARCH_DDL:
+    event.listen(Product.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+# The triggers go with the table; the external-content index does not
+event.listen(
+    Product.__table__, "after_drop",
+    DDL(f"DROP TABLE IF EXISTS {PRODUCTS_FTS_TABLE}").execute_if(dialect="sqlite"),
+)
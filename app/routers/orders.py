@@ -1,70 +1,142 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, status
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, status
 from sqlalchemy.orm import Session
 from typing import Optional
-from app import crud, schemas
-from app.dependencies import get_db, generate_idempotency_key
+from app import crud, schemas, serializers
+from app.core.admission import Overloaded
+from app.core.serialization import ORJSONResponse
+from app.dependencies import (
+    admission_error, generate_idempotency_key, get_checkout_db, get_checkout_lane, get_db, get_read_db,
+    rate_limit_orders,
+)
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
-@router.post("/", response_model=schemas.Order, status_code=status.HTTP_201_CREATED)
-def create_order(
+@router.post(
+    "/",
+    response_model=schemas.Order,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit_orders)],
+)
+async def create_order(
     order: schemas.OrderCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_checkout_db),
     idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     if not idempotency_key:
         idempotency_key = generate_idempotency_key()
-        print("generated key",idempotency_key)
     
+    # Runs on the checkout lane's threads, not the threadpool that serves
+    # reads; a full lane sheds the request with 503 instead of queueing it
+    lane = get_checkout_lane()
     try:
-        return crud.order_crud.create_with_items(
+        # Single-product orders may be combined with concurrent ones for the
+        # same product. Only the batch's write takes a lane slot
+        try:
+            order_id = await crud.get_order_crud().combine(order, idempotency_key, lane.run)
+        except ValueError as e:
+            raise _order_error(e)
+        if order_id is not None:
+            # Already committed: reading it back must not be shed
+            return await lane.offload(_placed_order, db, order_id)
+        return await lane.run(_place_order, db, order, idempotency_key)
+    except Overloaded as e:
+        raise admission_error(e, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+def _order_error(error: ValueError) -> HTTPException:
+    error_msg = str(error)
+    if "not found" in error_msg:
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=error_msg
+        )
+    elif "Insufficient stock" in error_msg:
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=error_msg
+        )
+    else:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=error_msg
+        )
+
+def _place_order(db: Session, order: schemas.OrderCreate, idempotency_key: str) -> ORJSONResponse:
+    try:
+        db_order = crud.get_order_crud().create_with_items(
             db=db, 
             order_data=order, 
             idempotency_key=idempotency_key
         )
+        # Encoded here, on the lane's thread: it may load the order's items
+        return ORJSONResponse(serializers.order_dict(db_order), status_code=status.HTTP_201_CREATED)
     except ValueError as e:
-        error_msg = str(e)
-        if "not found" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=error_msg
-            )
-        elif "Insufficient stock" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail=error_msg
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=error_msg
-            )
+        raise _order_error(e)
+    finally:
+        # Back to the pool before the thread is, see get_checkout_db
+        db.close()
+
+def _placed_order(db: Session, order_id: int) -> ORJSONResponse:
+    try:
+        db_order = crud.get_order_crud().get(db, order_id)
+        return ORJSONResponse(serializers.order_dict(db_order), status_code=status.HTTP_201_CREATED)
+    finally:
+        db.close()
 
 @router.get("/", response_model=schemas.PaginatedOrders)
 def read_orders(
     limit: int = 50,
     cursor: Optional[str] = None,
-    db: Session = Depends(get_db)
+    fields: Optional[str] = Query(
+        None, description="Comma-separated subset of order fields to return, e.g. id,total_amount"
+    ),
+    include: Optional[str] = Query(
+        None, description="Related data to embed; defaults to items, pass an empty value for none"
+    ),
+    db: Session = Depends(get_read_db)
 ):
     if limit > 100:
         limit = 100
     
-    orders, next_cursor, has_more = crud.order_crud.get_multi_paginated(
-        db, limit=limit, cursor=cursor
-    )
+    try:
+        fieldset = serializers.parse_fields(fields, serializers.ORDER_FIELDS)
+        includes = serializers.parse_include(include, serializers.ORDER_INCLUDES, default=("items",))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    include_items = "items" in includes
     
-    return schemas.PaginatedOrders(
-        orders=orders,
-        next_cursor=next_cursor,
-        has_more=has_more
+    page, next_cursor, has_more = crud.get_order_crud().get_multi_paginated_rows(
+        db, limit=limit, cursor=cursor, fields=fieldset, include_items=include_items
     )
+    
+    # Encoded directly; response_model only documents the shape
+    return ORJSONResponse({
+        "orders": [
+            serializers.order_dict(order, items, fields=fieldset, include_items=include_items)
+            for order, items in page
+        ],
+        "next_cursor": next_cursor,
+        "has_more": has_more
+    })
 
 @router.get("/{order_id}", response_model=schemas.Order)
-def read_order(order_id: int, db: Session = Depends(get_db)):
-    db_order = crud.order_crud.get(db, order_id=order_id)
-    if db_order is None:
+def read_order(order_id: int, db: Session = Depends(get_read_db)):
+    order = crud.get_order_crud().get_dict(db, order_id=order_id)
+    if order is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Order not found"
         )
-    return db_order
\ No newline at end of file
+    return ORJSONResponse(order)
+
+@router.post("/{order_id}/cancel", response_model=schemas.Order)
+def cancel_order(
+    order_id: int,
+    cancellation: Optional[schemas.OrderCancel] = None,
+    db: Session = Depends(get_db)
+):
+    """Cancel the order and restock its items; repeating the call is harmless"""
+    try:
+        db_order = crud.get_order_crud().cancel(db, order_id, reason=cancellation.reason if cancellation else None)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return ORJSONResponse(serializers.order_dict(db_order))
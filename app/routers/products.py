@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
-from typing import List
-from app import crud, schemas
-from app.dependencies import get_db
+from typing import List, Optional
+from app import catalogue, crud, schemas, serializers
+from app.core import http_cache
+from app.core.serialization import ORJSONResponse, dumps
+from app.database import is_replica
+from app.dependencies import get_db, get_read_db
 
 router = APIRouter(prefix="/products", tags=["products"])
 
@@ -13,23 +16,117 @@ def create_product(
 ):
     return crud.product_crud.create(db=db, product=product)
 
+def _catalogue_etag(version: Optional[str]) -> Optional[str]:
+    return http_cache.weak_etag(f"v{version}") if version else None
+
+def _body_etag(etag: Optional[str], db: Session) -> Optional[str]:
+    # A replica may not have caught up with the version yet: labelling its
+    # body with it would get the stale body revalidated until the next change
+    return None if is_replica(db) else etag
+
+def _conditional(
+    body: bytes, etag: Optional[str], if_none_match: Optional[str], headers: Optional[dict] = None
+) -> Response:
+    # Without a catalogue version the body itself is the validator: no DB
+    # time saved, but the client still skips the download
+    etag = etag or http_cache.body_etag(body)
+    if http_cache.etag_matches(if_none_match, etag):
+        return http_cache.not_modified(etag)
+    return http_cache.json_response(body, etag, headers)
+
+# Read endpoints return encoded responses directly; response_model only
+# documents the shape (see app.core.serialization). A matching
+# If-None-Match is answered with 304 before any query runs.
 @router.get("/", response_model=List[schemas.Product])
 def read_products(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    fields: Optional[str] = Query(
+        None, description="Comma-separated subset of fields to return, e.g. id,name,price,stock"
+    ),
+    search: schemas.ProductSearch = Depends(),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db)
 ):
-    return crud.product_crud.get_multi(db, skip=skip, limit=limit)
+    try:
+        fieldset = serializers.parse_fields(fields, serializers.PRODUCT_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    snapshot = catalogue.get_catalogue() if search.is_plain_listing() else None
+    if snapshot is not None:
+        page = snapshot.page(skip, limit, fieldset)
+        if page is not None:
+            # The snapshot may trail the shared catalogue version by a
+            # refresh, so the body hash is its validator
+            return _conditional(dumps(page), None, if_none_match)
+    
+    version = crud.product_crud.catalogue_version()
+    etag = _catalogue_etag(version)
+    if etag and http_cache.etag_matches(if_none_match, etag):
+        return http_cache.not_modified(etag)
+    
+    if search.is_plain_listing():
+        body = crud.product_crud.get_multi_json(db, skip=skip, limit=limit, fields=fieldset, version=version)
+        return _conditional(body, _body_etag(etag, db), if_none_match)
+    
+    try:
+        body, next_cursor = crud.product_crud.search_json(
+            db, search, skip=skip, limit=limit, fields=fieldset, version=version
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # The body stays a plain list; the keyset cursor travels in a header
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return _conditional(body, _body_etag(etag, db), if_none_match, headers)
 
 @router.get("/{product_id}", response_model=schemas.Product)
-def read_product(product_id: int, db: Session = Depends(get_db)):
-    db_product = crud.product_crud.get(db, product_id=product_id)
-    if db_product is None:
+def read_product(
+    product_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db)
+):
+    snapshot = catalogue.get_catalogue()
+    if snapshot is not None:
+        product = snapshot.get(product_id)
+        if product is not None:
+            return _conditional(dumps(product), None, if_none_match)
+        # Possibly created after the last refresh: ask the database
+    
+    version = crud.product_crud.catalogue_version()
+    etag = _catalogue_etag(version)
+    if etag and http_cache.etag_matches(if_none_match, etag):
+        return http_cache.not_modified(etag)
+    body = crud.product_crud.get_json(db, product_id, version=version)
+    if body is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Product not found"
         )
-    return db_product
+    return _conditional(body, _body_etag(etag, db), if_none_match)
+
+@router.get("/{product_id}/orders", response_model=schemas.PaginatedProductOrders)
+def read_product_orders(
+    product_id: int,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Orders containing the product, newest first (recalls, support)"""
+    if crud.product_crud.get(db, product_id=product_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    try:
+        rows, next_cursor = crud.product_crud.get_orders_page(db, product_id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return ORJSONResponse({
+        "orders": [serializers.product_order_dict(row) for row in rows],
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None,
+    })
 
 @router.put("/{product_id}", response_model=schemas.Product)
 def update_product(
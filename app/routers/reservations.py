@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from app import crud, schemas
+from app.dependencies import get_db
+
+router = APIRouter(prefix="/reservations", tags=["reservations"])
+
+def _raise_for(error: ValueError):
+    error_msg = str(error)
+    if "not found" in error_msg:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=error_msg)
+    elif "Insufficient stock" in error_msg or "Reservation" in error_msg:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=error_msg)
+    else:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error_msg)
+
+@router.post("/", response_model=schemas.Reservation, status_code=status.HTTP_201_CREATED)
+def create_reservation(
+    reservation: schemas.ReservationCreate,
+    db: Session = Depends(get_db)
+):
+    try:
+        return crud.reservation_crud.create(db, reservation)
+    except ValueError as e:
+        _raise_for(e)
+
+@router.get("/{reservation_id}", response_model=schemas.Reservation)
+def read_reservation(reservation_id: int, db: Session = Depends(get_db)):
+    db_reservation = crud.reservation_crud.get(db, reservation_id)
+    if db_reservation is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Reservation not found"
+        )
+    return db_reservation
+
+@router.post("/{reservation_id}/confirm", response_model=schemas.Order, status_code=status.HTTP_201_CREATED)
+def confirm_reservation(reservation_id: int, db: Session = Depends(get_db)):
+    try:
+        return crud.reservation_crud.confirm(db, reservation_id)
+    except ValueError as e:
+        _raise_for(e)
+
+@router.delete("/{reservation_id}", response_model=schemas.Reservation)
+def release_reservation(reservation_id: int, db: Session = Depends(get_db)):
+    try:
+        db_reservation = crud.reservation_crud.release(db, reservation_id)
+    except ValueError as e:
+        _raise_for(e)
+    if db_reservation is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Reservation not found"
+        )
+    return db_reservation
@@ -1,11 +1,23 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Literal, Optional
 from datetime import datetime
+from app.core.money import to_minor
+
+def _check_price(value: Optional[float]) -> Optional[float]:
+    # Prices are stored in minor units, so they must survive the rounding
+    if value is not None and to_minor(value) <= 0:
+        raise ValueError("price must be at least one minor unit (0.01)")
+    return value
 
 class ProductBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=255)
     price: float = Field(..., gt=0)
     stock: int = Field(..., ge=0)
+    reorder_point: Optional[int] = Field(
+        None, ge=0, description="Emit a low-stock alert when available units drop to this"
+    )
+    
+    _price_in_minor_units = field_validator("price")(_check_price)
 
 class ProductCreate(ProductBase):
     pass
@@ -14,15 +26,37 @@ class ProductUpdate(BaseModel):
     name: Optional[str] = Field(None, min_length=1, max_length=255)
     price: Optional[float] = Field(None, gt=0)
     stock: Optional[int] = Field(None, ge=0)
+    reorder_point: Optional[int] = Field(None, ge=0)
+    
+    _price_in_minor_units = field_validator("price")(_check_price)
 
 class Product(ProductBase):
     id: int
+    price_minor: int
+    reserved: int = 0
+    available: int
     created_at: datetime
     updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
 
+ProductSort = Literal["id", "price", "-price", "name", "-name"]
+
+class ProductSearch(BaseModel):
+    """Filters and ordering for ``GET /products/``; all optional"""
+    q: Optional[str] = Field(None, min_length=1, max_length=255, description="Substring of the name")
+    name_prefix: Optional[str] = Field(None, min_length=1, max_length=255)
+    min_price: Optional[float] = Field(None, ge=0)
+    max_price: Optional[float] = Field(None, ge=0)
+    in_stock: Optional[bool] = Field(None, description="Only products with available units")
+    sort: ProductSort = "id"
+    cursor: Optional[str] = Field(None, description="X-Next-Cursor of the previous page")
+    
+    def is_plain_listing(self) -> bool:
+        """True for the unfiltered catalogue, which is served from the cache"""
+        return self == ProductSearch()
+
 class OrderItemCreate(BaseModel):
     product_id: int = Field(..., gt=0)
     quantity: int = Field(..., gt=0)
@@ -32,6 +66,7 @@ class OrderItem(BaseModel):
     product_id: int
     quantity: int
     price: float
+    price_minor: int
     
     class Config:
         from_attributes = True
@@ -39,10 +74,15 @@ class OrderItem(BaseModel):
 class OrderCreate(BaseModel):
     items: List[OrderItemCreate] = Field(..., min_length=1)
 
+class OrderCancel(BaseModel):
+    reason: Optional[str] = Field(None, max_length=255)
+
 class Order(BaseModel):
     id: int
     idempotency_key: str
     total_amount: float
+    total_amount_minor: int
+    status: str
     created_at: datetime
     items: List[OrderItem]
     
@@ -52,4 +92,38 @@ class Order(BaseModel):
 class PaginatedOrders(BaseModel):
     orders: List[Order]
     next_cursor: Optional[str] = None
-    has_more: bool
\ No newline at end of file
+    has_more: bool
+
+class ProductOrder(BaseModel):
+    """An order containing the product, with the product's line in it"""
+    order_id: int
+    quantity: int
+    price: float
+    price_minor: int
+    created_at: datetime
+
+class PaginatedProductOrders(BaseModel):
+    orders: List[ProductOrder]
+    next_cursor: Optional[str] = None
+    has_more: bool
+
+class ReservationCreate(BaseModel):
+    items: List[OrderItemCreate] = Field(..., min_length=1)
+    ttl_seconds: int = Field(300, gt=0, le=3600)
+
+class ReservationItem(BaseModel):
+    product_id: int
+    quantity: int
+    
+    class Config:
+        from_attributes = True
+
+class Reservation(BaseModel):
+    id: int
+    status: str
+    expires_at: datetime
+    created_at: datetime
+    items: List[ReservationItem]
+    
+    class Config:
+        from_attributes = True
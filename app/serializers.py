@@ -0,0 +1,132 @@
+"""Fast-path JSON shapes for the hot read endpoints.
+
+Each extractor produces exactly what the matching pydantic schema would
+dump (same fields, same order), and accepts either an ORM instance or a
+``Row`` from the column projections below.
+
+List endpoints also accept sparse fieldsets (``?fields=id,name,price``).
+A fieldset maps to the columns it actually reads, so the SQL selects only
+those, and to an extractor compiled for exactly that shape. Both are
+cached per fieldset.
+"""
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from app import models, schemas
+from app.core.money import from_minor
+from app.core.serialization import FieldSpec, compile_extractor
+
+# Output field -> (how to read it, columns it needs)
+_PRODUCT_FIELDS: Dict[str, Tuple[FieldSpec, tuple]] = {
+    "name": ("name", (models.Product.name,)),
+    "price": (lambda p: from_minor(p.price_minor), (models.Product.price_minor,)),
+    "stock": ("stock", (models.Product.stock,)),
+    "reorder_point": ("reorder_point", (models.Product.reorder_point,)),
+    "id": ("id", (models.Product.id,)),
+    "price_minor": ("price_minor", (models.Product.price_minor,)),
+    "reserved": (lambda p: p.reserved or 0, (models.Product.reserved,)),
+    "available": (lambda p: p.stock - (p.reserved or 0), (models.Product.stock, models.Product.reserved)),
+    "created_at": ("created_at", (models.Product.created_at,)),
+    "updated_at": ("updated_at", (models.Product.updated_at,)),
+}
+
+_ORDER_FIELDS: Dict[str, Tuple[FieldSpec, tuple]] = {
+    "id": ("id", (models.Order.id,)),
+    "idempotency_key": ("idempotency_key", (models.Order.idempotency_key,)),
+    "total_amount": (lambda o: from_minor(o.total_amount_minor), (models.Order.total_amount_minor,)),
+    "total_amount_minor": ("total_amount_minor", (models.Order.total_amount_minor,)),
+    "status": ("status", (models.Order.status,)),
+    "created_at": ("created_at", (models.Order.created_at,)),
+}
+
+PRODUCT_FIELDS = tuple(schemas.Product.model_fields)
+ORDER_FIELDS = tuple(name for name in schemas.Order.model_fields if name != "items")
+ORDER_INCLUDES = ("items",)
+
+ORDER_ITEM_COLUMNS = (
+    models.OrderItem.id,
+    models.OrderItem.order_id,
+    models.OrderItem.product_id,
+    models.OrderItem.quantity,
+    models.OrderItem.price_minor,
+)
+
+def parse_fields(raw: Optional[str], allowed: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Turn ``"name,id"`` into a canonical fieldset in schema order.
+
+    ``None`` means every field. The canonical order makes equal fieldsets
+    share one cached projection, extractor and cache key.
+    """
+    if raw is None:
+        return allowed
+    requested = {name.strip() for name in raw.split(",") if name.strip()}
+    unknown = requested.difference(allowed)
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(sorted(unknown))}. Allowed: {', '.join(allowed)}")
+    if not requested:
+        raise ValueError("fields must name at least one field")
+    return tuple(name for name in allowed if name in requested)
+
+def parse_include(raw: Optional[str], allowed: Tuple[str, ...], default: Tuple[str, ...]) -> Tuple[str, ...]:
+    """``None`` keeps ``default``; an empty string includes nothing"""
+    if raw is None:
+        return default
+    return parse_fields(raw, allowed) if raw.strip() else ()
+
+def _columns(table: Dict[str, Tuple[FieldSpec, tuple]], fields: Iterable[str], always: tuple = ()) -> tuple:
+    columns = list(always)
+    for name in fields:
+        for column in table[name][1]:
+            if not any(column is c for c in columns):
+                columns.append(column)
+    return tuple(columns)
+
+@lru_cache(maxsize=128)
+def product_columns(fields: Tuple[str, ...] = PRODUCT_FIELDS) -> tuple:
+    return _columns(_PRODUCT_FIELDS, fields)
+
+@lru_cache(maxsize=128)
+def product_extractor(fields: Tuple[str, ...] = PRODUCT_FIELDS):
+    return compile_extractor({name: _PRODUCT_FIELDS[name][0] for name in fields}, name="product_dict")
+
+@lru_cache(maxsize=128)
+def order_columns(fields: Tuple[str, ...] = ORDER_FIELDS) -> tuple:
+    # Keyset pagination and the item lookup need these whatever is returned
+    return _columns(_ORDER_FIELDS, fields, always=(models.Order.id, models.Order.created_at))
+
+@lru_cache(maxsize=128)
+def order_extractor(fields: Tuple[str, ...] = ORDER_FIELDS):
+    return compile_extractor({name: _ORDER_FIELDS[name][0] for name in fields}, name="order_fields")
+
+product_dict = product_extractor()
+
+order_item_dict = compile_extractor({
+    "id": "id",
+    "product_id": "product_id",
+    "quantity": "quantity",
+    "price": lambda i: from_minor(i.price_minor),
+    "price_minor": "price_minor",
+}, name="order_item_dict")
+
+product_order_dict = compile_extractor({
+    "order_id": "order_id",
+    "quantity": "quantity",
+    "price": lambda o: from_minor(o.price_minor),
+    "price_minor": "price_minor",
+    "created_at": "created_at",
+}, name="product_order_dict")
+
+def order_dict(
+    order: Any,
+    items: Optional[Iterable[Any]] = None,
+    fields: Tuple[str, ...] = ORDER_FIELDS,
+    include_items: bool = True,
+) -> dict:
+    """``items`` defaults to ``order.items`` for ORM instances"""
+    data = order_extractor(fields)(order)
+    if include_items:
+        data["items"] = [order_item_dict(item) for item in (order.items if items is None else items)]
+    return data
+
+def product_list(products: Iterable[Any], fields: Tuple[str, ...] = PRODUCT_FIELDS) -> List[dict]:
+    extract = product_extractor(fields)
+    return [extract(product) for product in products]
@@ -0,0 +1,21 @@
+"""Gunicorn worker class for the production profile (see ``gunicorn.conf.py``)."""
+from uvicorn.workers import UvicornWorker
+
+# Seconds kept back from gunicorn's graceful_timeout so the lifespan shutdown
+# (stopping background workers, closing the pool) still runs after draining
+_SHUTDOWN_HEADROOM = 5
+
+class ProductionUvicornWorker(UvicornWorker):
+    """Uvicorn worker pinned to uvloop/httptools that drains before exiting.
+
+    On SIGTERM the worker stops accepting connections and lets in-flight
+    requests (orders included) finish for up to ``graceful_timeout`` minus a
+    few seconds; only then are the stragglers cancelled, which rolls their
+    transactions back rather than leaving them half applied.
+    """
+
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config.timeout_graceful_shutdown = max(1, self.cfg.graceful_timeout - _SHUTDOWN_HEADROOM)
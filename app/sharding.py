@@ -0,0 +1,306 @@
+"""Optional sharded order store.
+
+Orders and their items are spread over N databases by a hash of the
+idempotency key, so retries of the same request always land on the shard
+that holds the original order. Products (and therefore stock) stay on the
+central database behind the ``db`` session the routers already pass in.
+"""
+from sqlalchemy import MetaData, desc
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload, sessionmaker
+from typing import List, Optional, Tuple
+import heapq
+import logging
+import threading
+import time
+import zlib
+from app import events, models, schemas, serializers
+from app.crud import OrderCRUD, order_cache, product_crud, record_product_orders
+from app.database import _create_engine
+
+logger = logging.getLogger(__name__)
+
+# What a shard holds; products and everything else stay central
+SHARD_TABLES = (models.Order.__table__, models.OrderItem.__table__, models.OrderStatusChange.__table__)
+
+def shard_metadata() -> MetaData:
+    """The shard tables without their foreign keys to central tables.
+
+    ``order_items.product_id`` references ``products``, which a shard does
+    not have: PostgreSQL refuses such a constraint. Create shard schemas
+    from this (``shard_metadata().create_all(engine)``), not ``Base.metadata``.
+    """
+    metadata = MetaData()
+    names = {table.name for table in SHARD_TABLES}
+    for table in SHARD_TABLES:
+        copy = table.to_metadata(metadata)
+        for constraint in list(copy.foreign_key_constraints):
+            if constraint.elements[0].target_fullname.split(".")[0] not in names:
+                copy.constraints.discard(constraint)
+                for foreign_key in constraint.elements:
+                    foreign_key.parent.foreign_keys.discard(foreign_key)
+                    copy.foreign_keys.discard(foreign_key)
+    return metadata
+
+class SnowflakeIdGenerator:
+    """Time-ordered 63-bit ids that carry the shard they were created on.
+
+    Layout: 41 bits of milliseconds since ``EPOCH_MS`` | 10 bits sequence |
+    6 bits worker | 6 bits shard. The shard sits in the low bits so ids from
+    one generator are strictly increasing whichever shard they go to; distinct
+    workers must use distinct ``worker_id`` values.
+    """
+
+    EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+    SHARD_BITS = 6
+    WORKER_BITS = 6
+    SEQUENCE_BITS = 10
+
+    MAX_SHARDS = 1 << SHARD_BITS
+    MAX_WORKERS = 1 << WORKER_BITS
+    _SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+    _WORKER_SHIFT = SHARD_BITS
+    _SEQUENCE_SHIFT = SHARD_BITS + WORKER_BITS
+    _TIME_SHIFT = SHARD_BITS + WORKER_BITS + SEQUENCE_BITS
+
+    def __init__(self, worker_id: int = 0):
+        if not 0 <= worker_id < self.MAX_WORKERS:
+            raise ValueError(f"worker_id must be in [0, {self.MAX_WORKERS})")
+        self.worker_id = worker_id
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_id(self, shard_id: int) -> int:
+        with self._lock:
+            now_ms = max(int(time.time() * 1000) - self.EPOCH_MS, self._last_ms)
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & self._SEQUENCE_MASK
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond, borrow the next one
+                    now_ms += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+            return (
+                (now_ms << self._TIME_SHIFT)
+                | (self._sequence << self._SEQUENCE_SHIFT)
+                | (self.worker_id << self._WORKER_SHIFT)
+                | shard_id
+            )
+
+    @classmethod
+    def shard_of(cls, snowflake_id: int) -> int:
+        return snowflake_id & (cls.MAX_SHARDS - 1)
+
+
+class ShardedOrderCRUD(OrderCRUD):
+    # Tries at inserting an order whose fresh id another process minted too
+    ID_ATTEMPTS = 3
+
+    def __init__(self, shard_urls: List[str], worker_id: int = 0):
+        if not 0 < len(shard_urls) <= SnowflakeIdGenerator.MAX_SHARDS:
+            raise ValueError(f"Between 1 and {SnowflakeIdGenerator.MAX_SHARDS} order shards are supported")
+        super().__init__()
+        self.shard_urls = shard_urls
+        self.shard_sessions = [
+            sessionmaker(autocommit=False, autoflush=False, bind=_create_engine(url))
+            for url in shard_urls
+        ]
+        self.ids = SnowflakeIdGenerator(worker_id)
+
+    def shard_for_key(self, idempotency_key: str) -> int:
+        # crc32 rather than hash(): it must be stable across processes
+        return zlib.crc32(idempotency_key.encode()) % len(self.shard_sessions)
+
+    def _load(self, shard_id: int, *criteria) -> Optional[models.Order]:
+        shard = self.shard_sessions[shard_id]()
+        try:
+            order = shard.query(models.Order).options(
+                selectinload(models.Order.items)
+            ).filter(*criteria).first()
+            if order is not None:
+                shard.expunge(order)
+            return order
+        finally:
+            shard.close()
+
+    def get(self, db: Session, order_id: int) -> Optional[models.Order]:
+        shard_id = SnowflakeIdGenerator.shard_of(order_id)
+        if shard_id >= len(self.shard_sessions):
+            return None
+        return self._load(shard_id, models.Order.id == order_id)
+
+    def reads_primary(self, db: Session) -> bool:
+        # Orders are read from the shards, never through db's replica
+        return True
+
+    def get_by_idempotency_key(self, db: Session, idempotency_key: str) -> Optional[models.Order]:
+        return self._load(
+            self.shard_for_key(idempotency_key),
+            models.Order.idempotency_key == idempotency_key,
+        )
+
+    def get_multi_paginated(
+        self,
+        db: Session,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[models.Order], Optional[str], bool]:
+        # Scatter: every shard returns its own newest limit + 1 orders after
+        # the cursor. Gather: merge the already sorted streams and keep the
+        # global newest limit + 1.
+        # Newest by snowflake id alone: created_at comes from each shard's
+        # clock and need not agree with the ids, so a (created_at, id)
+        # keyset would skip orders. The id embeds when it was minted.
+        cursor_id = self._cursor_id(cursor)
+        streams = []
+        for shard_factory in self.shard_sessions:
+            shard = shard_factory()
+            try:
+                query = shard.query(models.Order).options(
+                    selectinload(models.Order.items)
+                ).order_by(desc(models.Order.id))
+                if cursor_id is not None:
+                    query = query.filter(models.Order.id < cursor_id)
+                orders = query.limit(limit + 1).all()
+                shard.expunge_all()
+            finally:
+                shard.close()
+            streams.append(orders)
+
+        merged = heapq.merge(*streams, key=lambda o: o.id, reverse=True)
+        page = [order for _, order in zip(range(limit + 1), merged)]
+        return self._paginate(page, limit)
+
+    @staticmethod
+    def _cursor_id(cursor: Optional[str]) -> Optional[int]:
+        # Same "timestamp_id" cursors as OrderCRUD; only the id is used
+        if not cursor:
+            return None
+        try:
+            return int(cursor.rsplit("_", 1)[1])
+        except (IndexError, ValueError):
+            # Invalid cursor, ignore
+            return None
+
+    def get_multi_paginated_rows(
+        self,
+        db: Session,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        fields: Tuple[str, ...] = serializers.ORDER_FIELDS,
+        include_items: bool = True
+    ) -> Tuple[List[Tuple[models.Order, List[models.OrderItem]]], Optional[str], bool]:
+        # The scatter-gather already loads items eagerly; reuse its instances.
+        # Full rows either way: the extractor picks the requested fields.
+        orders, next_cursor, has_more = self.get_multi_paginated(db, limit=limit, cursor=cursor)
+        return [(order, order.items if include_items else []) for order in orders], next_cursor, has_more
+
+    def create_with_items(
+        self,
+        db: Session,
+        order_data: schemas.OrderCreate,
+        idempotency_key: str,
+        reservation: Optional[models.Reservation] = None
+    ) -> models.Order:
+        existing_order = self.get_by_idempotency_key(db, idempotency_key)
+        if existing_order:
+            return existing_order
+
+        shard_id = self.shard_for_key(idempotency_key)
+        shard = self.shard_sessions[shard_id]()
+        try:
+            for attempt in range(1, self.ID_ATTEMPTS + 1):
+                # Stock is locked and decremented on the central database, but
+                # only committed once the order is durable on its shard
+                total_amount, order_items_data = self._reserve_stock(db, order_data, reservation)
+
+                db_order = models.Order(
+                    id=self.ids.next_id(shard_id),
+                    idempotency_key=idempotency_key,
+                    total_amount_minor=total_amount,
+                    items=[models.OrderItem(**item_data) for item_data in order_items_data],
+                )
+                shard.add(db_order)
+                try:
+                    shard.commit()
+                    break
+                except IntegrityError:
+                    shard.rollback()
+                    db.rollback()
+                    # Lost the race against a concurrent request with the same key
+                    existing_order = self.get_by_idempotency_key(db, idempotency_key)
+                    if existing_order:
+                        return existing_order
+                    # Otherwise the id was taken: a process with the same
+                    # worker id minted it too. Start over with a fresh one
+                    if attempt == self.ID_ATTEMPTS:
+                        raise
+                    logger.warning(
+                        "Order id %s already exists on shard %s; check SNOWFLAKE_WORKER_ID is unique",
+                        db_order.id, shard_id,
+                    )
+
+            # The product index and the outbox live on the central database,
+            # committed with the stock
+            record_product_orders(db, db_order.id, order_items_data)
+            events.record_order_created(db, db_order.id, total_amount, (
+                (item["product_id"], item["quantity"], item["price_minor"]) for item in order_items_data
+            ))
+            try:
+                db.commit()
+            except Exception:
+                db.rollback()
+                # Compensate so the shard never holds an order without stock
+                shard.delete(db_order)
+                shard.commit()
+                raise
+
+            order_id = db_order.id
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            shard.close()
+
+        # Invalidate product cache since stock changed
+        product_crud._invalidate_products_cache(item["product_id"] for item in order_items_data)
+
+        return self.get(db, order_id)
+
+    def cancel(self, db: Session, order_id: int, reason: Optional[str] = None) -> models.Order:
+        shard_id = SnowflakeIdGenerator.shard_of(order_id)
+        if shard_id >= len(self.shard_sessions):
+            raise ValueError(f"Order with id {order_id} not found")
+        shard = self.shard_sessions[shard_id]()
+        try:
+            if not self._change_status(shard, order_id, "placed", "cancelled", reason):
+                shard.rollback()
+                return self._existing(db, order_id)
+            restocked = self._ordered_quantities(shard, order_id)
+            # The order is cancelled before its units go back: a failure in
+            # between can leave stock unsold, never sold twice
+            shard.commit()
+            try:
+                self._restock(db, restocked)
+                events.record_order_cancelled(db, order_id, restocked, reason)
+                db.commit()
+            except Exception:
+                db.rollback()
+                # Compensate, so a retry restocks the order
+                self._change_status(shard, order_id, "cancelled", "placed", "restock failed")
+                shard.commit()
+                # A read in between may have cached it as cancelled, in
+                # Redis and in any worker's memory
+                order_cache().invalidate([order_id])
+                raise
+        except Exception:
+            shard.rollback()
+            raise
+        finally:
+            shard.close()
+
+        product_crud._invalidate_products_cache(restocked)
+        return self._recache(db, order_id)
+
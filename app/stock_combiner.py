@@ -0,0 +1,257 @@
+"""Request-coalescing write combiner for single-product orders.
+
+Under a flash sale hundreds of requests queue on the same product row lock,
+each paying for its own transaction. The combiner parks concurrent orders
+for the same product for a few milliseconds and then lets one of them (the
+leader) apply the whole group: one row lock, one stock UPDATE, one commit.
+Each request then gets its own order id or 409-style error back.
+
+``submit_async`` is the entry point for the event loop. There only the
+leader's write needs a thread, and the followers wait without one. A
+batch is then not capped by the number of threads the caller can spare.
+"""
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import threading
+import time
+import anyio
+from app import events, models
+from app.core import metrics
+from app.database import lock_rows
+
+logger = logging.getLogger(__name__)
+
+combined_batch_size = metrics.registry.histogram(
+    "stock_combiner_batch_size",
+    "Orders applied by one combined stock write",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+
+class _PendingOrder:
+    __slots__ = ("idempotency_key", "quantity", "done", "wakeup", "order_id", "error", "fallback")
+
+    def __init__(self, idempotency_key: str, quantity: int, wakeup: Optional[Callable[[], None]] = None):
+        self.idempotency_key = idempotency_key
+        self.quantity = quantity
+        self.done = threading.Event()
+        # Set by waiters on an event loop; called from whichever thread finishes the batch
+        self.wakeup = wakeup
+        self.order_id: Optional[int] = None
+        self.error: Optional[Exception] = None
+        self.fallback = False
+
+    def finish(self):
+        self.done.set()
+        if self.wakeup is not None:
+            self.wakeup()
+
+    def result(self) -> Optional[int]:
+        if self.error is not None:
+            raise self.error
+        if self.fallback:
+            return None
+        return self.order_id
+
+
+class StockWriteCombiner:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        window_ms: float = 2.0,
+        max_batch: int = 200,
+        on_commit: Optional[Callable[[List[int]], None]] = None,
+    ):
+        self.session_factory = session_factory
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.on_commit = on_commit
+        self._pending: Dict[int, List[_PendingOrder]] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, product_id: int, pending: _PendingOrder) -> Tuple[bool, List[_PendingOrder]]:
+        """Add ``pending`` to the product's open batch; the first one in leads it"""
+        with self._lock:
+            batch = self._pending.get(product_id)
+            leader = batch is None
+            if leader:
+                batch = self._pending[product_id] = []
+            batch.append(pending)
+            if len(batch) >= self.max_batch:
+                # Full: later arrivals start a new batch with a new leader
+                del self._pending[product_id]
+        return leader, batch
+
+    def _close(self, product_id: int, batch: List[_PendingOrder]):
+        with self._lock:
+            if self._pending.get(product_id) is batch:
+                del self._pending[product_id]
+
+    def submit(self, product_id: int, quantity: int, idempotency_key: str) -> Optional[int]:
+        """Place a one-product order through the combiner.
+
+        Returns the id of the (new or already existing) order, raises
+        ValueError like ``OrderCRUD.create_with_items`` does, or returns None
+        when the caller should fall back to the regular checkout path.
+        """
+        pending = _PendingOrder(idempotency_key, quantity)
+        leader, batch = self._join(product_id, pending)
+        if leader:
+            time.sleep(self.window)
+            self._close(product_id, batch)
+            self._apply(product_id, batch)
+        else:
+            pending.done.wait()
+        return pending.result()
+
+    async def submit_async(
+        self,
+        product_id: int,
+        quantity: int,
+        idempotency_key: str,
+        run: Callable[..., Awaitable],
+    ) -> Optional[int]:
+        """``submit`` from the event loop.
+
+        ``run(func, *args)`` runs a blocking call, e.g. on the checkout
+        lane. Only the leader's combined write goes through it, and
+        followers wait for their batch without holding a thread.
+        """
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+
+        def wake():
+            # Requests may run on different loops (one per TestClient call)
+            loop.call_soon_threadsafe(lambda: woken.done() or woken.set_result(None))
+
+        pending = _PendingOrder(idempotency_key, quantity, wakeup=wake)
+        leader, batch = self._join(product_id, pending)
+        if leader:
+            await anyio.sleep(self.window)
+            self._close(product_id, batch)
+            try:
+                await run(self._apply, product_id, batch)
+            except BaseException:
+                # The write never ran (the lane shed it, or the leader was
+                # cancelled); the followers place their orders on their own
+                for other in batch:
+                    if not other.done.is_set():
+                        other.fallback = True
+                        other.finish()
+                raise
+        else:
+            await woken
+        return pending.result()
+
+    def _apply(self, product_id: int, batch: List[_PendingOrder]):
+        combined_batch_size.observe(len(batch))
+        db = self.session_factory()
+        try:
+            self._apply_in(db, product_id, batch)
+        except IntegrityError:
+            # An idempotency key raced with a request outside this batch;
+            # let every undecided request redo its order on its own
+            db.rollback()
+            for pending in batch:
+                if pending.error is None:
+                    pending.order_id = None
+                    pending.fallback = True
+        except Exception as e:
+            db.rollback()
+            logger.exception("Combined stock write for product %s failed", product_id)
+            for pending in batch:
+                if pending.order_id is None and pending.error is None:
+                    pending.error = e
+        finally:
+            db.close()
+            for pending in batch:
+                pending.finish()
+
+    def _apply_in(self, db: Session, product_id: int, batch: List[_PendingOrder]):
+        keys = {pending.idempotency_key for pending in batch}
+        existing = dict(
+            db.query(models.Order.idempotency_key, models.Order.id).filter(
+                models.Order.idempotency_key.in_(keys)
+            ).all()
+        )
+
+        # Requests that repeat a key (in the database or earlier in this
+        # batch) get the same order and must not take stock twice
+        to_create: Dict[str, _PendingOrder] = {}
+        duplicates = []
+        for pending in batch:
+            if pending.idempotency_key in existing or pending.idempotency_key in to_create:
+                duplicates.append(pending)
+            else:
+                to_create[pending.idempotency_key] = pending
+
+        product = None
+        if to_create:
+            lock_rows(db, models.Product.__table__, [product_id])
+            product = db.query(models.Product).filter(
+                models.Product.id == product_id
+            ).with_for_update().first()
+            if not product:
+                # Kept in to_create, so their duplicates get the same error
+                error = ValueError(f"Product with id {product_id} not found")
+                for pending in to_create.values():
+                    pending.error = error
+
+        granted = []
+        if product is not None:
+            available = product.available
+            for pending in to_create.values():
+                if pending.quantity <= available:
+                    available -= pending.quantity
+                    granted.append(pending)
+                else:
+                    pending.error = ValueError(
+                        f"Insufficient stock for product {product.name}. Available: {available}, Requested: {pending.quantity}"
+                    )
+
+        if granted:
+            # One UPDATE for the whole group, one commit for all its orders
+            was_low = events.is_low_stock(product)
+            product.stock -= sum(pending.quantity for pending in granted)
+            events.record_stock_change(db, product, was_low)
+            orders = [
+                models.Order(
+                    idempotency_key=pending.idempotency_key,
+                    total_amount_minor=product.price_minor * pending.quantity,
+                    items=[models.OrderItem(
+                        product_id=product_id,
+                        quantity=pending.quantity,
+                        price_minor=product.price_minor,
+                    )],
+                )
+                for pending in granted
+            ]
+            db.add_all(orders)
+            db.flush()
+            for pending, order in zip(granted, orders):
+                pending.order_id = order.id
+                existing[pending.idempotency_key] = order.id
+                db.add(models.ProductOrder(
+                    product_id=product_id,
+                    order_id=order.id,
+                    quantity=pending.quantity,
+                    price_minor=product.price_minor,
+                ))
+                events.record_order_created(
+                    db, order.id, order.total_amount_minor,
+                    [(product_id, pending.quantity, product.price_minor)],
+                )
+            db.commit()
+            if self.on_commit is not None:
+                self.on_commit([product_id])
+        else:
+            db.rollback()
+
+        for pending in duplicates:
+            original = to_create.get(pending.idempotency_key)
+            if original is not None and original.error is not None:
+                pending.error = original.error
+            else:
+                pending.order_id = existing[pending.idempotency_key]
@@ -0,0 +1,98 @@
+"""Hot-SKU checkout throughput with and without the stock write combiner.
+
+Runs the ``flash_sale`` scenario twice against the app with the checkout
+lane on: once with ``STOCK_COMBINER_ENABLED=false`` and once with it on.
+For each run it prints RPS and latency, and for the combined run the mean
+and largest batch, from ``stock_combiner_batch_size`` on ``/metrics``.
+Requests waiting for a batch hold no lane slot, so with more clients than
+``--lane`` slots the batches should grow past the lane's size.
+
+    python -m benchmarks.combiner
+    python -m benchmarks.combiner --clients 128 --lane 16 --window-ms 2
+
+SQLite serialises writers, which flatters the combiner; use
+``--database-url`` with PostgreSQL (and ``--reset-database``, since its
+tables are dropped) for numbers that carry over.
+"""
+from typing import Dict, List, Optional
+import argparse
+import json
+import sys
+import httpx
+from benchmarks.loadtest import DEFAULT_SCENARIOS, AppServer, LoadGenerator, load_scenarios, seed_products
+
+
+def batch_sizes(base_url: str) -> Dict[str, float]:
+    """Mean and upper bound of the largest batch, from the histogram's buckets"""
+    metrics = httpx.get(f"{base_url}/metrics", timeout=10).text
+    buckets: List[tuple] = []
+    total = count = 0.0
+    for line in metrics.splitlines():
+        if line.startswith("stock_combiner_batch_size_bucket"):
+            bound = line.split('le="', 1)[1].split('"', 1)[0]
+            buckets.append((float(bound), float(line.rsplit(" ", 1)[1])))
+        elif line.startswith("stock_combiner_batch_size_sum"):
+            total = float(line.rsplit(" ", 1)[1])
+        elif line.startswith("stock_combiner_batch_size_count"):
+            count = float(line.rsplit(" ", 1)[1])
+    largest = next((bound for bound, cumulative in buckets if cumulative >= count), 0.0) if count else 0.0
+    return {"batches": int(count), "mean_batch": round(total / count, 1) if count else 0.0, "max_batch_le": largest}
+
+
+def run(clients: int, lane: int, window_ms: float, duration: Optional[float] = None,
+        database_url: Optional[str] = None, redis_url: str = "",
+        reset_database: bool = False) -> Dict[str, dict]:
+    scenario = next(s for s in load_scenarios(DEFAULT_SCENARIOS) if s.name == "flash_sale")
+    scenario.concurrency = clients
+    # Enough stock that the run measures selling, not 409s
+    scenario.stock = 10_000_000
+    if duration:
+        scenario.duration_seconds = duration
+    results = {}
+    for combined in (False, True):
+        server = AppServer(
+            database_url=database_url,
+            redis_url=redis_url,
+            reset_database=reset_database,
+            extra_env={
+                "STOCK_COMBINER_ENABLED": str(combined).lower(),
+                "STOCK_COMBINER_WINDOW_MS": str(window_ms),
+                "CHECKOUT_CONCURRENCY": str(lane),
+                # Shedding would hide the difference in throughput
+                "CHECKOUT_QUEUE_SIZE": str(clients),
+                "CHECKOUT_QUEUE_TIMEOUT": "30",
+            },
+        )
+        with server:
+            product_ids = seed_products(server.base_url, scenario)
+            result = LoadGenerator(server.base_url, scenario, product_ids).run()
+            if combined:
+                result.update(batch_sizes(server.base_url))
+        results["combined" if combined else "uncombined"] = result
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=64, help="concurrent client threads")
+    parser.add_argument("--lane", type=int, default=16, help="CHECKOUT_CONCURRENCY")
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    parser.add_argument("--duration", type=float)
+    parser.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    parser.add_argument("--reset-database", action="store_true",
+                        help="drop and recreate the tables in --database-url (required with it)")
+    parser.add_argument("--redis-url", default="")
+    args = parser.parse_args(argv)
+
+    results = run(args.clients, args.lane, args.window_ms, args.duration, args.database_url, args.redis_url,
+                  args.reset_database)
+    for name, result in results.items():
+        print(f"{name}: {json.dumps(result)}")
+    uncombined = results["uncombined"]["rps"]
+    if uncombined:
+        print(f"speed-up x{results['combined']['rps'] / uncombined:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
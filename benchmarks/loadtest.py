@@ -0,0 +1,325 @@
+"""Load-test harness: run the real app under uvicorn and drive mixed workloads.
+
+Scenarios are replayable JSON lines (see ``scenarios.jsonl``). Each one seeds
+products, then ``concurrency`` client threads pick weighted request templates
+(or replay a recorded request file in order) for ``duration_seconds``.
+Latency percentiles and throughput per scenario are compared against a stored
+baseline, and a regression beyond the tolerance fails the run.
+
+    python -m benchmarks.loadtest                      # all scenarios vs baseline
+    python -m benchmarks.loadtest --scenario flash_sale
+    python -m benchmarks.loadtest --update-baseline    # record a new baseline
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import httpx
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCHMARKS_DIR.parent
+DEFAULT_SCENARIOS = BENCHMARKS_DIR / "scenarios.jsonl"
+DEFAULT_BASELINE = BENCHMARKS_DIR / "baseline.json"
+
+
+@dataclass
+class Scenario:
+    name: str
+    duration_seconds: float = 10.0
+    concurrency: int = 8
+    products: int = 100
+    stock: int = 1_000_000
+    mix: List[dict] = field(default_factory=list)
+    replay: Optional[str] = None
+    ok_statuses: List[int] = field(default_factory=lambda: [200, 201])
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Scenario":
+        return cls(**data)
+
+
+def load_scenarios(path: Path) -> List[Scenario]:
+    with open(path) as f:
+        return [Scenario.from_dict(json.loads(line)) for line in f if line.strip()]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile; ``samples`` must be sorted"""
+    if not samples:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(samples))
+    return samples[min(max(rank, 1), len(samples)) - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    total = len(latencies)
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def compare_to_baseline(
+    results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float
+) -> List[str]:
+    """Return a human-readable line per regression beyond ``tolerance``"""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        # p99 rests on few samples, so it gets twice the slack
+        for metric, slack in (("p95_ms", tolerance), ("p99_ms", 2 * tolerance)):
+            limit = expected[metric] * (1 + slack)
+            if result[metric] > limit:
+                regressions.append(f"{name}: {metric} {result[metric]} > {limit:.2f} (baseline {expected[metric]})")
+        floor = expected["rps"] * (1 - tolerance)
+        if result["rps"] < floor:
+            regressions.append(f"{name}: rps {result['rps']} < {floor:.1f} (baseline {expected['rps']})")
+        if result["errors"] > expected.get("errors", 0):
+            regressions.append(f"{name}: {result['errors']} unexpected errors (baseline {expected.get('errors', 0)})")
+    return regressions
+
+
+def _render(template, context: dict):
+    if isinstance(template, str):
+        if template.startswith("{") and template.endswith("}") and template[1:-1] in context:
+            return context[template[1:-1]]
+        return template.format(**context)
+    if isinstance(template, list):
+        return [_render(item, context) for item in template]
+    if isinstance(template, dict):
+        return {key: _render(value, context) for key, value in template.items()}
+    return template
+
+
+class LoadGenerator:
+    def __init__(self, base_url: str, scenario: Scenario, product_ids: List[int]):
+        self.base_url = base_url
+        self.scenario = scenario
+        self.product_ids = product_ids
+        self.latencies: List[float] = []
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._replay = self._load_replay()
+
+    def _load_replay(self) -> Optional[Iterator[dict]]:
+        if not self.scenario.replay:
+            return None
+        path = Path(self.scenario.replay)
+        if not path.is_absolute():
+            path = BENCHMARKS_DIR / path
+        with open(path) as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        return iter(requests)
+
+    def _next_request(self, rng: random.Random, sequence: int) -> Optional[dict]:
+        if self._replay is not None:
+            with self._lock:
+                return next(self._replay, None)
+        template = rng.choices(self.scenario.mix, weights=[m.get("weight", 1) for m in self.scenario.mix])[0]
+        context = {
+            "product_id": rng.choice(self.product_ids),
+            "hot_product_id": self.product_ids[0],
+            "sequence": sequence,
+            "thread": threading.get_ident(),
+        }
+        return _render(template, context)
+
+    def _worker(self, seed: int, deadline: float):
+        rng = random.Random(seed)
+        latencies = []
+        errors = 0
+        sequence = 0
+        with httpx.Client(base_url=self.base_url, timeout=30) as client:
+            while time.perf_counter() < deadline:
+                request = self._next_request(rng, sequence)
+                if request is None:
+                    break
+                sequence += 1
+                headers = dict(request.get("headers", {}))
+                if request.get("idempotent"):
+                    headers["Idempotency-Key"] = f"bench-{seed}-{sequence}"
+                start = time.perf_counter()
+                response = client.request(
+                    request.get("method", "GET"), request["path"],
+                    json=request.get("json"), headers=headers
+                )
+                latencies.append(time.perf_counter() - start)
+                if response.status_code not in self.scenario.ok_statuses:
+                    errors += 1
+        with self._lock:
+            self.latencies.extend(latencies)
+            self.errors += errors
+
+    def run(self) -> Dict[str, float]:
+        start = time.perf_counter()
+        deadline = start + self.scenario.duration_seconds
+        threads = [
+            threading.Thread(target=self._worker, args=(seed, deadline))
+            for seed in range(self.scenario.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(self.latencies, self.errors, time.perf_counter() - start)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class AppServer:
+    """Runs the app in a child process against a throwaway database.
+
+    ``database_url`` points it at an existing database instead, whose
+    tables are dropped and recreated before every run; that requires
+    ``reset_database=True`` (``--reset-database``), so a real database is
+    never wiped by accident.
+    """
+
+    def __init__(self, database_url: Optional[str] = None, redis_url: str = "",
+                 command: Optional[List[str]] = None, extra_env: Optional[dict] = None,
+                 reset_database: bool = False):
+        self._tmpdir = None
+        if database_url is None:
+            self._tmpdir = tempfile.TemporaryDirectory()
+            database_url = f"sqlite:///{self._tmpdir.name}/bench.db"
+        elif not reset_database:
+            raise ValueError(
+                f"Benchmarks drop every table in {database_url} and seed their own data; "
+                "pass --reset-database to allow it"
+            )
+        self.database_url = database_url
+        self.port = _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.env = {
+            **os.environ,
+            "ENV": "test",
+            "DATABASE_URL": database_url,
+            "REDIS_URL": redis_url,
+            **(extra_env or {}),
+        }
+        self.command = command or [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", "{port}", "--log-level", "warning",
+        ]
+        self.process = None
+
+    def create_schema(self):
+        code = "from app.database import Base, get_engine\nimport app.models\n"
+        if self._tmpdir is None:
+            # An existing database, which the caller agreed to reset
+            code += "Base.metadata.drop_all(bind=get_engine())\n"
+        code += "Base.metadata.create_all(bind=get_engine())\n"
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, env=self.env, check=True)
+
+    def __enter__(self) -> "AppServer":
+        self.create_schema()
+        command = [part.format(port=self.port) for part in self.command]
+        self.process = subprocess.Popen(command, cwd=ROOT_DIR, env=self.env)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(f"{self.base_url}/health", timeout=1).status_code == 200:
+                    return self
+            except httpx.TransportError:
+                time.sleep(0.05)
+        self.__exit__(None, None, None)
+        raise RuntimeError("App server did not become healthy within 30s")
+
+    def __exit__(self, *exc_info):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+
+
+def seed_products(base_url: str, scenario: Scenario) -> List[int]:
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        return [
+            client.post("/products/", json={
+                "name": f"Bench product {i}", "price": round(1 + i * 0.37, 2), "stock": scenario.stock
+            }).json()["id"]
+            for i in range(scenario.products)
+        ]
+
+
+def run_scenario(scenario: Scenario, **server_options) -> Dict[str, float]:
+    with AppServer(**server_options) as server:
+        product_ids = seed_products(server.base_url, scenario)
+        return LoadGenerator(server.base_url, scenario, product_ids).run()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", type=Path, default=DEFAULT_SCENARIOS)
+    parser.add_argument("--scenario", action="append", help="only run the named scenario(s)")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--duration", type=float, help="override every scenario's duration")
+    parser.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    parser.add_argument("--reset-database", action="store_true",
+                        help="drop and recreate the tables in --database-url (required with it)")
+    parser.add_argument("--redis-url", default="")
+    parser.add_argument("--output", type=Path, help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    scenarios = load_scenarios(args.scenarios)
+    if args.scenario:
+        scenarios = [s for s in scenarios if s.name in args.scenario]
+
+    results = {}
+    for scenario in scenarios:
+        if args.duration:
+            scenario.duration_seconds = args.duration
+        results[scenario.name] = run_scenario(
+            scenario, database_url=args.database_url, redis_url=args.redis_url,
+            reset_database=args.reset_database,
+        )
+        print(f"{scenario.name}: {json.dumps(results[scenario.name])}")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+
+    if args.update_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --update-baseline first")
+        return 0
+    regressions = compare_to_baseline(results, json.loads(args.baseline.read_text()), args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
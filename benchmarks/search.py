@@ -0,0 +1,105 @@
+"""Latency of filtered product searches on a large catalogue.
+
+Seeds a throwaway SQLite catalogue (or uses ``--database-url``, whose
+products table must already be migrated and populated) and times a set of
+typical searches through ``ProductCRUD.search_json``: the first page and a
+deep keyset page for each.
+
+    python -m benchmarks.search --products 2000000
+"""
+from typing import Dict, List, Optional
+import argparse
+import random
+import sys
+import tempfile
+import time
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app import models, schemas
+from app.crud import ProductCRUD
+from app.database import Base
+from benchmarks.loadtest import percentile
+
+WORDS = ["red", "blue", "green", "steel", "oak", "widget", "gadget", "sprocket", "lamp", "chair",
+         "deluxe", "mini", "pro", "classic", "vintage", "smart", "eco", "ultra", "travel", "kids"]
+
+SEARCHES = {
+    "substring": {"q": "sprock"},
+    "prefix": {"name_prefix": "blue st"},
+    "price_range": {"min_price": 10, "max_price": 12, "sort": "price"},
+    "in_stock_by_price": {"in_stock": True, "sort": "-price"},
+    "substring_by_name": {"q": "vintage", "sort": "name", "in_stock": True},
+}
+
+
+def seed(engine, products: int, batch: int = 50_000):
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        for start in range(0, products, batch):
+            conn.execute(insert(models.Product), [
+                {
+                    "name": " ".join(rng.sample(WORDS, 3)) + f" {n}",
+                    "price_minor": rng.randint(100, 100_000),
+                    "stock": rng.randint(0, 50),
+                    "reserved": 0,
+                }
+                for n in range(start, min(start + batch, products))
+            ])
+
+
+def run(session, rounds: int, limit: int, pages: int) -> Dict[str, Dict[str, float]]:
+    crud = ProductCRUD()
+    results = {}
+    for name, params in SEARCHES.items():
+        first, deep = [], []
+        for _ in range(rounds):
+            search = schemas.ProductSearch(**params)
+            start = time.perf_counter()
+            _, cursor = crud.search_json(session, search, limit=limit)
+            first.append(time.perf_counter() - start)
+            for _ in range(pages - 1):
+                if cursor is None:
+                    break
+                search = schemas.ProductSearch(**params, cursor=cursor)
+                start = time.perf_counter()
+                _, cursor = crud.search_json(session, search, limit=limit)
+            deep.append(time.perf_counter() - start)
+        first.sort()
+        deep.sort()
+        results[name] = {
+            "first_p50_ms": round(percentile(first, 50) * 1000, 2),
+            "first_p95_ms": round(percentile(first, 95) * 1000, 2),
+            f"page{pages}_p50_ms": round(percentile(deep, 50) * 1000, 2),
+        }
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=200_000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=20, help="depth of the keyset page also timed")
+    parser.add_argument("--database-url", help="existing catalogue; defaults to a seeded SQLite file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        url = args.database_url or f"sqlite:///{tmpdir}/search.db"
+        engine = create_engine(url)
+        if not args.database_url:
+            start = time.perf_counter()
+            seed(engine, args.products)
+            print(f"seeded {args.products} products in {time.perf_counter() - start:.1f}s")
+        session = sessionmaker(bind=engine)()
+        try:
+            for name, stats in run(session, args.rounds, args.limit, args.pages).items():
+                print(f"{name:20} {stats}")
+        finally:
+            session.close()
+            engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Per-page CPU cost of encoding order and product pages.
+
+Builds an in-memory SQLite catalogue and times, per page, the way each
+response used to be produced against the fast path:
+
+* ``pydantic``   - ORM query, ``response_model`` validation, ``jsonable_encoder``, ``json.dumps``
+                   (what FastAPI does for a route returning ORM objects)
+* ``orm+orjson`` - ORM query, precompiled extractor, orjson
+* ``projection`` - column projection, precompiled extractor, orjson (what the API does now)
+
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --orders 100 --items 3 --rounds 200
+"""
+from typing import Callable, Dict, List, Optional
+import argparse
+import json
+import sys
+import time
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import selectinload, sessionmaker
+from app import models, schemas, serializers
+from app.core.serialization import dumps
+from app.crud import OrderCRUD
+from app.database import Base
+
+
+def build_session(orders: int, items: int, products: int = 50):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all(
+        models.Product(name=f"Product {i}", price_minor=199 + i, stock=1000) for i in range(products)
+    )
+    session.flush()
+    for n in range(orders):
+        order = models.Order(idempotency_key=f"bench-{n}", total_amount_minor=0)
+        order.items = [
+            models.OrderItem(product_id=(n + k) % products + 1, quantity=k + 1, price_minor=199 + k)
+            for k in range(items)
+        ]
+        session.add(order)
+    session.commit()
+    return session
+
+
+def _time_per_call(func: Callable[[], bytes], rounds: int) -> float:
+    func()  # warm caches and compiled statements
+    start = time.process_time()
+    for _ in range(rounds):
+        func()
+    return (time.process_time() - start) / rounds
+
+
+def run(orders: int = 100, items: int = 3, rounds: int = 100) -> Dict[str, Dict[str, float]]:
+    session = build_session(orders, items)
+    crud = OrderCRUD()
+
+    def orm_orders():
+        session.expunge_all()
+        return session.query(models.Order).options(selectinload(models.Order.items)).order_by(
+            models.Order.created_at.desc(), models.Order.id.desc()
+        ).limit(orders).all()
+
+    def pydantic_orders():
+        page = schemas.PaginatedOrders(orders=orm_orders(), next_cursor=None, has_more=False)
+        return json.dumps(jsonable_encoder(page)).encode()
+
+    def orm_orjson_orders():
+        page = [serializers.order_dict(order) for order in orm_orders()]
+        return dumps({"orders": page, "next_cursor": None, "has_more": False})
+
+    def projection_orders():
+        page, next_cursor, has_more = crud.get_multi_paginated_rows(session, limit=orders)
+        return dumps({
+            "orders": [serializers.order_dict(order, rows) for order, rows in page],
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+        })
+
+    def orm_products():
+        session.expunge_all()
+        return session.query(models.Product).order_by(models.Product.id).all()
+
+    def pydantic_products():
+        validated = [schemas.Product.model_validate(p) for p in orm_products()]
+        return json.dumps(jsonable_encoder(validated)).encode()
+
+    def projection_products():
+        rows = session.execute(
+            select(*serializers.product_columns()).order_by(models.Product.id)
+        ).all()
+        return dumps(serializers.product_list(rows))
+
+    results = {
+        "orders": {
+            "pydantic": _time_per_call(pydantic_orders, rounds),
+            "orm+orjson": _time_per_call(orm_orjson_orders, rounds),
+            "projection": _time_per_call(projection_orders, rounds),
+        },
+        "products": {
+            "pydantic": _time_per_call(pydantic_products, rounds),
+            "orm+orjson": _time_per_call(lambda: dumps(serializers.product_list(orm_products())), rounds),
+            "projection": _time_per_call(projection_products, rounds),
+        },
+    }
+    session.close()
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=100, help="orders per page")
+    parser.add_argument("--items", type=int, default=3, help="items per order")
+    parser.add_argument("--rounds", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    for page, timings in run(args.orders, args.items, args.rounds).items():
+        baseline = timings["pydantic"]
+        for name, seconds in timings.items():
+            print(f"{page:9} {name:11} {seconds * 1000:8.3f} ms/page  x{baseline / seconds:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Startup-time benchmark: how long a fresh worker takes to become useful.
+
+Measures, over several fresh interpreters:
+
+* ``import``  - ``import app.main`` in a new process
+* ``first_request`` - process spawn until the first ``/health`` answers 200
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --database-url postgresql://... --reset-database
+"""
+from typing import Dict, List, Optional
+import argparse
+import json
+import subprocess
+import sys
+import time
+import httpx
+from benchmarks.loadtest import ROOT_DIR, AppServer, percentile
+
+_IMPORT_PROBE = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "import app.main\n"
+    "print(time.perf_counter() - start)\n"
+)
+
+
+def measure_import(env: dict) -> float:
+    result = subprocess.run(
+        [sys.executable, "-c", _IMPORT_PROBE],
+        cwd=ROOT_DIR, env=env, check=True, capture_output=True, text=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure_first_request(server: AppServer, timeout: float = 30.0) -> float:
+    command = [part.format(port=server.port) for part in server.command]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT_DIR, env=server.env)
+    try:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(f"{server.base_url}/health", timeout=1).status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.TransportError:
+                time.sleep(0.005)
+        raise RuntimeError(f"App server did not become healthy within {timeout}s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _stats(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 1),
+        "max_ms": round(samples[-1] * 1000, 1),
+    }
+
+
+def run(runs: int, database_url: Optional[str] = None, redis_url: str = "",
+        reset_database: bool = False) -> Dict[str, dict]:
+    server = AppServer(database_url=database_url, redis_url=redis_url, reset_database=reset_database)
+    try:
+        server.create_schema()
+        imports = [measure_import(server.env) for _ in range(runs)]
+        first_requests = [measure_first_request(server) for _ in range(runs)]
+    finally:
+        server.__exit__(None, None, None)
+    return {"import": _stats(imports), "first_request": _stats(first_requests)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    parser.add_argument("--reset-database", action="store_true",
+                        help="drop and recreate the tables in --database-url (required with it)")
+    parser.add_argument("--redis-url", default="")
+    args = parser.parse_args(argv)
+
+    results = run(args.runs, database_url=args.database_url, redis_url=args.redis_url,
+                  reset_database=args.reset_database)
+    for name, stats in results.items():
+        print(f"{name}: {json.dumps(stats)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
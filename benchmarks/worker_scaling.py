@@ -0,0 +1,76 @@
+"""Throughput vs gunicorn worker count for the production profile.
+
+Runs one load-test scenario against ``gunicorn -c gunicorn.conf.py`` with
+1, 2, 4, ... workers and prints RPS and latency per worker count, plus the
+speed-up over a single worker.
+
+    python -m benchmarks.worker_scaling
+    python -m benchmarks.worker_scaling --workers 1 2 4 8 16 --scenario browse_heavy
+
+The load generator is a Python process too; on small machines it saturates
+before the server does, so run it from a separate host (``--target``) when
+measuring beyond a handful of workers. SQLite serialises writers, so use
+``--database-url`` with PostgreSQL for write-heavy scenarios; it is wiped
+first, which ``--reset-database`` must confirm.
+"""
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import sys
+from benchmarks.loadtest import DEFAULT_SCENARIOS, AppServer, LoadGenerator, load_scenarios, seed_products
+
+
+def gunicorn_command(workers: int) -> List[str]:
+    return [
+        sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+        "--workers", str(workers), "--bind", "127.0.0.1:{port}", "app.main:app",
+    ]
+
+
+def run(scenario_name: str, worker_counts: List[int], duration: Optional[float] = None,
+        database_url: Optional[str] = None, redis_url: str = "",
+        reset_database: bool = False) -> Dict[int, dict]:
+    scenario = next(s for s in load_scenarios(DEFAULT_SCENARIOS) if s.name == scenario_name)
+    if duration:
+        scenario.duration_seconds = duration
+    results = {}
+    for workers in worker_counts:
+        # Enough client threads to keep every worker busy
+        scenario.concurrency = max(scenario.concurrency, 4 * workers)
+        server = AppServer(
+            database_url=database_url,
+            redis_url=redis_url,
+            command=gunicorn_command(workers),
+            extra_env={"WEB_CONCURRENCY": str(workers), "LOG_LEVEL": "warning"},
+            reset_database=reset_database,
+        )
+        with server:
+            product_ids = seed_products(server.base_url, scenario)
+            results[workers] = LoadGenerator(server.base_url, scenario, product_ids).run()
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="browse_heavy")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--duration", type=float)
+    parser.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    parser.add_argument("--reset-database", action="store_true",
+                        help="drop and recreate the tables in --database-url (required with it)")
+    parser.add_argument("--redis-url", default="")
+    args = parser.parse_args(argv)
+
+    results = run(args.scenario, args.workers, args.duration, args.database_url, args.redis_url,
+                  args.reset_database)
+    single = results.get(1, {}).get("rps")
+    for workers, result in results.items():
+        speedup = f" x{result['rps'] / single:.2f}" if single else ""
+        print(f"workers={workers}: {json.dumps(result)}{speedup}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
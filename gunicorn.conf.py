@@ -0,0 +1,58 @@
+"""Production server profile: ``gunicorn -c gunicorn.conf.py app.main:app``.
+
+Every value can be overridden from the environment without rebuilding the
+image. Workers are not preloaded: each one builds its own engine and Redis
+client after the fork (see ``app.database``).
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+
+# One event loop per core; the sync endpoints get a thread pool inside each
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# Exported so every worker sizes its DB pool against the same worker count
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "app.server.ProductionUvicornWorker"
+
+# Proxies whose X-Forwarded-For is believed. Uvicorn then reports the
+# forwarded address as the client's, which the order rate limiter keys on
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+# Pending connections the kernel queues while all workers are busy
+backlog = int(os.getenv("BACKLOG", "2048"))
+# Longer than the load balancer's idle timeout, so it never reuses a
+# connection the worker has just closed
+keepalive = int(os.getenv("KEEPALIVE", "75"))
+
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+# Time a stopping worker gets to finish in-flight requests
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+
+# Recycle workers now and then to bound slow leaks; jitter avoids all of
+# them restarting at once
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+
+# Heartbeat files on tmpfs, so a slow disk cannot get workers killed
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Snowflake order ids (sharded orders) need a worker id no other live
+# process uses. Each worker takes the lowest slot its live siblings leave
+# free, so a restarted worker reuses the slot of the one it replaces, and
+# SNOWFLAKE_WORKER_OFFSET gives every host or container its own range:
+# host 0 takes 0-15, host 1 16-31 and so on with 16 workers each.
+def pre_fork(server, worker):
+    taken = {getattr(w, "snowflake_slot", None) for w in server.WORKERS.values()}
+    worker.snowflake_slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+
+def post_fork(server, worker):
+    worker_id = int(os.getenv("SNOWFLAKE_WORKER_OFFSET", "0")) + worker.snowflake_slot
+    if worker_id >= 64:
+        raise RuntimeError(f"Snowflake worker id {worker_id} out of range: check SNOWFLAKE_WORKER_OFFSET")
+    # Read by app.core.config, which the worker only imports after the fork
+    os.environ["SNOWFLAKE_WORKER_ID"] = str(worker_id)
+
+accesslog = os.getenv("ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
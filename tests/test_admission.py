@@ -0,0 +1,107 @@
+import anyio
+import pytest
+import threading
+from app import dependencies
+from app.core.admission import CheckoutLane, Overloaded, RateLimiter
+from app.core.config import get_settings
+from app.routers import orders
+
+@pytest.fixture
+def product(client):
+    return client.post("/products/", json={"name": "Hot SKU", "price": 5, "stock": 100}).json()
+
+@pytest.fixture
+def rate_limit(monkeypatch):
+    monkeypatch.setattr(get_settings(), "order_rate_limit", 0.01)
+    monkeypatch.setattr(get_settings(), "order_rate_burst", 3)
+    monkeypatch.setattr(dependencies, "order_rate_limiter", RateLimiter("orders", dependencies.get_redis))
+
+def _order(client, product, headers=None):
+    return client.post(
+        "/orders/", json={"items": [{"product_id": product["id"], "quantity": 1}]}, headers=headers or {}
+    )
+
+def test_known_api_keys_get_their_own_bucket(client, fake_redis, monkeypatch, rate_limit, product):
+    monkeypatch.setattr(get_settings(), "order_rate_api_keys", "bob-secret")
+    bob = {"X-API-Key": "bob-secret"}
+    assert [_order(client, product).status_code for _ in range(3)] == [201] * 3
+
+    limited = _order(client, product)
+    assert limited.status_code == 429
+    assert int(limited.headers["retry-after"]) >= 1
+    assert _order(client, product, bob).status_code == 201
+
+    keys = fake_redis.keys("ratelimit:orders:*")
+    assert len(keys) == 2
+    assert not any("bob-secret" in key for key in keys)
+
+@pytest.mark.parametrize("header", ["X-Client-Id", "X-API-Key"])
+def test_callers_cannot_pick_their_bucket(client, fake_redis, rate_limit, product, header):
+    # Unknown API keys are no identity either: the address's bucket applies
+    codes = [_order(client, product, {header: f"fresh-{i}"}).status_code for i in range(4)]
+    assert codes == [201, 201, 201, 429]
+    assert len(fake_redis.keys("ratelimit:orders:*")) == 1
+
+def test_checkout_dependencies_stay_off_the_default_threadpool(client, monkeypatch, fake_redis, rate_limit, product):
+    threads = []
+    check = dependencies.order_rate_limiter.check
+    async def default_threads_in_use():
+        return anyio.to_thread.current_default_thread_limiter().borrowed_tokens
+    def recording_check(*args):
+        threads.append(anyio.from_thread.run(default_threads_in_use))
+        return check(*args)
+    monkeypatch.setattr(dependencies.order_rate_limiter, "check", recording_check)
+
+    assert _order(client, product).status_code == 201
+    assert threads == [0]
+
+def test_in_process_bucket_while_redis_is_down(client, monkeypatch, rate_limit, product):
+    class Down:
+        def register_script(self, script):
+            def call(**kwargs):
+                raise ConnectionError("redis down")
+            return call
+    monkeypatch.setattr(dependencies.order_rate_limiter, "redis_factory", lambda: Down())
+
+    codes = [_order(client, product).status_code for _ in range(4)]
+    assert codes == [201, 201, 201, 429]
+
+def test_full_lane_is_shed_with_503(client, monkeypatch, product):
+    class FullLane:
+        async def run(self, func, *args):
+            raise Overloaded("checkout is at capacity", 2.0)
+    monkeypatch.setattr(orders, "get_checkout_lane", lambda: FullLane())
+
+    response = _order(client, product)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "2"
+    assert client.get("/products/").status_code == 200
+
+def _blocked_lane_run(lane, release):
+    """Start one checkout that blocks until ``release``, then try another"""
+    async def main():
+        results = {}
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(lane.run, release.wait)
+            await anyio.sleep(0.05)
+            results["default_threads_in_use"] = anyio.to_thread.current_default_thread_limiter().borrowed_tokens
+            try:
+                await lane.run(lambda: "second")
+                results["second"] = "ran"
+            except Overloaded:
+                results["second"] = "shed"
+            release.set()
+        return results
+    return anyio.run(main)
+
+def test_lane_sheds_at_once_when_the_queue_is_full():
+    lane = CheckoutLane("test", concurrency=1, queue_size=0, queue_timeout=5)
+    results = _blocked_lane_run(lane, threading.Event())
+    assert results["second"] == "shed"
+    # The running checkout holds none of the read endpoints' threads
+    assert results["default_threads_in_use"] == 0
+
+def test_lane_sheds_after_the_queue_timeout():
+    lane = CheckoutLane("test", concurrency=1, queue_size=5, queue_timeout=0.05)
+    assert _blocked_lane_run(lane, threading.Event())["second"] == "shed"
+    assert lane.waiting == 0
@@ -0,0 +1,80 @@
+import pytest
+from datetime import datetime, timezone
+from app import crud, schemas
+from app.core import cache, metrics
+
+@pytest.fixture
+def products(client):
+    return [
+        client.post("/products/", json={"name": f"Widget {i}", "price": i + 1, "stock": 10}).json()
+        for i in range(30)
+    ]
+
+def _round_trips(client, path, route="/products/", **params):
+    histogram = metrics.cache_round_trips_per_request.labels(route)
+    before = histogram.sum
+    response = client.get(path, params=params)
+    assert response.status_code == 200
+    return response, histogram.sum - before
+
+def test_search_pages_cost_the_same_round_trips_at_any_size(client, fake_redis, products):
+    cold_small, cold_small_trips = _round_trips(client, "/products/", min_price=0, limit=5)
+    cold_large, cold_large_trips = _round_trips(client, "/products/", min_price=0, limit=25)
+    # version, MGET, guarded SET of the misses
+    assert cold_small_trips == cold_large_trips == 3
+
+    warm, warm_trips = _round_trips(client, "/products/", min_price=0, limit=25)
+    assert warm_trips == 2
+    assert warm.content == cold_large.content
+    assert [p["id"] for p in warm.json()] == [p["id"] for p in products[:25]]
+
+def test_products_are_cached_and_invalidated_by_id(client, fake_redis, products):
+    first, second = products[0], products[1]
+    for product in (first, second):
+        client.get(f"/products/{product['id']}")
+    assert len(fake_redis.keys("product_v1:*")) == 2
+
+    client.put(f"/products/{first['id']}", json={"stock": 4})
+    assert fake_redis.keys("product_v1:*") == [f"product_v1:{second['id']}"]
+    response, trips = _round_trips(client, f"/products/{first['id']}", route="/products/{product_id}")
+    assert response.json()["stock"] == 4
+    assert trips == 3
+
+    sparse = client.get("/products/", params={"min_price": 0, "limit": 2, "fields": "id,stock"}).json()
+    assert sparse == [{"stock": 4, "id": first["id"]}, {"stock": 10, "id": second["id"]}]
+
+def test_invalidation_is_one_round_trip(client, fake_redis, db_session, products):
+    for skip in range(0, 30, 5):
+        client.get("/products/", params={"skip": skip, "limit": 5})
+    with metrics.track_round_trips() as round_trips:
+        crud.product_crud._invalidate_products_cache(p["id"] for p in products)
+    assert round_trips.count == 1
+    assert not fake_redis.keys("product_v1:*")
+
+def test_entries_read_before_a_change_are_not_stored(fake_redis, db_session, products):
+    version = crud.product_crud.catalogue_version()
+    crud.product_crud._invalidate_products_cache([products[0]["id"]])
+    found = crud.product_crud.get_many_dicts(db_session, [p["id"] for p in products[:3]], version)
+    assert len(found) == 3
+    assert not fake_redis.keys("product_v1:*")
+
+def test_codecs_round_trip_and_interoperate(monkeypatch):
+    value = {"id": 1, "price": 2.5, "created_at": datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)}
+    packed = cache.encode(value)
+    if cache.msgpack is not None:
+        assert cache.decode(packed) == value
+        assert len(packed) < len(cache.dumps(value))
+
+    monkeypatch.setattr(cache, "msgpack", None)
+    as_json = cache.encode(value)
+    assert cache.decode(as_json) == {**value, "created_at": "2024-01-02T03:04:05Z"}
+    if packed != as_json:
+        # A worker without msgpack treats msgpack entries as misses
+        assert cache.decode(packed) is None
+
+def test_without_redis_everything_is_a_miss(db_session, products):
+    entities = cache.BatchCache("test", lambda: None, ttl=60)
+    assert entities.get_many([1, 2]) == {}
+    assert not entities.set_many({1: {"id": 1}})
+    assert crud.product_crud.get_json(db_session, products[0]["id"]) is not None
+    assert schemas.ProductSearch().is_plain_listing()
@@ -0,0 +1,27 @@
+from benchmarks.loadtest import _render, compare_to_baseline, load_scenarios, percentile, DEFAULT_SCENARIOS
+
+def test_percentile_nearest_rank():
+    samples = [float(i) for i in range(1, 101)]
+    assert percentile(samples, 50) == 50.0
+    assert percentile(samples, 95) == 95.0
+    assert percentile(samples, 99) == 99.0
+    assert percentile([], 99) == 0.0
+
+def test_compare_to_baseline_flags_latency_and_throughput_regressions():
+    baseline = {"browse": {"rps": 100.0, "p95_ms": 10.0, "p99_ms": 20.0, "errors": 0}}
+
+    within = {"browse": {"rps": 90.0, "p95_ms": 12.0, "p99_ms": 28.0, "errors": 0}}
+    assert compare_to_baseline(within, baseline, tolerance=0.25) == []
+
+    slower = {"browse": {"rps": 60.0, "p95_ms": 13.0, "p99_ms": 20.0, "errors": 2}}
+    regressions = compare_to_baseline(slower, baseline, tolerance=0.25)
+    assert len(regressions) == 3
+
+def test_request_templates_render_with_typed_placeholders():
+    template = {"path": "/products/{product_id}", "json": {"items": [{"product_id": "{product_id}", "quantity": 1}]}}
+    rendered = _render(template, {"product_id": 7})
+    assert rendered == {"path": "/products/7", "json": {"items": [{"product_id": 7, "quantity": 1}]}}
+
+def test_shipped_scenarios_load():
+    names = {scenario.name for scenario in load_scenarios(DEFAULT_SCENARIOS)}
+    assert {"browse_heavy", "checkout_heavy", "flash_sale"} <= names
@@ -0,0 +1,109 @@
+import pytest
+from types import SimpleNamespace
+from app import catalogue, crud
+from app.background import CatalogueRefresher
+from app.core.config import get_settings
+from app.database import SessionLocal
+
+@pytest.fixture
+def products(client):
+    return [
+        client.post("/products/", json={"name": f"Product {i:03d}", "price": 1.5 + i, "stock": 10}).json()
+        for i in range(30)
+    ]
+
+@pytest.fixture
+def snapshot(monkeypatch, products):
+    snapshot = catalogue.CatalogueSnapshot()
+    monkeypatch.setattr(catalogue, "_snapshot", snapshot)
+    _refresh(snapshot)
+    return snapshot
+
+def _refresh(snapshot):
+    db = SessionLocal()
+    try:
+        return snapshot.refresh(db)
+    finally:
+        db.close()
+
+def _from_database(monkeypatch, client, url):
+    with monkeypatch.context() as m:
+        m.setattr(catalogue, "_snapshot", None)
+        return client.get(url).content
+
+def test_snapshot_responses_match_the_database(monkeypatch, client, snapshot, products):
+    assert len(snapshot) == 30
+    for url in ["/products/", "/products/?skip=5&limit=7", "/products/?fields=price,id",
+                f"/products/{products[3]['id']}"]:
+        assert client.get(url).content == _from_database(monkeypatch, client, url)
+
+def test_reads_skip_the_database(monkeypatch, client, snapshot, products):
+    def fail(*args, **kwargs):
+        raise AssertionError("database read")
+    monkeypatch.setattr(crud.product_crud, "get_multi_json", fail)
+    monkeypatch.setattr(crud.product_crud, "get", fail)
+    assert len(client.get("/products/?limit=100").json()) == 30
+    assert client.get(f"/products/{products[0]['id']}").json()["name"] == "Product 000"
+
+def test_writes_are_applied_incrementally(monkeypatch, client, snapshot, products):
+    client.put(f"/products/{products[0]['id']}", json={"name": "Renamed", "stock": 4})
+    client.delete(f"/products/{products[1]['id']}")
+    created = client.post("/products/", json={"name": "Newest", "price": 2, "stock": 1}).json()
+    client.post("/orders/", json={"items": [{"product_id": products[2]["id"], "quantity": 3}]})
+
+    assert _refresh(snapshot) == 4
+    assert len(snapshot) == 30
+    assert snapshot.get(products[0]["id"])["name"] == "Renamed"
+    assert snapshot.get(products[1]["id"]) is None
+    assert snapshot.get(products[2]["id"])["stock"] == 7
+    url = f"/products/{created['id']}"
+    assert client.get(url).content == _from_database(monkeypatch, client, url)
+    assert client.get("/products/?limit=100").content == _from_database(monkeypatch, client, "/products/?limit=100")
+
+def test_unknown_products_fall_back_to_the_database(client, snapshot):
+    created = client.post("/products/", json={"name": "Not refreshed yet", "price": 2, "stock": 1}).json()
+    assert client.get(f"/products/{created['id']}").json()["name"] == "Not refreshed yet"
+    assert client.get("/products/999999").status_code == 404
+
+def test_renames_reuse_the_name_blob():
+    snapshot = catalogue.CatalogueSnapshot()
+    row = lambda i, name: SimpleNamespace(
+        id=i, name=name, price_minor=100, stock=1, reserved=0, reorder_point=None,
+        created_at=None, updated_at=None
+    )
+    snapshot.load(row(i, "x" * 20) for i in range(1, 11))
+    for n in range(20):
+        snapshot.apply([row(1, f"renamed {n:012d}")])
+    assert snapshot.get(1)["name"] == "renamed 000000000019"
+    assert snapshot.memory_bytes() < 2 * (10 * 20 + 10 * 50)
+
+def test_large_catalogues_stay_in_the_database(snapshot, products):
+    snapshot.max_products = 10
+    snapshot.mark_changed(None)
+    _refresh(snapshot)
+    assert not snapshot.ready
+    assert catalogue.get_catalogue() is None
+
+def test_memory_per_product_is_bounded():
+    snapshot = catalogue.CatalogueSnapshot()
+    snapshot.load(
+        SimpleNamespace(id=i, name=f"Product {i:08d}", price_minor=i, stock=5, reserved=0,
+                        reorder_point=None, created_at=None, updated_at=None)
+        for i in range(1, 20_001)
+    )
+    # 54 bytes of columns plus the 16-byte name, with some array slack
+    assert snapshot.memory_bytes() / len(snapshot) < 76
+
+def test_other_workers_changes_arrive_over_pubsub(monkeypatch, client, fake_redis, snapshot, products):
+    monkeypatch.setattr(get_settings(), "catalogue_snapshot_enabled", True)
+    refresher = CatalogueRefresher(snapshot, interval=0, redis_factory=lambda: fake_redis)
+    refresher.run_once()  # subscribes and does the initial full load
+
+    # Another worker's write only reaches this process over the channel
+    with monkeypatch.context() as m:
+        m.setattr(catalogue, "_snapshot", None)
+        client.put(f"/products/{products[5]['id']}", json={"stock": 1})
+
+    assert refresher.run_once() == 1
+    assert snapshot.get(products[5]["id"])["stock"] == 1
+    refresher.stop()
@@ -67,3 +67,33 @@ def test_concurrent_order_creation_with_idempotency(client):
     # Product stock should only be decremented once
     product_check = client.get(f"/products/{product_id}")
     assert product_check.json()["stock"] == 19
+
+def test_row_locks_serialize_read_modify_write(client):
+    """Two checkouts read the stock one after the other, SQLite included"""
+    from app import crud
+    from app.database import SessionLocal
+
+    product_id = client.post("/products/", json={"name": "Locked", "price": 1.0, "stock": 10}).json()["id"]
+    first, second = SessionLocal(), SessionLocal()
+    try:
+        product = crud.product_crud.get_for_update(first, product_id)
+        seen = []
+
+        def take_one():
+            locked = crud.product_crud.get_for_update(second, product_id)
+            seen.append(locked.stock)
+            locked.stock -= 1
+            second.commit()
+
+        waiter = threading.Thread(target=take_one)
+        waiter.start()
+        time.sleep(0.2)
+        assert seen == []  # still waiting for the first lock
+        product.stock -= 1
+        first.commit()
+        waiter.join(timeout=5)
+        assert seen == [9]
+    finally:
+        first.close()
+        second.close()
+    assert client.get(f"/products/{product_id}").json()["stock"] == 8
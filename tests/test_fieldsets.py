@@ -0,0 +1,54 @@
+import pytest
+from app import crud, serializers
+
+@pytest.fixture
+def catalogue(client):
+    product = client.post("/products/", json={"name": "Widget", "price": 2.5, "stock": 10}).json()
+    client.post("/orders/", json={"items": [{"product_id": product["id"], "quantity": 2}]})
+    return product
+
+def test_parse_fields_is_canonical_and_strict():
+    assert serializers.parse_fields("stock, id,name", serializers.PRODUCT_FIELDS) == ("name", "stock", "id")
+    assert serializers.parse_fields(None, serializers.PRODUCT_FIELDS) == serializers.PRODUCT_FIELDS
+    with pytest.raises(ValueError, match="Unknown field"):
+        serializers.parse_fields("id,password", serializers.PRODUCT_FIELDS)
+    assert serializers.parse_include("", serializers.ORDER_INCLUDES, default=("items",)) == ()
+
+def test_projection_selects_only_the_needed_columns():
+    columns = serializers.product_columns(("price", "available"))
+    assert [c.key for c in columns] == ["price_minor", "stock", "reserved"]
+    # Pagination keys are always selected for orders
+    assert [c.key for c in serializers.order_columns(("total_amount",))] == ["id", "created_at", "total_amount_minor"]
+
+def test_sparse_product_list(client, catalogue):
+    response = client.get("/products/", params={"fields": "id,name,price,stock"})
+    assert response.status_code == 200
+    [product] = response.json()
+    assert list(product) == ["name", "price", "stock", "id"]
+    assert product == {"name": "Widget", "price": 2.5, "stock": 8, "id": catalogue["id"]}
+
+    assert client.get("/products/", params={"fields": "id,secret"}).status_code == 400
+
+def test_orders_without_items_and_sparse_orders(client, catalogue):
+    [order] = client.get("/orders/", params={"include": ""}).json()["orders"]
+    assert "items" not in order and order["total_amount"] == 5.0
+
+    [order] = client.get("/orders/", params={"fields": "id,total_amount", "include": "items"}).json()["orders"]
+    assert list(order) == ["id", "total_amount", "items"]
+    assert order["items"][0]["quantity"] == 2
+
+    assert client.get("/orders/", params={"include": "customer"}).status_code == 400
+
+def test_cache_keys_are_projection_aware(fake_redis, db_session, catalogue):
+    full = crud.product_crud.get_multi_json(db_session)
+    sparse = crud.product_crud.get_multi_json(db_session, fields=("name", "id"))
+    version = crud.product_crud.catalogue_version()
+    assert sorted(fake_redis.keys("products_list_*")) == [
+        f"products_list_v4:{version}_0_100", f"products_list_v4:{version}_0_100_name.id"
+    ]
+    assert crud.product_crud.get_multi_json(db_session, fields=("name", "id")) == sparse != full
+
+    # A change retires every page by moving to a new version
+    crud.product_crud._invalidate_products_cache([catalogue["id"]])
+    assert crud.product_crud.catalogue_version() != version
+    assert not fake_redis.keys(f"products_list_v4:{crud.product_crud.catalogue_version()}_*")
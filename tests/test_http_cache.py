@@ -0,0 +1,66 @@
+import pytest
+from app.core import http_cache
+
+@pytest.fixture
+def catalogue(client):
+    return [
+        client.post("/products/", json={"name": f"Product {i:03d}", "price": 1.5 + i, "stock": 10}).json()
+        for i in range(40)
+    ]
+
+def test_etag_matching_is_weak_and_handles_lists():
+    etag = http_cache.weak_etag("v7")
+    assert http_cache.etag_matches('W/"v7"', etag)
+    assert http_cache.etag_matches('"v7"', etag)
+    assert http_cache.etag_matches('W/"v6", W/"v7"', etag)
+    assert http_cache.etag_matches("*", etag)
+    assert not http_cache.etag_matches('W/"v6"', etag)
+    assert not http_cache.etag_matches(None, etag)
+
+def test_catalogue_version_gives_304_until_the_catalogue_changes(client, fake_redis, catalogue):
+    first = client.get("/products/")
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "no-cache"
+
+    repeat = client.get("/products/", headers={"If-None-Match": etag})
+    assert repeat.status_code == 304
+    assert repeat.content == b""
+    assert client.get(f"/products/{catalogue[0]['id']}", headers={"If-None-Match": etag}).status_code == 304
+
+    client.put(f"/products/{catalogue[0]['id']}", json={"stock": 3})
+    changed = client.get("/products/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()[0]["stock"] == 3
+
+def test_orders_bump_the_catalogue_version(client, fake_redis, catalogue):
+    etag = client.get("/products/").headers["etag"]
+    client.post("/orders/", json={"items": [{"product_id": catalogue[1]["id"], "quantity": 1}]})
+    assert client.get("/products/", headers={"If-None-Match": etag}).status_code == 200
+
+def test_body_hash_etag_without_redis(client, catalogue):
+    product_url = f"/products/{catalogue[0]['id']}"
+    etag = client.get(product_url).headers["etag"]
+    assert client.get(product_url, headers={"If-None-Match": etag}).status_code == 304
+    client.put(product_url, json={"name": "Renamed"})
+    assert client.get(product_url, headers={"If-None-Match": etag}).status_code == 200
+
+def test_large_responses_are_compressed(client, catalogue):
+    plain = client.get("/products/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["vary"] == "Accept-Encoding"
+
+    gzipped = client.get("/products/", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert gzipped.json() == plain.json()
+    assert int(gzipped.headers["content-length"]) < len(plain.content)
+
+def test_brotli_preferred_when_available(client, catalogue):
+    pytest.importorskip("brotli")
+    response = client.get("/products/", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["content-encoding"] == "br"
+    assert len(response.json()) == len(catalogue)
+
+def test_small_responses_are_not_compressed(client):
+    response = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
@@ -0,0 +1,66 @@
+import time
+from app.core.metrics import Counter, Histogram, MetricsRegistry
+
+def _sample(text, line_prefix):
+    for line in text.splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+def test_histogram_and_counter_render_prometheus_text():
+    local = MetricsRegistry()
+    latency = local.histogram("op_seconds", "Op latency", ("op",), buckets=(0.1, 1.0))
+    calls = local.counter("op_calls", "Op calls", ("op",))
+
+    latency.labels("read").observe(0.05)
+    latency.labels("read").observe(0.5)
+    latency.labels("read").observe(5)
+    calls.labels("read").inc()
+
+    text = local.render()
+    assert "# TYPE op_seconds histogram" in text
+    assert 'op_seconds_bucket{op="read",le="0.1"} 1' in text
+    assert 'op_seconds_bucket{op="read",le="1.0"} 2' in text
+    assert 'op_seconds_bucket{op="read",le="+Inf"} 3' in text
+    assert 'op_seconds_count{op="read"} 3' in text
+    assert 'op_calls_total{op="read"} 1.0' in text
+
+def test_metrics_endpoint_reports_requests_and_lock_waits(client, sample_product_data):
+    product_id = client.post("/products/", json=sample_product_data).json()["id"]
+    client.get("/products/")
+    client.post("/orders/", json={"items": [{"product_id": product_id, "quantity": 1}]})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert _sample(text, 'http_request_duration_seconds_count{method="GET",route="/products/",status="200"}') >= 1
+    assert _sample(text, 'crud_db_duration_seconds_count{operation="product.get_multi"}') >= 1
+    assert _sample(text, 'db_lock_wait_seconds_count{table="products"}') >= 1
+
+def test_instrumentation_overhead_is_under_two_percent(client, sample_product_data):
+    for _ in range(20):
+        client.post("/products/", json=sample_product_data)
+
+    requests = 50
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get("/products/")
+    per_request = (time.perf_counter() - start) / requests
+
+    # What one product list request records: the middleware histogram,
+    # three timed sections and a cache counter
+    http = Histogram("bench_http", "", ("method", "route", "status"))
+    section = Histogram("bench_section", "")
+    counter = Counter("bench_counter", "")
+    rounds = 2000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        http.labels("GET", "/products/", 200).observe(0.001)
+        for _ in range(3):
+            with section.time():
+                pass
+        counter.inc()
+    per_request_overhead = (time.perf_counter() - start) / rounds
+
+    assert per_request_overhead < 0.02 * per_request
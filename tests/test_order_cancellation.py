@@ -0,0 +1,90 @@
+import pytest
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app import crud, events, models
+from app.core.config import get_settings
+from app.database import SessionLocal
+
+@pytest.fixture
+def products(create_product):
+    return [
+        create_product(name=name, price=3, stock=10)
+        for name in ("Widget", "Gadget", "Gizmo")
+    ]
+
+def _stock(client, product):
+    return client.get(f"/products/{product['id']}").json()["stock"]
+
+def test_cancel_restocks_every_item_once(client, place_order, db_session, products):
+    widget, gadget, gizmo = products
+    order = place_order((gadget, 2), (widget, 3), (gadget, 1))
+    assert order["status"] == "placed"
+
+    for _ in range(2):
+        response = client.post(f"/orders/{order['id']}/cancel", json={"reason": "customer request"})
+        assert response.status_code == 200
+        assert response.json()["status"] == "cancelled"
+    assert [_stock(client, p) for p in products] == [10, 10, 10]
+
+    [change] = db_session.query(models.OrderStatusChange).all()
+    assert (change.order_id, change.from_status, change.to_status, change.reason) == (
+        order["id"], "placed", "cancelled", "customer request"
+    )
+    assert client.get(f"/orders/{order['id']}").json()["status"] == "cancelled"
+
+def test_unknown_order(client):
+    assert client.post("/orders/12345/cancel").status_code == 404
+
+def test_only_the_cancelled_products_are_invalidated(client, place_order, fake_redis, products):
+    widget, gadget, gizmo = products
+    order = place_order((widget, 1))
+    for product in products:
+        client.get(f"/products/{product['id']}")
+
+    client.post(f"/orders/{order['id']}/cancel")
+    assert sorted(fake_redis.keys("product_v1:*")) == sorted(f"product_v1:{p['id']}" for p in (gadget, gizmo))
+    assert _stock(client, widget) == 10
+
+def test_cancellation_event(client, place_order, db_session, monkeypatch, products):
+    monkeypatch.setattr(get_settings(), "order_events_enabled", True)
+    order = place_order((products[0], 2))
+    client.post(f"/orders/{order['id']}/cancel")
+    db_session.expire_all()
+    cancelled = db_session.query(models.OutboxEvent).filter(
+        models.OutboxEvent.event_type == events.ORDER_CANCELLED
+    ).one()
+    assert f'"items":[[{products[0]["id"]},2]]' in cancelled.payload
+
+def test_concurrent_cancels_restock_once(client, place_order, products):
+    widget = products[0]
+    order = place_order((widget, 4))
+    barrier = threading.Barrier(4)
+
+    def cancel(_):
+        db = SessionLocal()
+        try:
+            barrier.wait(timeout=1)
+            return crud.order_crud.cancel(db, order["id"]).status
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert set(executor.map(cancel, range(4))) == {"cancelled"}
+    assert _stock(client, widget) == 10
+
+def test_checkout_locks_products_in_id_order_like_cancel(client, place_order, monkeypatch, products):
+    widget, gadget, gizmo = products
+    locked = []
+    get_for_update = crud.product_crud.get_for_update
+    def recording_get_for_update(db, product_id):
+        locked.append(product_id)
+        return get_for_update(db, product_id)
+    monkeypatch.setattr(crud.product_crud, "get_for_update", recording_get_for_update)
+
+    # Listed in reverse id order, with a duplicate line
+    order = place_order((gizmo, 1), (gadget, 2), (widget, 3), (gizmo, 2))
+    assert locked == [widget["id"], gadget["id"], gizmo["id"]]
+    assert [(item["product_id"], item["quantity"]) for item in order["items"]] == [
+        (widget["id"], 3), (gadget["id"], 2), (gizmo["id"], 3)
+    ]
+    assert [_stock(client, p) for p in products] == [7, 8, 7]
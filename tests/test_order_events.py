@@ -0,0 +1,122 @@
+import pytest
+import redis
+import threading
+from app import events, models
+from app.background import OutboxRelay
+from app.core.circuit_breaker import GuardedRedis
+from app.core.config import get_settings
+
+@pytest.fixture
+def order_events(monkeypatch):
+    monkeypatch.setattr(get_settings(), "order_events_enabled", True)
+
+@pytest.fixture
+def relay(fake_redis):
+    return OutboxRelay(interval=0, batch_size=2, redis_factory=lambda: fake_redis)
+
+@pytest.fixture
+def product(client):
+    return client.post("/products/", json={"name": "Widget", "price": 2.5, "stock": 100}).json()
+
+def _place_orders(client, product, count):
+    return [
+        client.post("/orders/", json={"items": [{"product_id": product["id"], "quantity": n + 1}]}).json()
+        for n in range(count)
+    ]
+
+def _outbox_size(db_session):
+    db_session.expire_all()
+    return db_session.query(models.OutboxEvent).count()
+
+def test_orders_are_published_through_the_outbox(client, db_session, fake_redis, order_events, relay, product):
+    orders = _place_orders(client, product, 3)
+    assert _outbox_size(db_session) == 3
+    assert fake_redis.xlen(events.ORDER_STREAM) == 0
+
+    assert relay.run_once() == 3
+    assert _outbox_size(db_session) == 0
+
+    published = list(events.replay(fake_redis))
+    assert [event.data["order_id"] for event in published] == [order["id"] for order in orders]
+    assert published[1].type == events.ORDER_CREATED
+    assert published[1].data["items"] == [[product["id"], 2, 250]]
+    assert published[1].data["total_amount_minor"] == 500
+
+def test_events_wait_in_the_outbox_while_redis_is_down(
+    monkeypatch, client, db_session, fake_redis, order_events, relay, product
+):
+    _place_orders(client, product, 2)
+    monkeypatch.setattr(fake_redis, "pipeline", lambda **kwargs: (_ for _ in ()).throw(ConnectionError("down")))
+    with pytest.raises(ConnectionError):
+        relay.run_once()
+    assert _outbox_size(db_session) == 2
+
+    monkeypatch.undo()
+    assert relay.run_once() == 2
+
+def test_no_events_unless_enabled(client, db_session, product):
+    _place_orders(client, product, 1)
+    assert _outbox_size(db_session) == 0
+
+def test_consumer_group_reads_batches_and_acks_them(client, fake_redis, order_events, relay, product):
+    _place_orders(client, product, 5)
+    relay.run_once()
+    consumer = events.StreamConsumer(fake_redis, "fulfilment", "worker-1", batch_size=3, block_ms=0)
+    consumer.ensure_group()
+
+    first = consumer.read()
+    assert len(first) == 3
+    assert consumer.ack(first) == 3
+    assert len(consumer.read()) == 2
+    assert fake_redis.xpending(events.ORDER_STREAM, "fulfilment")["pending"] == 2
+
+def test_unacked_events_are_redelivered_after_a_restart(client, fake_redis, order_events, relay, product):
+    _place_orders(client, product, 2)
+    relay.run_once()
+    crashed = events.StreamConsumer(fake_redis, "analytics", "worker-1", block_ms=0)
+    crashed.ensure_group()
+    delivered = crashed.read()
+
+    restarted = events.StreamConsumer(fake_redis, "analytics", "worker-1", block_ms=0)
+    assert [e.event_id for e in restarted.read()] == [e.event_id for e in delivered]
+
+def test_run_acks_after_the_handler(client, fake_redis, order_events, relay, product):
+    _place_orders(client, product, 4)
+    relay.run_once()
+    stop = threading.Event()
+    seen = []
+
+    def handler(batch):
+        seen.extend(batch)
+        if len(seen) == 4:
+            stop.set()
+
+    events.StreamConsumer(fake_redis, "warmer", "w1", batch_size=2, block_ms=0).run(handler, stop)
+    assert len(seen) == 4
+    assert fake_redis.xpending(events.ORDER_STREAM, "warmer")["pending"] == 0
+
+def test_replay_from_an_offset(client, fake_redis, order_events, relay, product):
+    _place_orders(client, product, 5)
+    relay.run_once()
+    everything = list(events.replay(fake_redis, batch_size=2))
+    assert len(everything) == 5
+
+    tail = list(events.replay(fake_redis, start=everything[3].entry_id, batch_size=2))
+    assert tail == everything[3:]
+
+    consumer = events.StreamConsumer(fake_redis, "search", "s1", block_ms=0)
+    consumer.ensure_group(start="$")
+    assert consumer.read() == []
+    consumer.seek(everything[2].entry_id)
+    assert [e.entry_id for e in consumer.read()] == [e.entry_id for e in everything[3:]]
+
+def test_consumers_read_on_their_own_client(fake_redis):
+    consumer = events.StreamConsumer.from_url("search", "s1", url="redis://localhost:6379/0", block_ms=5000)
+    assert not isinstance(consumer.redis, GuardedRedis)
+    assert consumer.redis.get_connection_kwargs()["socket_timeout"] > 5
+
+    # A blocked read on the cache client would time out and trip its breaker
+    with pytest.raises(ValueError, match="guarded"):
+        events.StreamConsumer(GuardedRedis(fake_redis), "search", "s1")
+    with pytest.raises(ValueError, match="socket_timeout"):
+        events.StreamConsumer(redis.Redis(socket_timeout=0.25), "search", "s1", block_ms=1000)
@@ -0,0 +1,59 @@
+import pytest
+from sqlalchemy import text
+from app import crud, models
+from app.database import SessionLocal
+from app.stock_combiner import StockWriteCombiner
+
+@pytest.fixture
+def products(create_product):
+    return [
+        create_product(name=name, price=price, stock=100)
+        for name, price in (("Widget", 2.5), ("Gadget", 4))
+    ]
+
+def test_pages_through_a_products_orders_newest_first(client, place_order, products):
+    widget, gadget = products
+    order_ids = [place_order((widget, 1))["id"] for _ in range(5)]
+    place_order((gadget, 1))
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get(f"/products/{widget['id']}/orders", params=params).json()
+        seen.extend(order["order_id"] for order in page["orders"])
+        cursor = page["next_cursor"]
+        assert page["has_more"] == (cursor is not None)
+        if cursor is None:
+            break
+    assert seen == order_ids[::-1]
+
+def test_one_row_per_order_with_the_products_line(client, place_order, products):
+    widget, gadget = products
+    order = place_order((widget, 2), (gadget, 1), (widget, 3))
+
+    [line] = client.get(f"/products/{widget['id']}/orders").json()["orders"]
+    assert line["order_id"] == order["id"]
+    assert (line["quantity"], line["price"], line["price_minor"]) == (5, 2.5, 250)
+    assert client.get(f"/products/{gadget['id']}/orders").json()["orders"][0]["quantity"] == 1
+
+def test_combined_orders_are_indexed_too(client, place_order, monkeypatch, products):
+    monkeypatch.setattr(crud.order_crud, "combiner", StockWriteCombiner(SessionLocal, window_ms=1))
+    order = place_order((products[0], 4))
+    [line] = client.get(f"/products/{products[0]['id']}/orders").json()["orders"]
+    assert (line["order_id"], line["quantity"]) == (order["id"], 4)
+
+def test_unknown_product_and_bad_cursor(client, products):
+    assert client.get("/products/999/orders").status_code == 404
+    assert client.get(f"/products/{products[0]['id']}/orders", params={"cursor": "junk"}).status_code == 400
+    assert client.get(f"/products/{products[0]['id']}/orders").json() == {
+        "orders": [], "next_cursor": None, "has_more": False
+    }
+
+def test_lookup_is_an_index_range_scan(db_session):
+    plan = " ".join(row[-1] for row in db_session.execute(text(
+        "EXPLAIN QUERY PLAN SELECT order_id FROM product_orders WHERE product_id = 1 "
+        "AND (created_at, order_id) < ('2030-01-01', 5) ORDER BY created_at DESC, order_id DESC LIMIT 51"
+    )))
+    assert "ix_product_orders_product_created" in plan
+    assert "TEMP B-TREE" not in plan  # no sort step: rows come off the index in order
+    assert models.ProductOrder.__table__.c.order_id.foreign_keys == set()
@@ -0,0 +1,66 @@
+import pytest
+
+NAMES = ["Blue Widget", "Red Widget", "Green Gadget", "Widget_Pro 100%", "Gizmo", "blue gizmo"]
+
+@pytest.fixture
+def catalogue(client):
+    products = [
+        client.post("/products/", json={"name": name, "price": 10 + i, "stock": i}).json()
+        for i, name in enumerate(NAMES)
+    ]
+    return {p["name"]: p for p in products}
+
+def _names(client, **params):
+    response = client.get("/products/", params=params)
+    assert response.status_code == 200, response.text
+    return [p["name"] for p in response.json()]
+
+def test_substring_search_is_case_insensitive(client, catalogue):
+    assert _names(client, q="widget") == ["Blue Widget", "Red Widget", "Widget_Pro 100%"]
+    # Below one trigram the search falls back to LIKE
+    assert _names(client, q="iz") == ["Gizmo", "blue gizmo"]
+
+def test_like_wildcards_are_literal(client, catalogue):
+    assert _names(client, q="_pro") == ["Widget_Pro 100%"]
+    assert _names(client, q="0%") == ["Widget_Pro 100%"]
+    assert _names(client, q="%") == ["Widget_Pro 100%"]
+
+def test_prefix_search(client, catalogue):
+    assert _names(client, name_prefix="blue") == ["Blue Widget", "blue gizmo"]
+    assert _names(client, name_prefix="gizmo") == ["Gizmo"]
+
+def test_search_follows_renames(client, catalogue):
+    client.put(f"/products/{catalogue['Gizmo']['id']}", json={"name": "Sprocket"})
+    assert _names(client, q="sprocket") == ["Sprocket"]
+    assert _names(client, q="gizmo") == ["blue gizmo"]
+
+def test_price_and_stock_filters(client, catalogue):
+    assert _names(client, min_price=11, max_price=12.5) == ["Red Widget", "Green Gadget"]
+    # The first product was created with no stock
+    assert "Blue Widget" not in _names(client, in_stock=True)
+    assert _names(client, in_stock=False) == ["Blue Widget"]
+
+def test_sorting(client, catalogue):
+    assert _names(client, sort="-price")[0] == "blue gizmo"
+    assert _names(client, sort="name", q="widget") == ["Blue Widget", "Red Widget", "Widget_Pro 100%"]
+    assert client.get("/products/", params={"sort": "stock"}).status_code == 422
+
+@pytest.mark.parametrize("sort", ["id", "price", "-price", "name", "-name"])
+def test_keyset_pagination_visits_every_match_once(client, catalogue, sort):
+    expected = _names(client, sort=sort, in_stock=True)
+    seen, cursor = [], None
+    while True:
+        params = {"sort": sort, "in_stock": True, "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/products/", params=params)
+        seen.extend(p["name"] for p in response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    assert seen == expected
+
+def test_search_respects_sparse_fields(client, catalogue):
+    [product] = client.get("/products/", params={"q": "gadget", "fields": "id,name"}).json()
+    assert product == {"name": "Green Gadget", "id": catalogue["Green Gadget"]["id"]}
+
+def test_invalid_cursor_is_rejected(client, catalogue):
+    assert client.get("/products/", params={"sort": "price", "cursor": "not-a-cursor"}).status_code == 400
@@ -0,0 +1,81 @@
+import json
+import logging
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from app.core.profiler import QueryProfilerMiddleware, SQLProfiler, fingerprint
+
+@pytest.fixture
+def profiled_app():
+    return _profiled_app(debug=True)
+
+def _profiled_app(debug):
+    engine = create_engine("sqlite://")
+    profiler = SQLProfiler(slow_query_ms=10_000, sample_rate=1.0)
+    profiler.attach(engine)
+
+    app = FastAPI()
+    app.add_middleware(QueryProfilerMiddleware, profiler=profiler, debug=debug)
+
+    @app.get("/three-queries")
+    def three_queries():
+        with engine.connect() as conn:
+            for value in (1, 2, 3):
+                conn.execute(text("SELECT :value"), {"value": value})
+        return {}
+
+    return TestClient(app), profiler, engine
+
+def test_fingerprint_normalizes_literals_and_in_lists():
+    assert fingerprint("SELECT * FROM t WHERE id = 42 AND name = 'bob'") == \
+        "SELECT * FROM t WHERE id = ? AND name = ?"
+    assert fingerprint("SELECT * FROM t WHERE id IN (?, ?, ?)") == \
+        fingerprint("SELECT * FROM t WHERE id IN (?)")
+
+def test_request_profile_headers(profiled_app):
+    client, _, _ = profiled_app
+
+    response = client.get("/three-queries")
+
+    assert response.headers["x-db-query-count"] == "3"
+    assert float(response.headers["x-db-time-ms"]) >= 0
+    assert response.headers["server-timing"].startswith("db;dur=")
+    assert "x-db-query-profile" not in response.headers
+
+def test_forced_profile_includes_breakdown(profiled_app):
+    client, profiler, _ = profiled_app
+    profiler.sample_rate = 0
+
+    response = client.get("/three-queries", headers={"X-Debug-Query-Profile": "1"})
+
+    breakdown = json.loads(response.headers["x-db-query-profile"])
+    assert breakdown[0]["statement"] == "SELECT ?"
+    assert breakdown[0]["count"] == 3
+
+def test_profile_header_is_ignored_outside_debug():
+    client, profiler, _ = _profiled_app(debug=False)
+    profiler.sample_rate = 0
+
+    response = client.get("/three-queries", headers={"X-Debug-Query-Profile": "1"})
+
+    assert "x-db-query-count" not in response.headers
+    assert "x-db-query-profile" not in response.headers
+
+def test_unsampled_requests_carry_no_headers(profiled_app):
+    client, profiler, _ = profiled_app
+    profiler.sample_rate = 0
+
+    response = client.get("/three-queries")
+
+    assert "x-db-query-count" not in response.headers
+
+def test_slow_queries_are_logged_with_parameters(profiled_app, caplog):
+    _, profiler, engine = profiled_app
+    profiler.slow_query_seconds = 0
+
+    with caplog.at_level(logging.WARNING, logger="app.core.profiler"):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT :value"), {"value": 7})
+
+    assert any("Slow query" in r.message and "7" in r.message for r in caplog.records)
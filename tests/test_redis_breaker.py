@@ -0,0 +1,138 @@
+import pytest
+import time
+from redis.exceptions import ResponseError, TimeoutError as RedisTimeoutError
+from app import crud, database
+from app.core.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, GuardedRedis
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class FlakyRedis:
+    """FakeRedis that can be made to hang and time out like an unhealthy server"""
+
+    def __init__(self, delay: float = 0.0):
+        self.server = fakeredis.FakeServer()
+        self.client = fakeredis.FakeRedis(server=self.server, decode_responses=True)
+        self.delay = delay
+        self.down = False
+        self.calls = 0
+
+    def set_down(self, down: bool):
+        self.down = down
+        # Pipelines talk to the server directly
+        self.server.connected = not down
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr) or name == "pipeline":
+            return attr
+
+        def call(*args, **kwargs):
+            self.calls += 1
+            if self.down:
+                time.sleep(self.delay)
+                raise RedisTimeoutError("Timeout reading from socket")
+            return attr(*args, **kwargs)
+        return call
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def flaky(monkeypatch, clock):
+    flaky = FlakyRedis(delay=0.1)
+    breaker = CircuitBreaker("redis-test", failure_threshold=2, reset_timeout=5.0, clock=clock)
+    monkeypatch.setattr(database, "_redis_client", GuardedRedis(flaky, breaker))
+    monkeypatch.setattr(database, "_redis_initialized", True)
+    monkeypatch.setattr(crud.product_crud, "_shared_cache_stale", False)
+    return flaky
+
+@pytest.fixture
+def product(client):
+    return client.post("/products/", json={"name": "Widget", "price": 2, "stock": 10}).json()
+
+def _breaker():
+    return database.get_redis().breaker
+
+def test_open_circuit_skips_redis_and_answers_from_the_database(client, flaky, product):
+    flaky.set_down(True)
+    for _ in range(2):
+        assert client.get("/products/").status_code == 200
+    assert _breaker().state == OPEN
+    calls = flaky.calls
+
+    durations = []
+    for _ in range(5):
+        started = time.perf_counter()
+        response = client.get("/products/")
+        durations.append(time.perf_counter() - started)
+        assert response.status_code == 200
+        assert response.json()[0]["name"] == "Widget"
+    # No request waits for Redis any more: each is well under a single timeout
+    assert max(durations) < flaky.delay
+    assert flaky.calls == calls
+
+    metrics = client.get("/metrics").text
+    assert 'circuit_breaker_state{name="redis-test"} 1' in metrics
+
+def test_one_probe_after_the_reset_timeout(client, clock, flaky, product):
+    flaky.set_down(True)
+    client.get("/products/")
+    client.get("/products/")
+    calls = flaky.calls
+
+    clock.now += 5
+    client.get("/products/")
+    assert flaky.calls == calls + 1  # the probe failed, so the request went on without Redis
+    assert _breaker().state == OPEN
+
+    flaky.set_down(False)
+    clock.now += 5
+    assert client.get("/products/").status_code == 200
+    assert _breaker().state == CLOSED
+    assert flaky.client.keys("products_list_*")
+
+def test_invalidation_lost_during_an_outage_is_replayed(client, flaky, product):
+    assert client.get("/products/").json()[0]["stock"] == 10  # cached now
+
+    flaky.set_down(True)
+    client.put(f"/products/{product['id']}", json={"stock": 3})
+    flaky.set_down(False)
+    # The invalidation never reached Redis, so the cached page is stale;
+    # it is delivered before the cache is read again
+    assert flaky.client.keys("products_list_*")
+    assert client.get("/products/").json()[0]["stock"] == 3
+
+def test_half_open_lets_a_single_probe_through(clock):
+    breaker = CircuitBreaker("probe-test", failure_threshold=1, reset_timeout=1.0, clock=clock)
+    breaker.record_failure()
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # concurrent callers keep failing fast
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+def test_server_errors_do_not_open_the_circuit():
+    breaker = CircuitBreaker("errors-test", failure_threshold=1)
+    guarded = GuardedRedis(fakeredis.FakeRedis(decode_responses=True), breaker)
+    guarded.set("key", "not a number")
+    for _ in range(3):
+        with pytest.raises(ResponseError):
+            guarded.incr("key")
+    assert breaker.state == CLOSED
+
+    guarded.breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        guarded.get("key")
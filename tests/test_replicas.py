@@ -0,0 +1,99 @@
+import pytest
+import time
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import database, models
+from app.database import Base, ReplicaRouter
+from app.dependencies import LastWriteMiddleware
+from app.main import app
+
+def _make_db(path, product_name):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    session.add(models.Product(name=product_name, price=1.0, stock=1))
+    session.commit()
+    session.close()
+    return Session
+
+def _product_name(session):
+    try:
+        return session.query(models.Product).first().name
+    finally:
+        session.close()
+
+@pytest.fixture
+def router(tmp_path):
+    primary = _make_db(tmp_path / "primary.db", "from-primary")
+    _make_db(tmp_path / "replica1.db", "from-replica-1")
+    _make_db(tmp_path / "replica2.db", "from-replica-2")
+    return ReplicaRouter(
+        primary,
+        [f"sqlite:///{tmp_path / 'replica1.db'}", f"sqlite:///{tmp_path / 'replica2.db'}"],
+        sticky_seconds=60,
+    )
+
+def test_reads_are_balanced_across_replicas(router):
+    names = {_product_name(router.read_session()) for _ in range(4)}
+    assert names == {"from-replica-1", "from-replica-2"}
+
+def test_read_your_writes_sticks_to_primary(router):
+    assert _product_name(router.read_session(time.time() - 1)) == "from-primary"
+    # Clients whose last write is older, or who never wrote, use the replicas
+    assert _product_name(router.read_session(time.time() - 120)).startswith("from-replica")
+    assert _product_name(router.read_session(None)).startswith("from-replica")
+
+def test_the_write_marker_travels_with_the_client(tmp_path, monkeypatch):
+    _make_db(tmp_path / "replica.db", "from-replica")  # lags behind the primary
+    router = ReplicaRouter(database.SessionLocal, [f"sqlite:///{tmp_path / 'replica.db'}"], sticky_seconds=60)
+    monkeypatch.setattr(database, "_replica_router", router)
+    writer = TestClient(LastWriteMiddleware(app, max_age=60))
+
+    created = writer.post("/products/", json={"name": "Fresh", "price": 1, "stock": 1})
+    stamp = created.headers["X-Last-Write"]
+    assert created.cookies["last_write"] == stamp
+    # Any worker, or a client sending the header instead of the cookie, reads the primary
+    assert writer.get(f"/products/{created.json()['id']}").json()["name"] == "Fresh"
+    other = TestClient(app)
+    assert other.get(f"/products/{created.json()['id']}", headers={"X-Last-Write": stamp}).json()["name"] == "Fresh"
+    # Clients that did not write, even from the same address, keep using the replica
+    assert other.get(f"/products/{created.json()['id']}").json()["name"] == "from-replica"
+    assert "X-Last-Write" not in writer.get("/products/").headers
+
+def test_unhealthy_replica_falls_back_to_primary(tmp_path):
+    primary = _make_db(tmp_path / "primary.db", "from-primary")
+    router = ReplicaRouter(primary, [f"sqlite:///{tmp_path / 'missing' / 'replica.db'}"])
+
+    assert _product_name(router.read_session()) == "from-primary"
+    assert router.healthy_replicas() == []
+
+def test_no_replicas_uses_primary(tmp_path):
+    primary = _make_db(tmp_path / "primary.db", "from-primary")
+    router = ReplicaRouter(primary, [])
+
+    assert _product_name(router.read_session()) == "from-primary"
+
+def test_replica_reads_leave_shared_caches_alone(tmp_path, monkeypatch, client, fake_redis):
+    # The replica still has a product and an order the primary no longer has
+    replica = _make_db(tmp_path / "replica.db", "from-replica")
+    session = replica()
+    session.add(models.Order(id=1, idempotency_key="lagging", total_amount_minor=100))
+    session.commit()
+    session.close()
+    monkeypatch.setattr(database, "_replica_router", ReplicaRouter(
+        database.SessionLocal, [f"sqlite:///{tmp_path / 'replica.db'}"], sticky_seconds=60
+    ))
+    primary = {"X-Last-Write": str(time.time())}
+
+    page = client.get("/products/")
+    assert [product["name"] for product in page.json()] == ["from-replica"]
+    assert client.get("/products/1").json()["name"] == "from-replica"
+    assert client.get("/orders/1").status_code == 200
+
+    assert client.get("/products/", headers=primary).json() == []
+    assert client.get("/products/1", headers=primary).status_code == 404
+    assert client.get("/orders/1", headers=primary).status_code == 404
+    # Not labelled with the catalogue version the primary's pages carry
+    assert page.headers["etag"] != client.get("/products/", headers=primary).headers["etag"]
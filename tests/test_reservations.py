@@ -0,0 +1,117 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from fastapi import status
+from app import crud, models
+from app.background import ReservationExpirer
+from app.database import SessionLocal
+
+def _hold(client, product_id, quantity, ttl_seconds=300):
+    return client.post("/reservations/", json={
+        "items": [{"product_id": product_id, "quantity": quantity}],
+        "ttl_seconds": ttl_seconds
+    })
+
+def _lapse_all_reservations(db_session):
+    db_session.query(models.Reservation).update(
+        {models.Reservation.expires_at: datetime.now(timezone.utc) - timedelta(seconds=1)}
+    )
+    db_session.commit()
+
+def test_hold_reduces_available_but_not_stock(client, create_product):
+    product_id = create_product(stock=10)["id"]
+
+    response = _hold(client, product_id, 7)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json()["status"] == "active"
+
+    product = client.get(f"/products/{product_id}").json()
+    assert product["stock"] == 10
+    assert product["available"] == 3
+
+    # Direct checkout can only take what is not held
+    order_response = client.post("/orders/", json={"items": [{"product_id": product_id, "quantity": 4}]})
+    assert order_response.status_code == status.HTTP_409_CONFLICT
+    assert _hold(client, product_id, 4).status_code == status.HTTP_409_CONFLICT
+
+def test_confirm_turns_hold_into_order(client, create_product):
+    product_id = create_product(price=20.0, stock=10)["id"]
+    reservation_id = _hold(client, product_id, 3).json()["id"]
+
+    response = client.post(f"/reservations/{reservation_id}/confirm")
+    assert response.status_code == status.HTTP_201_CREATED
+    order = response.json()
+    assert order["total_amount"] == 60.0
+
+    product = client.get(f"/products/{product_id}").json()
+    assert product["stock"] == 7
+    assert product["reserved"] == 0
+
+    # Confirming again is idempotent
+    again = client.post(f"/reservations/{reservation_id}/confirm")
+    assert again.json()["id"] == order["id"]
+    assert client.get(f"/products/{product_id}").json()["stock"] == 7
+
+def test_release_returns_stock_and_blocks_confirm(client, create_product):
+    product_id = create_product(stock=5)["id"]
+    reservation_id = _hold(client, product_id, 5).json()["id"]
+
+    response = client.delete(f"/reservations/{reservation_id}")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["status"] == "released"
+    assert client.delete(f"/reservations/{reservation_id}").json()["status"] == "released"
+
+    assert client.get(f"/products/{product_id}").json()["available"] == 5
+    assert client.post(f"/reservations/{reservation_id}/confirm").status_code == status.HTTP_409_CONFLICT
+
+def test_reservation_not_found(client):
+    assert client.get("/reservations/999").status_code == status.HTTP_404_NOT_FOUND
+    assert client.post("/reservations/999/confirm").status_code == status.HTTP_404_NOT_FOUND
+    assert client.delete("/reservations/999").status_code == status.HTTP_404_NOT_FOUND
+
+def test_lapsed_hold_cannot_be_confirmed(client, create_product, db_session):
+    product_id = create_product(stock=5)["id"]
+    reservation_id = _hold(client, product_id, 2).json()["id"]
+    _lapse_all_reservations(db_session)
+
+    response = client.post(f"/reservations/{reservation_id}/confirm")
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+def test_expirer_reclaims_stale_holds_in_batches(client, create_product, db_session):
+    product_id = create_product(stock=10)["id"]
+    for _ in range(5):
+        _hold(client, product_id, 1)
+    _lapse_all_reservations(db_session)
+
+    expirer = ReservationExpirer(interval=0, batch_size=2, session_factory=lambda: db_session)
+    assert expirer.run_once() == 5
+    assert expirer.run_once() == 0
+
+    product = client.get(f"/products/{product_id}").json()
+    assert product["reserved"] == 0
+    assert product["available"] == 10
+    statuses = {r.status for r in db_session.query(models.Reservation)}
+    assert statuses == {"expired"}
+
+def test_expirer_waits_for_a_concurrent_release(client, create_product, db_session):
+    """A lapsed hold released while the expirer runs is returned once, SQLite included"""
+    product_id = create_product(stock=10)["id"]
+    reservation_id = _hold(client, product_id, 2).json()["id"]
+    _lapse_all_reservations(db_session)
+
+    releasing, expiring = SessionLocal(), SessionLocal()
+    try:
+        reservation = crud.reservation_crud.get_for_update(releasing, reservation_id)
+        expired = []
+        expirer = threading.Thread(target=lambda: expired.append(crud.reservation_crud.expire_stale(expiring)))
+        expirer.start()
+        time.sleep(0.2)
+        crud.reservation_crud._return_held_stock(releasing, [(product_id, 2)])
+        reservation.status = "released"
+        releasing.commit()
+        expirer.join(timeout=5)
+        assert expired == [0]
+    finally:
+        releasing.close()
+        expiring.close()
+    assert client.get(f"/products/{product_id}").json()["reserved"] == 0
@@ -0,0 +1,59 @@
+import orjson
+import pytest
+from app import crud, models, schemas, serializers
+from app.core.serialization import compile_extractor, dumps
+
+def _pydantic_json(schema, obj):
+    return orjson.loads(schema.model_validate(obj).model_dump_json())
+
+@pytest.fixture
+def orders(client, db_session):
+    products = [
+        client.post("/products/", json={"name": f"P{i}", "price": 1.1 + i, "stock": 50}).json()
+        for i in range(3)
+    ]
+    for i in range(5):
+        client.post("/orders/", json={"items": [
+            {"product_id": products[i % 3]["id"], "quantity": 1},
+            {"product_id": products[(i + 1) % 3]["id"], "quantity": 2},
+        ]})
+    return db_session.query(models.Order).all()
+
+def test_compile_extractor_reads_attributes_and_callables():
+    class Thing:
+        a = 1
+        b = 2
+    extract = compile_extractor({"a": "a", "sum": lambda t: t.a + t.b})
+    assert extract(Thing()) == {"a": 1, "sum": 3}
+    with pytest.raises(ValueError):
+        compile_extractor({"x": "not an identifier"})
+
+def test_fast_path_matches_pydantic_output(orders, db_session):
+    for order in orders:
+        assert orjson.loads(dumps(serializers.order_dict(order))) == _pydantic_json(schemas.Order, order)
+    for product in db_session.query(models.Product).all():
+        assert orjson.loads(dumps(serializers.product_dict(product))) == _pydantic_json(schemas.Product, product)
+
+def test_projected_pages_match_orm_pages(orders, db_session):
+    page, next_cursor, has_more = crud.order_crud.get_multi_paginated_rows(db_session, limit=3)
+    orm_page, orm_cursor, orm_has_more = crud.order_crud.get_multi_paginated(db_session, limit=3)
+    assert (next_cursor, has_more) == (orm_cursor, orm_has_more)
+    assert orjson.loads(dumps([serializers.order_dict(o, items) for o, items in page])) == [
+        _pydantic_json(schemas.Order, order) for order in orm_page
+    ]
+
+def test_order_list_endpoint_pages_through_everything(client, orders):
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        body = client.get("/orders/", params=params).json()
+        seen.extend(order["id"] for order in body["orders"])
+        if not body["has_more"]:
+            break
+        cursor = body["next_cursor"]
+    assert sorted(seen) == sorted(order.id for order in orders)
+
+def test_product_list_endpoint_matches_schema(client, orders, db_session):
+    body = client.get("/products/").json()
+    expected = [_pydantic_json(schemas.Product, p) for p in db_session.query(models.Product).order_by(models.Product.id)]
+    assert body == expected
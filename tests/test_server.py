@@ -0,0 +1,48 @@
+from pathlib import Path
+import pytest
+import runpy
+from app.database import pool_limits
+
+def test_pool_limits_split_the_connection_budget_between_workers():
+    pool_size, max_overflow = pool_limits(80, 16)
+    assert (pool_size, max_overflow) == (4, 1)
+    assert 16 * (pool_size + max_overflow) <= 80
+
+    assert pool_limits(100, 1) == (75, 25)
+    # Every worker keeps a usable pool even when the budget is tiny
+    assert sum(pool_limits(3, 8)) == 2
+
+def test_gunicorn_profile_uses_tuned_uvicorn_workers(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    config = runpy.run_path(str(Path(__file__).resolve().parent.parent / "gunicorn.conf.py"))
+    assert config["workers"] == 3
+    assert config["worker_class"] == "app.server.ProductionUvicornWorker"
+    assert config["graceful_timeout"] < config["timeout"]
+
+    from app.server import ProductionUvicornWorker
+    assert ProductionUvicornWorker.CONFIG_KWARGS["loop"] == "uvloop"
+    assert ProductionUvicornWorker.CONFIG_KWARGS["http"] == "httptools"
+
+class _Worker:
+    pass
+
+def test_gunicorn_workers_get_distinct_snowflake_worker_ids(monkeypatch):
+    monkeypatch.setenv("SNOWFLAKE_WORKER_OFFSET", "16")
+    config = runpy.run_path(str(Path(__file__).resolve().parent.parent / "gunicorn.conf.py"))
+    server = type("Arbiter", (), {"WORKERS": {}})()
+
+    def spawn(pid):
+        worker = _Worker()
+        config["pre_fork"](server, worker)
+        config["post_fork"](server, worker)
+        server.WORKERS[pid] = worker
+        return int(__import__("os").environ["SNOWFLAKE_WORKER_ID"])
+
+    assert [spawn(pid) for pid in (101, 102, 103)] == [16, 17, 18]
+    # A replacement takes the slot of the worker that exited, not a new one
+    del server.WORKERS[102]
+    assert spawn(104) == 17
+
+    monkeypatch.setenv("SNOWFLAKE_WORKER_OFFSET", "63")
+    with pytest.raises(RuntimeError, match="out of range"):
+        spawn(105)
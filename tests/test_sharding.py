@@ -0,0 +1,132 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateTable
+from app import crud, models, schemas
+from app.database import Base
+from app.sharding import ShardedOrderCRUD, SnowflakeIdGenerator, shard_metadata
+
+@pytest.fixture
+def central_session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'central.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+@pytest.fixture
+def sharded_crud(tmp_path):
+    urls = [f"sqlite:///{tmp_path / f'shard{i}.db'}" for i in range(3)]
+    for url in urls:
+        shard_metadata().create_all(bind=create_engine(url))
+    return ShardedOrderCRUD(urls, worker_id=1)
+
+def _order(product_id, quantity=1):
+    return schemas.OrderCreate(items=[schemas.OrderItemCreate(product_id=product_id, quantity=quantity)])
+
+def test_snowflake_ids_are_unique_ordered_and_carry_shard():
+    generator = SnowflakeIdGenerator(worker_id=5)
+    ids = [generator.next_id(shard_id=i % 3) for i in range(5000)]
+
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+    assert [SnowflakeIdGenerator.shard_of(i) for i in ids[:6]] == [0, 1, 2, 0, 1, 2]
+
+def test_orders_are_spread_over_shards(central_session, sharded_crud):
+    product = crud.product_crud.create(central_session, schemas.ProductCreate(name="Sharded", price=5.0, stock=100))
+
+    orders = [sharded_crud.create_with_items(central_session, _order(product.id), f"key-{i}") for i in range(12)]
+
+    assert {SnowflakeIdGenerator.shard_of(o.id) for o in orders} == {0, 1, 2}
+    for order in orders:
+        fetched = sharded_crud.get(central_session, order.id)
+        assert fetched.idempotency_key == order.idempotency_key
+        assert len(fetched.items) == 1
+    central_session.expire_all()
+    assert crud.product_crud.get(central_session, product.id).stock == 88
+
+def test_sharded_create_is_idempotent(central_session, sharded_crud):
+    product = crud.product_crud.create(central_session, schemas.ProductCreate(name="Sharded", price=5.0, stock=10))
+
+    first = sharded_crud.create_with_items(central_session, _order(product.id, 2), "same-key")
+    second = sharded_crud.create_with_items(central_session, _order(product.id, 2), "same-key")
+
+    assert first.id == second.id
+    central_session.expire_all()
+    assert crud.product_crud.get(central_session, product.id).stock == 8
+
+def test_sharded_insufficient_stock_leaves_no_order(central_session, sharded_crud):
+    product = crud.product_crud.create(central_session, schemas.ProductCreate(name="Sharded", price=5.0, stock=1))
+
+    with pytest.raises(ValueError, match="Insufficient stock"):
+        sharded_crud.create_with_items(central_session, _order(product.id, 2), "too-many")
+
+    assert sharded_crud.get_by_idempotency_key(central_session, "too-many") is None
+
+def test_scatter_gather_pagination_merges_all_shards(central_session, sharded_crud):
+    product = crud.product_crud.create(central_session, schemas.ProductCreate(name="Sharded", price=5.0, stock=100))
+    created = [sharded_crud.create_with_items(central_session, _order(product.id), f"page-{i}").id for i in range(10)]
+
+    seen = []
+    cursor = None
+    while True:
+        orders, cursor, has_more = sharded_crud.get_multi_paginated(central_session, limit=4, cursor=cursor)
+        seen.extend(o.id for o in orders)
+        if not has_more:
+            break
+
+    assert seen == sorted(created, reverse=True)
+
+def test_pagination_survives_shard_clocks_that_disagree_with_ids(central_session, sharded_crud):
+    product = crud.product_crud.create(central_session, schemas.ProductCreate(name="Sharded", price=5.0, stock=100))
+    smaller_id, larger_id = sorted(
+        sharded_crud.create_with_items(central_session, _order(product.id), key).id for key in ("skew-a", "skew-b")
+    )
+    # The smaller id was stamped later by its shard's clock
+    for order_id, created_at in ((smaller_id, datetime(2024, 1, 1, 10, 0, 5)), (larger_id, datetime(2024, 1, 1, 10, 0, 3))):
+        for shard_factory in sharded_crud.shard_sessions:
+            with shard_factory() as shard:
+                shard.query(models.Order).filter(models.Order.id == order_id).update({"created_at": created_at})
+                shard.commit()
+
+    seen, cursor, has_more = [], None, True
+    while has_more:
+        orders, cursor, has_more = sharded_crud.get_multi_paginated(central_session, limit=1, cursor=cursor)
+        seen.extend(o.id for o in orders)
+    assert seen == [larger_id, smaller_id]
+
+def test_sharded_cancel_restocks_the_central_database(central_session, sharded_crud):
+    product = crud.product_crud.create(central_session, schemas.ProductCreate(name="Sharded", price=5.0, stock=10))
+    order = sharded_crud.create_with_items(central_session, _order(product.id, 3), "cancel-me")
+
+    for _ in range(2):
+        assert sharded_crud.cancel(central_session, order.id, reason="duplicate").status == "cancelled"
+    central_session.expire_all()
+    assert crud.product_crud.get(central_session, product.id).stock == 10
+    with pytest.raises(ValueError, match="not found"):
+        sharded_crud.cancel(central_session, order.id + 1)
+
+def test_shard_schema_has_no_foreign_keys_to_central_tables(sharded_crud):
+    shard = inspect(create_engine(sharded_crud.shard_urls[0]))
+    assert set(shard.get_table_names()) == {"orders", "order_items", "order_status_changes"}
+    assert [fk["referred_table"] for fk in shard.get_foreign_keys("order_items")] == ["orders"]
+
+    ddl = str(CreateTable(shard_metadata().tables["order_items"]).compile(dialect=postgresql.dialect()))
+    assert "REFERENCES orders" in ddl and "products" not in ddl
+
+def test_an_id_minted_twice_is_retried_with_a_fresh_one(central_session, sharded_crud, monkeypatch):
+    product = crud.product_crud.create(central_session, schemas.ProductCreate(name="Sharded", price=5.0, stock=10))
+    first = sharded_crud.create_with_items(central_session, _order(product.id), "first")
+
+    # Another process with the same worker id minted the same id for this shard
+    fresh_ids = sharded_crud.ids.next_id
+    minted = iter([first.id])
+    monkeypatch.setattr(sharded_crud.ids, "next_id", lambda shard_id: next(minted, None) or fresh_ids(shard_id))
+    monkeypatch.setattr(sharded_crud, "shard_for_key", lambda key: SnowflakeIdGenerator.shard_of(first.id))
+
+    second = sharded_crud.create_with_items(central_session, _order(product.id, 2), "second")
+    assert second.id != first.id and second.idempotency_key == "second"
+    central_session.expire_all()
+    assert crud.product_crud.get(central_session, product.id).stock == 7
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+_PROBE = (
+    "import app.main, app.database as db\n"
+    "assert db._engine is None, 'engine created at import'\n"
+    "assert not db._redis_initialized, 'redis client created at import'\n"
+    "assert db._replica_router is None, 'replica router created at import'\n"
+)
+
+def test_importing_the_app_opens_no_connections():
+    # A fresh interpreter, since the test session has long since used the engine
+    subprocess.run([sys.executable, "-c", _PROBE], check=True)
+
+def test_sessions_bind_to_the_engine_lazily():
+    from app.database import SessionLocal, get_engine
+    session = SessionLocal()
+    try:
+        assert session.get_bind() is get_engine()
+    finally:
+        session.close()
+
+def test_shard_settings_are_checked_at_startup_not_import(tmp_path):
+    # Invalid sharding settings no longer break the import, only the start
+    env = {**os.environ, "ORDER_SHARD_URLS": f"sqlite:///{tmp_path}/shard.db"}
+    env.pop("SNOWFLAKE_WORKER_ID", None)
+    probe = (
+        "import app.main, app.crud as crud, pytest\n"
+        "assert crud._order_crud is None, 'order store chosen at import'\n"
+        "with pytest.raises(RuntimeError, match='SNOWFLAKE_WORKER_ID'):\n"
+        "    crud.get_order_crud()\n"
+    )
+    subprocess.run([sys.executable, "-c", probe], check=True, env=env)
+
+def test_importing_the_app_needs_no_settings(tmp_path):
+    # No ENV, DATABASE_URL or .env file: any settings read at import fails
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {"PATH": os.environ.get("PATH", ""), "PYTHONPATH": root}
+    probe = "import app.main, app.core.config as config\nassert config.get_settings.cache_info().currsize == 0\n"
+    subprocess.run([sys.executable, "-c", probe], check=True, env=env, cwd=tmp_path)
@@ -0,0 +1,68 @@
+import pytest
+from types import SimpleNamespace
+from app import events, models
+from app.background import OutboxRelay
+from app.core.config import get_settings
+
+@pytest.fixture
+def stock_alerts(monkeypatch):
+    monkeypatch.setattr(get_settings(), "stock_alerts_enabled", True)
+
+@pytest.fixture
+def product(create_product):
+    return create_product(name="Widget", price=2.5, stock=10, reorder_point=3)
+
+def _alerts(db_session):
+    db_session.expire_all()
+    return [
+        event.payload for event in db_session.query(models.OutboxEvent).filter(
+            models.OutboxEvent.stream == events.STOCK_ALERT_STREAM
+        ).order_by(models.OutboxEvent.id)
+    ]
+
+def test_alert_fires_once_when_the_reorder_point_is_crossed(place_order, db_session, stock_alerts, product):
+    assert product["reorder_point"] == 3
+    place_order((product, 5))
+    assert _alerts(db_session) == []
+
+    place_order((product, 2))
+    place_order((product, 1))
+    alerts = _alerts(db_session)
+    assert len(alerts) == 1
+    assert '"available":3' in alerts[0]
+
+def test_restock_rearms_the_alert(client, place_order, db_session, stock_alerts, product):
+    place_order((product, 8))
+    client.put(f"/products/{product['id']}", json={"stock": 20})
+    place_order((product, 18))
+    assert len(_alerts(db_session)) == 2
+
+def test_holds_and_threshold_changes_cross_it_too(client, create_product, db_session, stock_alerts, product):
+    client.post("/reservations/", json={"items": [{"product_id": product["id"], "quantity": 7}]})
+    assert len(_alerts(db_session)) == 1
+
+    other = create_product(name="Gadget", price=1, stock=5)
+    client.put(f"/products/{other['id']}", json={"reorder_point": 5})
+    assert len(_alerts(db_session)) == 2
+
+def test_alerts_are_relayed_to_their_stream(place_order, fake_redis, stock_alerts, product):
+    place_order((product, 9))
+    OutboxRelay(interval=0, redis_factory=lambda: fake_redis).run_once()
+    (alert,) = events.replay(fake_redis, stream=events.STOCK_ALERT_STREAM)
+    assert alert.type == events.LOW_STOCK
+    assert alert.data["product_id"] == product["id"]
+    assert alert.data["available"] == 1
+
+def test_no_alerts_unless_enabled(place_order, db_session, product):
+    place_order((product, 9))
+    assert _alerts(db_session) == []
+
+def test_detection_only_looks_at_the_changed_row(stock_alerts):
+    added = []
+    db = SimpleNamespace(add=added.append)  # any query would fail here
+    product = SimpleNamespace(id=1, stock=4, reserved=0, reorder_point=3, available=4)
+    was_low = events.is_low_stock(product)
+    product.stock = product.available = 3
+    assert events.record_stock_change(db, product, was_low)
+    assert not events.record_stock_change(db, product, events.is_low_stock(product))
+    assert len(added) == 1
@@ -0,0 +1,100 @@
+import asyncio
+import httpx
+import pytest
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import status
+from app import crud, dependencies
+from app.core.admission import CheckoutLane
+from app.database import SessionLocal
+from app.main import app
+from app.stock_combiner import StockWriteCombiner
+
+@pytest.fixture
+def combiner(monkeypatch):
+    commits = []
+    combiner = StockWriteCombiner(SessionLocal, window_ms=20, on_commit=lambda product_ids: commits.append(product_ids))
+    combiner.commits = commits
+    monkeypatch.setattr(crud.order_crud, "combiner", combiner)
+    return combiner
+
+def _place_orders(client, product_id, keys, workers=10):
+    barrier = threading.Barrier(workers)
+
+    def place(key):
+        # Release requests in waves so they arrive within one combining window
+        try:
+            barrier.wait(timeout=1)
+        except threading.BrokenBarrierError:
+            pass
+        response = client.post(
+            "/orders/",
+            json={"items": [{"product_id": product_id, "quantity": 1}]},
+            headers={"Idempotency-Key": key}
+        )
+        return response.status_code, response.json()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(place, keys))
+
+def test_combined_orders_never_oversell(client, create_product, combiner):
+    product_id = create_product(stock=10)["id"]
+
+    results = _place_orders(client, product_id, [f"hot-{i}" for i in range(30)])
+
+    codes = [code for code, _ in results]
+    assert codes.count(status.HTTP_201_CREATED) == 10
+    assert codes.count(status.HTTP_409_CONFLICT) == 20
+    assert client.get(f"/products/{product_id}").json()["stock"] == 0
+
+def test_concurrent_orders_share_one_transaction(client, create_product, combiner):
+    product_id = create_product(stock=100)["id"]
+
+    results = _place_orders(client, product_id, [f"batch-{i}" for i in range(10)])
+
+    assert {code for code, _ in results} == {status.HTTP_201_CREATED}
+    assert len({body["id"] for _, body in results}) == 10
+    assert len(combiner.commits) < 10
+    assert client.get(f"/products/{product_id}").json()["stock"] == 90
+
+def test_waiting_orders_hold_no_lane_slot(client, create_product, combiner, monkeypatch):
+    # Two slots and no queue: only the batch's write may take one
+    lane = CheckoutLane("checkout", concurrency=2, queue_size=0, queue_timeout=1)
+    monkeypatch.setattr(dependencies, "_checkout_lane", lane)
+    product_id = create_product(stock=100)["id"]
+
+    async def place_all():
+        # One event loop for every request, as in a server worker
+        async with httpx.AsyncClient(app=app, base_url="http://test") as http:
+            return await asyncio.gather(*(
+                http.post(
+                    "/orders/",
+                    json={"items": [{"product_id": product_id, "quantity": 1}]},
+                    headers={"Idempotency-Key": f"lane-{i}"},
+                )
+                for i in range(10)
+            ))
+
+    responses = asyncio.run(place_all())
+
+    assert {response.status_code for response in responses} == {status.HTTP_201_CREATED}
+    assert combiner.commits == [[product_id]]
+    assert client.get(f"/products/{product_id}").json()["stock"] == 90
+
+def test_duplicate_keys_in_a_batch_take_stock_once(client, create_product, combiner):
+    product_id = create_product(stock=5)["id"]
+
+    results = _place_orders(client, product_id, ["same-key"] * 10)
+
+    assert {code for code, _ in results} == {status.HTTP_201_CREATED}
+    assert len({body["id"] for _, body in results}) == 1
+    assert client.get(f"/products/{product_id}").json()["stock"] == 4
+
+def test_combined_order_for_missing_product(combiner):
+    with pytest.raises(ValueError, match="not found"):
+        combiner.submit(999, 1, "missing-product")
+
+def test_duplicate_keys_for_a_missing_product(client, combiner):
+    results = _place_orders(client, 999, ["missing-key"] * 2, workers=2)
+
+    assert [code for code, _ in results] == [status.HTTP_404_NOT_FOUND] * 2
@@ -0,0 +1,157 @@
+import pytest
+from app import crud, database
+from app.background import CacheEvictionListener
+from app.core import metrics
+from app.core.cache import LRUCache, TieredCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Broken:
+    """Redis client whose every call fails"""
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            raise ConnectionError("down")
+        return call
+
+
+class WritesLost:
+    """Redis client that still answers reads but loses every write"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def pipeline(self, *args, **kwargs):
+        raise ConnectionError("down")
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+@pytest.fixture
+def order(client):
+    product = client.post("/products/", json={"name": "Widget", "price": 2, "stock": 10}).json()
+    return client.post("/orders/", json={"items": [{"product_id": product["id"], "quantity": 2}]}).json()
+
+def _hits(cache, tier):
+    return metrics.cache_requests.labels(f"{cache}.{tier}", "hit").value
+
+def _reads_nothing(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("read the database")
+    monkeypatch.setattr(crud.order_crud, "get", fail)
+
+def test_orders_are_read_through_redis(client, fake_redis, monkeypatch, order):
+    assert client.get(f"/orders/{order['id']}").json() == order
+    assert fake_redis.exists(f"order_v1:{order['id']}")
+
+    hits = _hits("order_v1", "l2")
+    _reads_nothing(monkeypatch)
+    assert client.get(f"/orders/{order['id']}").json() == order
+    assert _hits("order_v1", "l2") == hits + 1
+    # Placed orders can still change, so no worker keeps them in memory
+    assert len(crud.order_cache().l1) == 0
+
+def test_cancelling_replaces_the_cached_order(client, fake_redis, monkeypatch, order):
+    client.get(f"/orders/{order['id']}")
+    client.post(f"/orders/{order['id']}/cancel")
+
+    fake_redis.flushall()
+    hits = _hits("order_v1", "l1")
+    _reads_nothing(monkeypatch)
+    assert client.get(f"/orders/{order['id']}").json()["status"] == "cancelled"
+    assert _hits("order_v1", "l1") == hits + 1
+
+def test_unknown_orders_are_not_cached(client, fake_redis):
+    assert client.get("/orders/999").status_code == 404
+    assert not fake_redis.keys("order_v1:*")
+
+def test_lru_evicts_by_size_and_age():
+    clock = Clock()
+    lru = LRUCache(max_entries=2, ttl=10, clock=clock)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+    assert (lru.get("a"), lru.get("b"), lru.get("c")) == (1, None, 3)
+
+    clock.now += 10
+    assert lru.get("a") is None and len(lru) == 1
+
+def test_tags_drop_entries_from_both_tiers(fake_redis):
+    cache = TieredCache("tagged", database.get_redis, ttl=60)
+    cache.set(1, {"id": 1}, tags=["product:7"])
+    cache.set(2, {"id": 2}, tags=["product:7", "product:8"])
+    cache.set(3, {"id": 3}, tags=["product:8"])
+    # Another worker's L1 only has what it read from Redis
+    other = TieredCache("tagged", database.get_redis, ttl=60)
+    assert other.get(2) == {"id": 2}
+
+    with metrics.track_round_trips() as round_trips:
+        assert cache.invalidate_tags(["product:7"]) == 2
+    assert round_trips.count == 1
+    assert sorted(fake_redis.keys("tagged:*")) == ["tagged:3", "tagged:tag:product:8"]
+    assert cache.get(1) is None and cache.get(3) == {"id": 3}
+
+    other.invalidate_tags(["product:8"])
+    assert other.get(2) is None and cache.get(3) is not None  # only the caller's L1 is cleared
+
+def test_read_through_fills_never_replace_a_newer_entry(fake_redis):
+    cache = TieredCache("guarded", database.get_redis, ttl=60, local_entries=0)
+    loads = []
+
+    @cache.cached(key=lambda entity_id: entity_id)
+    def load(entity_id):
+        # A concurrent write lands between our read and our fill
+        cache.set(entity_id, "new")
+        loads.append(entity_id)
+        return "old"
+
+    assert load(1) == "old"
+    assert cache.get(1) == "new" and load(1) == "new"
+    assert loads == [1]
+
+def test_redis_errors_are_misses():
+    cache = TieredCache("broken", Broken, ttl=60)
+    cache.set(1, "value")
+    assert cache.get(1) == "value"  # from L1
+    cache.invalidate([1])
+    assert cache.get(1) is None
+    assert cache.invalidate_tags(["x"]) == 0
+
+def test_lost_overwrites_are_read_uncached_until_replayed(fake_redis, monkeypatch):
+    cache = TieredCache("replayed", database.get_redis, ttl=60, local_entries=0)
+    cache.set(1, "placed")
+    monkeypatch.setattr(database, "_redis_client", WritesLost(fake_redis))
+    cache.set(1, "cancelled")
+
+    # Redis still holds the old value, so it is not served
+    assert cache.get(1) is None
+    monkeypatch.setattr(database, "_redis_client", fake_redis)
+    assert cache.get(1) is None
+    assert not fake_redis.exists("replayed:1")
+    cache.set(1, "cancelled", only_new=True)
+    assert cache.get(1) == "cancelled"
+
+def test_invalidations_reach_other_workers_memory(fake_redis):
+    mine = TieredCache("shared", database.get_redis, ttl=60)
+    theirs = TieredCache("shared", database.get_redis, ttl=60)
+    listener = CacheEvictionListener(theirs, interval=0)
+    listener.run_once()
+
+    mine.set(1, "cancelled")
+    assert theirs.get(1) == "cancelled"
+    fake_redis.flushall()
+    assert theirs.get(1) == "cancelled"  # from their L1
+
+    mine.invalidate([1])
+    assert listener.run_once() == 1
+    assert theirs.get(1) is None
+    listener.stop()